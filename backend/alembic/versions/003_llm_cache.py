@@ -0,0 +1,44 @@
+"""LLM response cache
+
+Revision ID: 003
+Revises: 002
+Create Date: 2024-02-15 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '003'
+down_revision: Union[str, None] = '002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'llm_cache',
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('prompt_name', sa.String(), nullable=False),
+        sa.Column('prompt_version', sa.String(), nullable=False),
+        sa.Column('model', sa.String(), nullable=False),
+        sa.Column('output_text', sa.Text(), nullable=False),
+        sa.Column('output_json', postgresql.JSON(astext_type=sa.Text()), nullable=False),
+        sa.Column('token_in', sa.Integer(), nullable=True),
+        sa.Column('token_out', sa.Integer(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('key')
+    )
+
+    op.add_column('prompt_runs', sa.Column('cache_hits', sa.Integer(), nullable=True))
+    op.add_column('prompt_runs', sa.Column('cache_misses', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('prompt_runs', 'cache_misses')
+    op.drop_column('prompt_runs', 'cache_hits')
+    op.drop_table('llm_cache')
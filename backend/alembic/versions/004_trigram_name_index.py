@@ -0,0 +1,58 @@
+"""Trigram indexes on normalized person names and chapter titles
+
+Revision ID: 004
+Revises: 003
+Create Date: 2024-03-01 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.names import normalize_name
+
+# revision identifiers, used by Alembic.
+revision: str = '004'
+down_revision: Union[str, None] = '003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _backfill(table: str, source_column: str, target_column: str) -> None:
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(f"SELECT id, {source_column} FROM {table}")).fetchall()
+    if rows:
+        bind.execute(
+            sa.text(f"UPDATE {table} SET {target_column} = :value WHERE id = :id"),
+            [{"id": row[0], "value": normalize_name(row[1])} for row in rows]
+        )
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # btree_gin allows user_id and the trigram column in one GIN index
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+
+    op.add_column('persons', sa.Column('normalized_name', sa.String(), nullable=True))
+    op.add_column('chapters', sa.Column('normalized_title', sa.String(), nullable=True))
+
+    # Same normalization as the ORM uses (Python, not SQL lower())
+    _backfill('persons', 'display_name', 'normalized_name')
+    _backfill('chapters', 'title', 'normalized_title')
+
+    op.execute(
+        "CREATE INDEX ix_persons_user_id_normalized_name_trgm ON persons "
+        "USING gin (user_id, normalized_name gin_trgm_ops)"
+    )
+    op.execute(
+        "CREATE INDEX ix_chapters_user_id_normalized_title_trgm ON chapters "
+        "USING gin (user_id, normalized_title gin_trgm_ops)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chapters_user_id_normalized_title_trgm', table_name='chapters')
+    op.drop_index('ix_persons_user_id_normalized_name_trgm', table_name='persons')
+    op.drop_column('chapters', 'normalized_title')
+    op.drop_column('persons', 'normalized_name')
@@ -0,0 +1,47 @@
+"""Composite indexes for hot query paths
+
+Revision ID: 005
+Revises: 004
+Create Date: 2024-03-15 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '005'
+down_revision: Union[str, None] = '004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, columns) - keep in sync with __table_args__ in app/models.py
+INDEXES = [
+    ('ix_sessions_user_id', 'sessions', ['user_id']),
+    ('ix_messages_session_id_created_at', 'messages', ['session_id', 'created_at']),
+    ('ix_memories_user_id_created_at', 'memories', ['user_id', 'created_at']),
+    ('ix_memories_session_id_created_at', 'memories', ['session_id', 'created_at']),
+    ('ix_persons_user_id_type', 'persons', ['user_id', 'type']),
+    ('ix_chapters_user_id_order_index', 'chapters', ['user_id', 'order_index']),
+    ('ix_memory_person_person_id', 'memory_person', ['person_id']),
+    ('ix_memory_chapter_chapter_id', 'memory_chapter', ['chapter_id']),
+    ('ix_question_queue_user_id_status_created_at', 'question_queue', ['user_id', 'status', 'created_at']),
+    ('ix_question_queue_session_id_created_at', 'question_queue', ['session_id', 'created_at']),
+    ('ix_prompt_runs_session_id_created_at', 'prompt_runs', ['session_id', 'created_at']),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction and doesn't lock writes
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False,
+                postgresql_concurrently=True, if_not_exists=True
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
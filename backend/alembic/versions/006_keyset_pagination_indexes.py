@@ -0,0 +1,61 @@
+"""Indexes for keyset pagination on (created_at, id)
+
+Revision ID: 006
+Revises: 005
+Create Date: 2024-04-01 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '006'
+down_revision: Union[str, None] = '005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Pagination orders by (created_at, id), so the id tie-breaker goes into the index
+NEW_INDEXES = [
+    ('ix_users_created_at_id', 'users', ['created_at', 'id']),
+    ('ix_sessions_created_at_id', 'sessions', ['created_at', 'id']),
+    ('ix_sessions_user_id_created_at_id', 'sessions', ['user_id', 'created_at', 'id']),
+    ('ix_memories_user_id_created_at_id', 'memories', ['user_id', 'created_at', 'id']),
+    ('ix_memories_session_id_created_at_id', 'memories', ['session_id', 'created_at', 'id']),
+    ('ix_question_queue_user_id_status_created_at_id', 'question_queue', ['user_id', 'status', 'created_at', 'id']),
+    ('ix_question_queue_user_id_created_at_id', 'question_queue', ['user_id', 'created_at', 'id']),
+    ('ix_question_queue_session_id_created_at_id', 'question_queue', ['session_id', 'created_at', 'id']),
+    ('ix_prompt_runs_session_id_created_at_id', 'prompt_runs', ['session_id', 'created_at', 'id']),
+]
+
+# Superseded by the indexes above (prefixes of them)
+OLD_INDEXES = [
+    ('ix_sessions_user_id', 'sessions', ['user_id']),
+    ('ix_memories_user_id_created_at', 'memories', ['user_id', 'created_at']),
+    ('ix_memories_session_id_created_at', 'memories', ['session_id', 'created_at']),
+    ('ix_question_queue_user_id_status_created_at', 'question_queue', ['user_id', 'status', 'created_at']),
+    ('ix_question_queue_session_id_created_at', 'question_queue', ['session_id', 'created_at']),
+    ('ix_prompt_runs_session_id_created_at', 'prompt_runs', ['session_id', 'created_at']),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in NEW_INDEXES:
+            op.create_index(
+                name, table, columns, unique=False,
+                postgresql_concurrently=True, if_not_exists=True
+            )
+        for name, table, _ in OLD_INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in OLD_INDEXES:
+            op.create_index(
+                name, table, columns, unique=False,
+                postgresql_concurrently=True, if_not_exists=True
+            )
+        for name, table, _ in reversed(NEW_INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,137 @@
+"""Content-addressed blob store for system prompts and large outputs
+
+Revision ID: 007
+Revises: 006
+Create Date: 2024-03-20 00:00:00.000000
+
+"""
+import hashlib
+import json
+import os
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '007'
+down_revision: Union[str, None] = '006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same threshold as app.blob_store
+BLOB_MIN_BYTES = int(os.getenv("BLOB_MIN_BYTES", "1024"))
+BATCH_SIZE = 1000
+
+
+def _put_blob(bind, content: str) -> str:
+    raw = content.encode("utf-8")
+    digest = hashlib.sha256(raw).hexdigest()
+    bind.execute(
+        sa.text(
+            "INSERT INTO blobs (hash, data, size) VALUES (:hash, :data, :size) "
+            "ON CONFLICT (hash) DO NOTHING"
+        ),
+        {"hash": digest, "data": zlib.compress(raw, 6), "size": len(raw)}
+    )
+    return digest
+
+
+def _get_blob(bind, digest: str) -> str:
+    data = bind.execute(sa.text("SELECT data FROM blobs WHERE hash = :hash"), {"hash": digest}).scalar()
+    return zlib.decompress(data).decode("utf-8")
+
+
+def _batches(bind, query: str):
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(query), {"last_id": last_id, "limit": BATCH_SIZE}).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    op.create_table(
+        'blobs',
+        sa.Column('hash', sa.String(length=64), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('hash')
+    )
+    op.add_column('prompt_runs', sa.Column('system_prompt_hash', sa.String(length=64), nullable=True))
+    op.add_column('prompt_runs', sa.Column('output_text_hash', sa.String(length=64), nullable=True))
+    op.create_foreign_key(
+        'fk_prompt_runs_system_prompt_hash', 'prompt_runs', 'blobs', ['system_prompt_hash'], ['hash']
+    )
+    op.create_foreign_key(
+        'fk_prompt_runs_output_text_hash', 'prompt_runs', 'blobs', ['output_text_hash'], ['hash']
+    )
+
+    # Move inline system prompts and large outputs into blobs
+    bind = op.get_bind()
+    query = (
+        "SELECT id, input_json, output_text FROM prompt_runs "
+        "WHERE id > :last_id ORDER BY id LIMIT :limit"
+    )
+    for rows in _batches(bind, query):
+        updates = []
+        for run_id, input_json, output_text in rows:
+            if isinstance(input_json, str):
+                input_json = json.loads(input_json)
+            system_prompt = input_json.pop("system_prompt", None) if isinstance(input_json, dict) else None
+            large_output = output_text is not None and len(output_text.encode("utf-8")) >= BLOB_MIN_BYTES
+            if system_prompt is None and not large_output:
+                continue
+            updates.append({
+                "id": run_id,
+                "input_json": json.dumps(input_json, ensure_ascii=False),
+                "system_prompt_hash": _put_blob(bind, system_prompt) if system_prompt is not None else None,
+                "output_text": None if large_output else output_text,
+                "output_text_hash": _put_blob(bind, output_text) if large_output else None,
+            })
+        if updates:
+            bind.execute(
+                sa.text(
+                    "UPDATE prompt_runs SET input_json = CAST(:input_json AS json), "
+                    "system_prompt_hash = :system_prompt_hash, output_text = :output_text, "
+                    "output_text_hash = :output_text_hash WHERE id = :id"
+                ),
+                updates
+            )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    query = (
+        "SELECT id, input_json, system_prompt_hash, output_text_hash FROM prompt_runs "
+        "WHERE id > :last_id AND (system_prompt_hash IS NOT NULL OR output_text_hash IS NOT NULL) "
+        "ORDER BY id LIMIT :limit"
+    )
+    for rows in _batches(bind, query):
+        updates = []
+        for run_id, input_json, system_prompt_hash, output_text_hash in rows:
+            if isinstance(input_json, str):
+                input_json = json.loads(input_json)
+            input_json = dict(input_json or {})
+            if system_prompt_hash:
+                input_json["system_prompt"] = _get_blob(bind, system_prompt_hash)
+            params = {"id": run_id, "input_json": json.dumps(input_json, ensure_ascii=False)}
+            params["output_text"] = _get_blob(bind, output_text_hash) if output_text_hash else None
+            updates.append(params)
+        bind.execute(
+            sa.text(
+                "UPDATE prompt_runs SET input_json = CAST(:input_json AS json), "
+                "output_text = COALESCE(:output_text, output_text) WHERE id = :id"
+            ),
+            updates
+        )
+
+    op.drop_constraint('fk_prompt_runs_output_text_hash', 'prompt_runs', type_='foreignkey')
+    op.drop_constraint('fk_prompt_runs_system_prompt_hash', 'prompt_runs', type_='foreignkey')
+    op.drop_column('prompt_runs', 'output_text_hash')
+    op.drop_column('prompt_runs', 'system_prompt_hash')
+    op.drop_table('blobs')
@@ -0,0 +1,27 @@
+"""Index for recent prompt runs per prompt version (model policy stats)
+
+Revision ID: 010
+Revises: 009
+Create Date: 2024-04-05 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '010'
+down_revision: Union[str, None] = '009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_prompt_runs_prompt_name_version_id', 'prompt_runs',
+        ['prompt_name', 'prompt_version', 'id'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_prompt_runs_prompt_name_version_id', table_name='prompt_runs')
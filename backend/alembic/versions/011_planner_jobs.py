@@ -0,0 +1,36 @@
+"""Debounced planner jobs in the processing queue
+
+Revision ID: 011
+Revises: 010
+Create Date: 2024-04-12 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '011'
+down_revision: Union[str, None] = '010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'processing_jobs',
+        sa.Column('kind', sa.String(), server_default='message', nullable=False)
+    )
+    op.alter_column('processing_jobs', 'extractor_version', existing_type=sa.String(), nullable=True)
+    op.create_index(
+        'ux_processing_jobs_queued_planner', 'processing_jobs', ['session_id'], unique=True,
+        postgresql_where=sa.text("kind = 'planner' AND status = 'queued'")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ux_processing_jobs_queued_planner', table_name='processing_jobs')
+    op.execute("DELETE FROM processing_jobs WHERE kind = 'planner'")
+    op.alter_column('processing_jobs', 'extractor_version', existing_type=sa.String(), nullable=False)
+    op.drop_column('processing_jobs', 'kind')
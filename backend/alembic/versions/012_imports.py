@@ -0,0 +1,55 @@
+"""Bulk message imports
+
+Revision ID: 012
+Revises: 011
+Create Date: 2024-04-12 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '012'
+down_revision: Union[str, None] = '011'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'imports',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('session_id', sa.Integer(), nullable=False),
+        sa.Column('format', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('bytes_received', sa.Integer(), nullable=False),
+        sa.Column('messages_total', sa.Integer(), nullable=False),
+        sa.Column('jobs_total', sa.Integer(), nullable=False),
+        sa.Column('error_text', sa.Text(), nullable=True),
+        sa.Column('uploaded_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['session_id'], ['sessions.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_imports_id'), 'imports', ['id'], unique=False)
+    op.create_index('ix_imports_session_id_created_at', 'imports', ['session_id', 'created_at'], unique=False)
+
+    op.add_column('processing_jobs', sa.Column('import_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'processing_jobs_import_id_fkey', 'processing_jobs', 'imports', ['import_id'], ['id']
+    )
+    op.create_index(
+        'ix_processing_jobs_import_id_status', 'processing_jobs', ['import_id', 'status'],
+        postgresql_where=sa.text("import_id IS NOT NULL")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_processing_jobs_import_id_status', table_name='processing_jobs')
+    op.drop_constraint('processing_jobs_import_id_fkey', 'processing_jobs', type_='foreignkey')
+    op.drop_column('processing_jobs', 'import_id')
+    op.drop_index('ix_imports_session_id_created_at', table_name='imports')
+    op.drop_index(op.f('ix_imports_id'), table_name='imports')
+    op.drop_table('imports')
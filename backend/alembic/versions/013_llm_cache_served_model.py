@@ -0,0 +1,25 @@
+"""Backend model that served a cached LLM response
+
+Revision ID: 013
+Revises: 012
+Create Date: 2024-04-12 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '013'
+down_revision: Union[str, None] = '012'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('llm_cache', sa.Column('served_model', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('llm_cache', 'served_model')
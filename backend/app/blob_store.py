@@ -0,0 +1,70 @@
+"""
+Content-addressed blob storage.
+
+Large, highly repetitive text (system prompts, long model outputs) is stored
+once in the `blobs` table, keyed by the SHA-256 of its content and compressed
+with zlib. Rows reference it by hash; reads go through an in-process LRU,
+since blobs are immutable.
+"""
+import hashlib
+import os
+import zlib
+from typing import Dict, Iterable, Optional
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.llm_cache import LRUCache
+from app.models import Blob
+
+# output_text at or above this size (bytes) is moved to blobs
+BLOB_MIN_BYTES = int(os.getenv("BLOB_MIN_BYTES", "1024"))
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+BLOB_COMPRESSION_LEVEL = 6
+
+_cache = LRUCache(max_entries=1000, max_bytes=BLOB_CACHE_MAX_BYTES, ttl_seconds=24 * 3600)
+
+
+def blob_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def put_blob(db: Session, content: str) -> str:
+    """Store content (if new) in the current transaction and return its hash"""
+    raw = content.encode("utf-8")
+    digest = hashlib.sha256(raw).hexdigest()
+    stmt = insert(Blob).values(
+        hash=digest,
+        data=zlib.compress(raw, BLOB_COMPRESSION_LEVEL),
+        size=len(raw)
+    ).on_conflict_do_nothing(index_elements=[Blob.hash])
+    db.execute(stmt)
+    return digest
+
+
+def put_large_text(db: Session, content: Optional[str]) -> Optional[str]:
+    """Store content as a blob if it is large enough; returns the hash or None"""
+    if content is None or len(content.encode("utf-8")) < BLOB_MIN_BYTES:
+        return None
+    return put_blob(db, content)
+
+
+def get_blobs(db: Session, hashes: Iterable[Optional[str]]) -> Dict[str, str]:
+    """Fetch and decompress blobs by hash in one query (cached ones are not re-read)"""
+    result = {}
+    missing = []
+    for digest in set(h for h in hashes if h):
+        content = _cache.get(digest)
+        if content is None:
+            missing.append(digest)
+        else:
+            result[digest] = content
+
+    if missing:
+        for blob in db.query(Blob).filter(Blob.hash.in_(missing)):
+            content = zlib.decompress(blob.data).decode("utf-8")
+            _cache.put(blob.hash, content, blob.size)
+            result[blob.hash] = content
+    return result
+
+
+def get_blob(db: Session, digest: str) -> Optional[str]:
+    return get_blobs(db, [digest]).get(digest)
@@ -0,0 +1,187 @@
+"""
+Chunked extraction of long messages.
+
+A message longer than the extractor's message budget (diary entries, pasted
+transcripts) is split into chunks instead of being truncated. Chunks end on
+paragraph boundaries where possible, otherwise on sentence boundaries; each
+chunk repeats the last sentences of the previous one (overlap) so a memory
+that straddles a boundary is seen whole at least once.
+
+The service runs one extractor call per chunk concurrently (the provider's
+rate limiter bounds them) and merge_outputs() folds the answers into one
+extractor output: memories extracted twice from the overlap are merged,
+persons and chapter suggestions inside a memory are deduplicated by
+normalized name.
+"""
+import os
+import re
+from typing import Any, Dict, List, Tuple, TypeVar
+from app.context_packer import estimate_tokens
+from app.names import normalize_name
+from app.schemas import ExtractorChapterSuggestion, ExtractorMemory, ExtractorOutput, ExtractorPerson
+
+# Tokens of the previous chunk repeated at the start of the next one
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "80"))
+# Upper bound of extractor calls per message, the rest of a longer text is dropped
+MESSAGE_MAX_CHUNKS = int(os.getenv("MESSAGE_MAX_CHUNKS", "16"))
+# Memories whose summaries share this share of words are the same memory
+DUPLICATE_SUMMARY_SIMILARITY = 0.6
+
+_PARAGRAPH_PATTERN = re.compile(r"\n\s*\n")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?…])\s+")
+PARAGRAPH_BREAK = "\n\n"
+
+# (text, separator that follows it in the original)
+Unit = Tuple[str, str]
+Named = TypeVar("Named", ExtractorPerson, ExtractorChapterSuggestion)
+
+
+def _hard_split(sentence: str, max_tokens: int) -> List[str]:
+    """Cut a sentence without punctuation into pieces of at most max_tokens, on words"""
+    pieces: List[str] = []
+    words: List[str] = []
+    for word in sentence.split():
+        if words and estimate_tokens(" ".join(words + [word])) > max_tokens:
+            pieces.append(" ".join(words))
+            words = []
+        words.append(word)
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+
+def _units(text: str, max_unit_tokens: int) -> List[Unit]:
+    units: List[Unit] = []
+    for paragraph in _PARAGRAPH_PATTERN.split(text.strip()):
+        sentences = [s.strip() for s in _SENTENCE_PATTERN.split(paragraph.strip()) if s.strip()]
+        for index, sentence in enumerate(sentences):
+            pieces = (
+                _hard_split(sentence, max_unit_tokens)
+                if estimate_tokens(sentence) > max_unit_tokens else [sentence]
+            )
+            for piece in pieces:
+                units.append((piece, " "))
+            if index == len(sentences) - 1 and units:
+                units[-1] = (units[-1][0], PARAGRAPH_BREAK)
+    return units
+
+
+def _join(units: List[Unit]) -> str:
+    return "".join(text + separator for text, separator in units).strip()
+
+
+def _tokens(units: List[Unit]) -> int:
+    return sum(estimate_tokens(text) for text, _ in units)
+
+
+def split_text(text: str, max_tokens: int, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """Split text into chunks of at most ~max_tokens (estimated) with overlap.
+
+    Text that fits is returned as the only chunk, unchanged.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    # Units up to half a chunk, so that the rest of a chunk cut at a paragraph still fits
+    units = _units(text, max(max_tokens // 2, 1))
+
+    chunks: List[str] = []
+    current: List[Unit] = []
+    for unit in units:
+        if current and _tokens(current) + estimate_tokens(unit[0]) > max_tokens:
+            # Prefer the last paragraph break in the second half of the chunk
+            cut = len(current)
+            for index in range(len(current) - 1, 0, -1):
+                if current[index - 1][1] == PARAGRAPH_BREAK and _tokens(current[:index]) >= max_tokens // 2:
+                    cut = index
+                    break
+            emitted, rest = current[:cut], current[cut:]
+            chunks.append(_join(emitted))
+
+            overlap: List[Unit] = []
+            for previous in reversed(emitted):
+                if _tokens(overlap) + estimate_tokens(previous[0]) > overlap_tokens:
+                    break
+                overlap.insert(0, previous)
+            current = overlap + rest
+            if _tokens(current) + estimate_tokens(unit[0]) > max_tokens:
+                current = rest
+        current.append(unit)
+    if current:
+        chunks.append(_join(current))
+    return chunks
+
+
+def _words(text: str) -> set:
+    return set(normalize_name(text or "").split())
+
+
+def _similar(a: ExtractorMemory, b: ExtractorMemory) -> bool:
+    words_a, words_b = _words(a.summary), _words(b.summary)
+    if not words_a or not words_b:
+        return False
+    return len(words_a & words_b) / len(words_a | words_b) >= DUPLICATE_SUMMARY_SIMILARITY
+
+
+def _merge_named(items: List[Named], key: str) -> List[Named]:
+    """Deduplicate persons / chapter suggestions by normalized name, keeping the highest confidence"""
+    merged: Dict[str, Named] = {}
+    for item in items:
+        name = normalize_name(getattr(item, key) or "")
+        if not name:
+            continue
+        if name not in merged or item.confidence > merged[name].confidence:
+            merged[name] = item
+    return list(merged.values())
+
+
+def _merge_memory(kept: ExtractorMemory, duplicate: ExtractorMemory) -> ExtractorMemory:
+    # model_copy does not validate: both memories are already valid
+    update: Dict[str, Any] = {}
+    if len(duplicate.narrative) > len(kept.narrative):
+        update["summary"] = duplicate.summary
+        update["narrative"] = duplicate.narrative
+    update["time_text"] = kept.time_text or duplicate.time_text
+    update["location_text"] = kept.location_text or duplicate.location_text
+    update["importance"] = max(kept.importance, duplicate.importance)
+    update["topics"] = list(dict.fromkeys(kept.topics + duplicate.topics))
+    update["persons"] = _merge_named(kept.persons + duplicate.persons, "name")
+    update["chapter_suggestions"] = _merge_named(kept.chapter_suggestions + duplicate.chapter_suggestions, "title")
+    return kept.model_copy(update=update)
+
+
+def merge_outputs(outputs: List[ExtractorOutput]) -> Tuple[ExtractorOutput, int]:
+    """Merge the validated extractor outputs of a message's chunks, in chunk order.
+
+    Returns (merged output, number of duplicate memories folded in).
+    """
+    memories: List[ExtractorMemory] = []
+    unknowns: List[str] = []
+    notes: List[str] = []
+    duplicates = 0
+    previous_chunk: List[int] = []  # indexes in memories of the previous chunk's memories
+    for output in outputs:
+        current_chunk: List[int] = []
+        for memory in output.memories:
+            # Only the overlap with the previous chunk can produce the same memory twice
+            for index in previous_chunk:
+                if _similar(memories[index], memory):
+                    memories[index] = _merge_memory(memories[index], memory)
+                    duplicates += 1
+                    current_chunk.append(index)
+                    break
+            else:
+                current_chunk.append(len(memories))
+                memories.append(memory.model_copy(update={
+                    "persons": _merge_named(memory.persons, "name"),
+                    "chapter_suggestions": _merge_named(memory.chapter_suggestions, "title"),
+                }))
+        previous_chunk = current_chunk
+        unknowns.extend(output.unknowns)
+        if output.notes:
+            notes.append(output.notes)
+    merged = ExtractorOutput.model_construct(
+        memories=memories,
+        unknowns=list(dict.fromkeys(unknowns)),
+        notes="\n".join(notes) or None,
+    )
+    return merged, duplicates
@@ -0,0 +1,123 @@
+"""
+Token-budget context packing for the extractor and planner prompts.
+
+Every prompt gets a per-model token budget. Context sections (message history,
+known persons, memories, ...) are filled with ranked candidates until the
+budget is spent: each section first gets its share of the budget, then the
+tokens a section did not need go to the next sections in priority order, so
+budget is not left unused while useful candidates remain.
+
+Tokens are estimated locally (no tokenizer dependency); the estimate is close
+to BPE tokenizers for English and errs on the high side for Cyrillic.
+"""
+import json
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Tuple
+from app.names import normalize_name
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+# Per-model overrides, e.g. {"gpt-4o-mini": 6000, "gpt-5.2": 8000}
+CONTEXT_TOKEN_BUDGETS: Dict[str, int] = json.loads(os.getenv("CONTEXT_TOKEN_BUDGETS", "{}"))
+# How many candidates per section are read from the database before ranking
+CONTEXT_CANDIDATE_LIMIT = int(os.getenv("CONTEXT_CANDIDATE_LIMIT", "100"))
+
+# Веса для ранжирования воспоминаний
+RECENCY_WEIGHT = 0.4
+IMPORTANCE_WEIGHT = 0.4
+MENTION_WEIGHT = 0.2
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def get_token_budget(model: str) -> int:
+    return int(CONTEXT_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET))
+
+
+def estimate_tokens(value: Any) -> int:
+    """Approximate token count of a string or a JSON-serializable value.
+
+    ASCII words cost one token per ~4 characters, other scripts one per ~2.5,
+    every punctuation mark is a token of its own.
+    """
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(value):
+        if piece.isascii():
+            tokens += math.ceil(len(piece) / 4)
+        else:
+            tokens += math.ceil(len(piece) / 2.5)
+    return tokens
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens (estimated), marking the cut with an ellipsis"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) < max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + "…"
+
+
+def recency_scores(count: int) -> List[float]:
+    """1.0 for the newest of count items (index 0) down towards 0 for the oldest"""
+    return [1.0 - index / count for index in range(count)]
+
+
+def mentioned(message_words: List[str], name: str) -> bool:
+    """True if every word of name appears in the message, allowing inflected endings ("Маша" / "Машей")"""
+    name_words = normalize_name(name).split()
+    if not name_words:
+        return False
+    for name_word in name_words:
+        stem = name_word[:max(3, len(name_word) - 2)]
+        if not any(word.startswith(stem) for word in message_words):
+            return False
+    return True
+
+
+@dataclass
+class Section:
+    name: str
+    items: List[Any]  # ranked, best first
+    share: float  # fraction of the budget reserved in the first pass
+
+
+def pack_sections(sections: Iterable[Section], budget: int) -> Tuple[Dict[str, List[Any]], Dict[str, int]]:
+    """Fill sections with their ranked items within budget.
+
+    Returns (packed items per section, tokens used per section). Items keep
+    their rank order and are never skipped, so a section is always a prefix
+    of its candidates.
+    """
+    sections = list(sections)
+    packed: Dict[str, List[Any]] = {s.name: [] for s in sections}
+    used: Dict[str, int] = {s.name: 0 for s in sections}
+    costs = {s.name: [estimate_tokens(item) for item in s.items] for s in sections}
+
+    def fill(section: Section, limit: int) -> None:
+        items = section.items
+        position = len(packed[section.name])
+        while position < len(items) and used[section.name] + costs[section.name][position] <= limit:
+            packed[section.name].append(items[position])
+            used[section.name] += costs[section.name][position]
+            position += 1
+
+    # 1. Reserved share per section
+    for section in sections:
+        fill(section, int(budget * section.share))
+
+    # 2. Unused budget goes to sections in priority order
+    for section in sections:
+        remaining = budget - sum(used.values())
+        fill(section, used[section.name] + remaining)
+
+    return packed, used
@@ -0,0 +1,253 @@
+"""
+Per-message entity resolver for extractor results.
+
+Loads the user's persons and chapters once, indexes them by normalized name
+and resolves every extracted person / chapter suggestion in memory. New rows
+are only added to the session, so the caller writes memories, entities and
+links with a single flush.
+
+Names without an exact match fall back to a fuzzy lookup against the GIN
+index on persons.normalized_name / chapters.normalized_title, so
+near-duplicates ("Маша" / "Машей", "College years" / "College Years (Ohio)")
+are linked to the existing entity instead of creating a new row. prefetch()
+looks up all unmatched names of a batch of memories with one pg_trgm query
+per entity kind, so the query count stays constant.
+"""
+import os
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import String, cast, func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+from app.models import Person, Chapter, Memory
+from app.names import normalize_name, trigram_similarity
+from app.schemas import ExtractorMemory, ExtractorPerson
+
+FUZZY_MATCH_THRESHOLD = float(os.getenv("FUZZY_MATCH_THRESHOLD", "0.35"))
+# A missing pg_trgm is checked again after this long (the extension may be created later)
+TRGM_RECHECK_SECONDS = float(os.getenv("TRGM_RECHECK_SECONDS", "60"))
+
+# pg_trgm may be missing on databases created without migrations
+_trgm_available = False
+_trgm_checked_at: Optional[float] = None
+
+
+def _has_trgm(db: Session) -> bool:
+    global _trgm_available, _trgm_checked_at
+    if _trgm_available:
+        return True
+    now = time.monotonic()
+    if _trgm_checked_at is None or now - _trgm_checked_at >= TRGM_RECHECK_SECONDS:
+        _trgm_checked_at = now
+        _trgm_available = db.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        ).first() is not None
+    return _trgm_available
+
+
+def find_similar_persons(
+    db: Session,
+    user_id: int,
+    names: Iterable[Tuple[str, Optional[str]]],
+    threshold: float = FUZZY_MATCH_THRESHOLD
+) -> Dict[Tuple[str, Optional[str]], Tuple[int, float]]:
+    """Best fuzzy person match above threshold for every (normalized name, type), in one query.
+
+    The names are unnested and joined on the % operator
+    (pg_trgm.similarity_threshold, 0.3 by default), which lets Postgres use the
+    GIN index; the explicit similarity filter applies our threshold and
+    DISTINCT ON keeps the best match per name. Returns {(name, type): (person_id, score)}.
+    """
+    names = sorted(set(names), key=lambda item: (item[0], item[1] or ""))
+    if not names or not _has_trgm(db):
+        return {}
+    wanted = func.unnest(
+        cast([name for name, _ in names], ARRAY(String)),
+        cast([person_type for _, person_type in names], ARRAY(String))
+    ).table_valued("name", "type").render_derived()
+    similarity = func.similarity(Person.normalized_name, wanted.c.name)
+    rows = db.execute(
+        select(wanted.c.name, wanted.c.type, Person.id, similarity.label("score"))
+        .join(Person, Person.normalized_name.op("%")(wanted.c.name))
+        .where(
+            Person.user_id == user_id,
+            similarity >= threshold,
+            (wanted.c.type.is_(None)) | (Person.type == wanted.c.type)
+        )
+        .distinct(wanted.c.name, wanted.c.type)
+        .order_by(wanted.c.name, wanted.c.type, similarity.desc(), Person.id)
+    ).all()
+    return {(name, person_type): (person_id, score) for name, person_type, person_id, score in rows}
+
+
+def find_similar_chapters(
+    db: Session,
+    user_id: int,
+    titles: Iterable[str],
+    threshold: float = FUZZY_MATCH_THRESHOLD
+) -> Dict[str, Tuple[int, float]]:
+    """Best fuzzy chapter match above threshold for every normalized title, in one query"""
+    titles = sorted(set(titles))
+    if not titles or not _has_trgm(db):
+        return {}
+    wanted = func.unnest(cast(titles, ARRAY(String))).table_valued("title").render_derived()
+    similarity = func.similarity(Chapter.normalized_title, wanted.c.title)
+    rows = db.execute(
+        select(wanted.c.title, Chapter.id, similarity.label("score"))
+        .join(Chapter, Chapter.normalized_title.op("%")(wanted.c.title))
+        .where(Chapter.user_id == user_id, similarity >= threshold)
+        .distinct(wanted.c.title)
+        .order_by(wanted.c.title, similarity.desc(), Chapter.id)
+    ).all()
+    return {title: (chapter_id, score) for title, chapter_id, score in rows}
+
+
+class EntityResolver:
+    def __init__(self, db: Session, user_id: int, threshold: float = FUZZY_MATCH_THRESHOLD):
+        self.db = db
+        self.user_id = user_id
+        self.threshold = threshold
+        self.created_persons: List[Person] = []
+        self.created_chapters: List[Chapter] = []
+
+        self._persons_by_name: Dict[str, Person] = {}
+        self._persons_by_type: Dict[str, List[Person]] = defaultdict(list)
+        persons = db.query(Person).filter(
+            Person.user_id == user_id
+        ).order_by(Person.id).all()
+        self._persons_by_id = {person.id: person for person in persons}
+        for person in persons:
+            self._index_person(person)
+
+        self._chapters_by_title: Dict[str, Chapter] = {}
+        chapters = db.query(Chapter).filter(
+            Chapter.user_id == user_id
+        ).order_by(Chapter.id).all()
+        self._chapters_by_id = {chapter.id: chapter for chapter in chapters}
+        for chapter in chapters:
+            self._chapters_by_title.setdefault(normalize_name(chapter.title), chapter)
+        self._chapter_count = len(chapters)
+
+        # Fuzzy matches among the stored entities, looked up by prefetch(); None: no match
+        self._similar_persons: Dict[Tuple[str, Optional[str]], Optional[Person]] = {}
+        self._similar_chapters: Dict[str, Optional[Chapter]] = {}
+
+    def prefetch(self, memories: List[ExtractorMemory]):
+        """Look up fuzzy matches for all names of these memories without an exact match.
+
+        One query for the persons and one for the chapters, whatever the
+        number of names; names looked up before are skipped.
+        """
+        self._prefetch_persons({
+            (normalize_name(person_data.name.strip()), person_data.type)
+            for mem_data in memories
+            for person_data in mem_data.persons
+        })
+        self._prefetch_chapters({
+            normalize_name(suggestion.title)
+            for mem_data in memories
+            for suggestion in mem_data.chapter_suggestions
+        })
+
+    def resolve_person(self, person_data: ExtractorPerson, memory: Memory) -> Person:
+        """Smart person matching: exact name, fuzzy name, then a single family member of the same role"""
+        name = person_data.name.strip()
+        person_type = person_data.type
+        key = normalize_name(name)
+
+        # 1. Exact match by normalized name
+        person = self._persons_by_name.get(key)
+        if person:
+            return person
+
+        # 2. Fuzzy match of the same type (persons created in this message, then the index)
+        person = self._fuzzy_created_person(name, person_type)
+        if not person:
+            self._prefetch_persons({(key, person_type)})
+            person = self._similar_persons[(key, person_type)]
+        if person:
+            self._persons_by_name[key] = person
+            return person
+
+        # 3. For family members: if only one person of this type exists, might be the same
+        if person_type == "family":
+            same_type_persons = self._persons_by_type[person_type]
+            if len(same_type_persons) == 1:
+                return same_type_persons[0]
+
+        # 4. Create new person
+        person = Person(
+            user_id=self.user_id,
+            display_name=name,
+            type=person_type,
+            first_seen_memory=memory
+        )
+        self.db.add(person)
+        self._index_person(person)
+        self.created_persons.append(person)
+        return person
+
+    def resolve_chapter(self, title: str) -> Chapter:
+        """Find chapter by exact or fuzzy title, or create a new draft chapter at the end of the outline"""
+        key = normalize_name(title)
+        chapter = self._chapters_by_title.get(key)
+        if chapter:
+            return chapter
+
+        chapter = self._fuzzy_created_chapter(title)
+        if not chapter:
+            self._prefetch_chapters({key})
+            chapter = self._similar_chapters[key]
+        if chapter:
+            self._chapters_by_title[key] = chapter
+            return chapter
+
+        chapter = Chapter(
+            user_id=self.user_id,
+            title=title,
+            order_index=self._chapter_count,
+            status="draft"
+        )
+        self.db.add(chapter)
+        self._chapters_by_title[key] = chapter
+        self._chapter_count += 1
+        self.created_chapters.append(chapter)
+        return chapter
+
+    def _prefetch_persons(self, keys: Set[Tuple[str, Optional[str]]]):
+        keys = {key for key in keys if key[0] not in self._persons_by_name and key not in self._similar_persons}
+        matches = find_similar_persons(self.db, self.user_id, keys, self.threshold)
+        for key in keys:
+            match = matches.get(key)
+            self._similar_persons[key] = self._persons_by_id.get(match[0]) if match else None
+
+    def _prefetch_chapters(self, keys: Set[str]):
+        keys = {key for key in keys if key not in self._chapters_by_title and key not in self._similar_chapters}
+        matches = find_similar_chapters(self.db, self.user_id, keys, self.threshold)
+        for key in keys:
+            match = matches.get(key)
+            self._similar_chapters[key] = self._chapters_by_id.get(match[0]) if match else None
+
+    def _fuzzy_created_person(self, name: str, person_type: str) -> Optional[Person]:
+        # Persons created in this message are not flushed yet, so the index can't see them
+        best, best_score = None, self.threshold
+        for person in self.created_persons:
+            if person.type != person_type:
+                continue
+            score = trigram_similarity(name, person.display_name)
+            if score >= best_score:
+                best, best_score = person, score
+        return best
+
+    def _fuzzy_created_chapter(self, title: str) -> Optional[Chapter]:
+        best, best_score = None, self.threshold
+        for chapter in self.created_chapters:
+            score = trigram_similarity(title, chapter.title)
+            if score >= best_score:
+                best, best_score = chapter, score
+        return best
+
+    def _index_person(self, person: Person):
+        self._persons_by_name.setdefault(normalize_name(person.display_name), person)
+        self._persons_by_type[person.type].append(person)
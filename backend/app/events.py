@@ -0,0 +1,158 @@
+"""
+Live session events for GET /api/sessions/{id}/events (Server-Sent Events).
+
+Producers call publish(db, session_id, type, data) inside their transaction.
+The event is sent with pg_notify, which Postgres delivers only when that
+transaction commits (nothing is announced that was rolled back) and to every
+listening process, so events from standalone workers (`python -m app.worker`)
+reach the API process holding the browser connection.
+
+Each API process runs one EventListener: a dedicated connection LISTENing on
+the channel, driven by the event loop (no thread, no polling), which hands
+the events to the in-process EventBus subscribers of that session.
+"""
+import asyncio
+import json
+from collections import defaultdict
+from typing import Any, Dict, Optional, Set
+import psycopg2
+import psycopg2.extensions
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.database import engine
+
+EVENTS_CHANNEL = "session_events"
+# pg_notify payloads are limited to 8000 bytes
+NOTIFY_MAX_BYTES = 7900
+# Long strings are dropped from oversized events, clients load the full row instead
+TRUNCATED_STRING_LENGTH = 200
+SUBSCRIBER_QUEUE_SIZE = 256
+LISTENER_RECONNECT_SECONDS = 5
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def publish(db: Session, session_id: int, event_type: str, data: Dict[str, Any]):
+    """Queue an event for the session's live feed, delivered when db commits"""
+    payload = _dumps({"session_id": session_id, "type": event_type, "data": data})
+    if len(payload.encode("utf-8")) > NOTIFY_MAX_BYTES:
+        data = {
+            key: value for key, value in data.items()
+            if not isinstance(value, (str, dict, list)) or len(_dumps(value)) <= TRUNCATED_STRING_LENGTH
+        }
+        data["truncated"] = True
+        payload = _dumps({"session_id": session_id, "type": event_type, "data": data})
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": EVENTS_CHANNEL, "payload": payload})
+
+
+class EventBus:
+    """In-process fan-out of session events to SSE subscribers"""
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, session_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[session_id].add(queue)
+        return queue
+
+    def unsubscribe(self, session_id: int, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(session_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[session_id]
+
+    def dispatch(self, event: Dict[str, Any]):
+        for queue in self._subscribers.get(event.get("session_id"), ()):
+            if queue.full():
+                # A stalled client loses its oldest events instead of blocking everyone
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+        }
+
+
+class EventListener:
+    """LISTEN on EVENTS_CHANNEL over a dedicated connection, dispatching to the bus"""
+
+    def __init__(self, bus: EventBus):
+        self.bus = bus
+        self._connection = None
+        self._reconnect: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def start(self):
+        try:
+            self._connect()
+        except psycopg2.Error as e:
+            print(f"Event listener connect failed: {e}")
+            self._schedule_reconnect()
+
+    def _connect(self):
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        connection = psycopg2.connect(dsn)
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {EVENTS_CHANNEL}")
+        self._connection = connection
+        asyncio.get_running_loop().add_reader(connection.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        try:
+            self._connection.poll()
+        except psycopg2.Error as e:
+            print(f"Event listener connection lost: {e}")
+            self._disconnect()
+            self._schedule_reconnect()
+            return
+        while self._connection.notifies:
+            notify = self._connection.notifies.pop(0)
+            try:
+                self.bus.dispatch(json.loads(notify.payload))
+            except ValueError:
+                continue
+
+    def _disconnect(self):
+        if self._connection is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self._connection.fileno())
+            except (ValueError, psycopg2.Error):
+                pass
+            self._connection.close()
+            self._connection = None
+
+    def _schedule_reconnect(self):
+        if not self._closed and (self._reconnect is None or self._reconnect.done()):
+            self._reconnect = asyncio.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        while not self._closed and self._connection is None:
+            await asyncio.sleep(LISTENER_RECONNECT_SECONDS)
+            try:
+                self._connect()
+            except psycopg2.Error as e:
+                print(f"Event listener reconnect failed: {e}")
+
+    async def stop(self):
+        self._closed = True
+        if self._reconnect is not None:
+            self._reconnect.cancel()
+        self._disconnect()
+
+
+_event_bus: Optional[EventBus] = None
+
+
+def get_event_bus() -> EventBus:
+    """Return the process-wide event bus"""
+    global _event_bus
+    if _event_bus is None:
+        _event_bus = EventBus()
+    return _event_bus
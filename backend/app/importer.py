@@ -0,0 +1,219 @@
+"""
+Bulk import of transcripts, diaries and notes into a session.
+
+POST /api/sessions/{id}/import streams the upload through MessageSplitter,
+which turns it into messages as the bytes arrive:
+
+- text: messages are separated by blank lines
+- markdown: a heading line (#, ##, ...) or a `---` rule starts a new message
+- ndjson: one JSON object per line, {"text": "...", "role": "user",
+  "created_at": "2019-05-01T10:00:00+03:00"} (role and created_at optional,
+  a created_at without a UTC offset is taken as UTC)
+
+MessageImporter stores them in batches with one multi-row INSERT for the
+messages (ids in upload order, which the jobs and the extractor history
+rely on) and one for their processing jobs (user messages only), committing
+every batch so memory use does not grow with the upload and workers start
+extracting while the rest is still uploading. The jobs are regular
+processing jobs tagged with import_id; the worker runs at most
+IMPORT_MAX_CONCURRENCY of them per import, after interactive messages.
+Progress is served by GET /api/imports/{id}.
+"""
+import codecs
+import json
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from sqlalchemy import DateTime, bindparam, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from app.events import publish
+from app.models import Import, Message, ProcessingJob
+
+IMPORT_FORMATS = ("text", "markdown", "ndjson")
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+MESSAGE_ROLES = ("user", "assistant", "system")
+
+_HEADING_PATTERN = re.compile(r"^#{1,6}\s")
+_RULE_PATTERN = re.compile(r"^\s*(-{3,}|\*{3,}|_{3,})\s*$")
+
+
+class ImportFormatError(ValueError):
+    """The upload does not match its declared format"""
+
+
+class ImportTooLarge(ValueError):
+    """The upload exceeds IMPORT_MAX_BYTES"""
+
+
+class MessageSplitter:
+    """Incremental splitter: feed() returns the messages completed by a chunk of text"""
+
+    def __init__(self, import_format: str):
+        if import_format not in IMPORT_FORMATS:
+            raise ImportFormatError(f"Unknown import format: {import_format}. Allowed: {', '.join(IMPORT_FORMATS)}")
+        self.format = import_format
+        self._partial_line = ""
+        self._lines: List[str] = []  # lines of the message being collected
+        self.line_number = 0
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        lines = (self._partial_line + text).split("\n")
+        self._partial_line = lines.pop()
+        records: List[Dict[str, Any]] = []
+        for line in lines:
+            self.line_number += 1
+            record = self._line(line.rstrip("\r"))
+            if record:
+                records.append(record)
+        return records
+
+    def close(self) -> List[Dict[str, Any]]:
+        records = self.feed("\n") if self._partial_line else []
+        record = self._emit()
+        if record:
+            records.append(record)
+        return records
+
+    def _emit(self) -> Optional[Dict[str, Any]]:
+        text = "\n".join(self._lines).strip()
+        self._lines = []
+        return {"text": text, "role": "user", "created_at": None} if text else None
+
+    def _line(self, line: str) -> Optional[Dict[str, Any]]:
+        if self.format == "ndjson":
+            return self._ndjson(line)
+        if self.format == "text":
+            if not line.strip():
+                return self._emit()
+            self._lines.append(line)
+            return None
+        # markdown
+        if _RULE_PATTERN.match(line):
+            return self._emit()
+        record = self._emit() if _HEADING_PATTERN.match(line) else None
+        self._lines.append(line)
+        return record
+
+    def _ndjson(self, line: str) -> Optional[Dict[str, Any]]:
+        if not line.strip():
+            return None
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            raise ImportFormatError(f"Line {self.line_number}: invalid JSON: {e}")
+        if not isinstance(data, dict):
+            raise ImportFormatError(f"Line {self.line_number}: expected a JSON object")
+        text = data.get("text", data.get("content_text"))
+        if not isinstance(text, str):
+            raise ImportFormatError(f"Line {self.line_number}: \"text\" is required")
+        if not text.strip():
+            return None
+        role = data.get("role", "user")
+        if role not in MESSAGE_ROLES:
+            raise ImportFormatError(f"Line {self.line_number}: unknown role {role!r}")
+        created_at = data.get("created_at")
+        if created_at is not None:
+            try:
+                created_at = datetime.fromisoformat(str(created_at))
+            except ValueError:
+                raise ImportFormatError(f"Line {self.line_number}: invalid created_at {created_at!r}")
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+        return {"text": text.strip(), "role": role, "created_at": created_at}
+
+
+class MessageImporter:
+    """Stores the messages of one upload in batches and enqueues their processing jobs"""
+
+    def __init__(self, db: Session, record: Import, extractor_version: str, planner_version: str):
+        self.db = db
+        self.import_id = record.id
+        self.session_id = record.session_id
+        self.extractor_version = extractor_version
+        self.planner_version = planner_version
+        self.splitter = MessageSplitter(record.format)
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending: List[Dict[str, Any]] = []
+        self.bytes_received = 0
+        self.messages = 0
+        self.jobs = 0
+
+    def feed(self, chunk: bytes):
+        self.bytes_received += len(chunk)
+        if self.bytes_received > IMPORT_MAX_BYTES:
+            raise ImportTooLarge(f"Upload exceeds {IMPORT_MAX_BYTES} bytes")
+        self._pending.extend(self.splitter.feed(self._decoder.decode(chunk)))
+        if len(self._pending) >= IMPORT_BATCH_SIZE:
+            self._flush()
+
+    def finish(self):
+        self._pending.extend(self.splitter.feed(self._decoder.decode(b"", final=True)))
+        self._pending.extend(self.splitter.close())
+        self._flush()
+        self.db.query(Import).filter(Import.id == self.import_id).update({
+            "status": "processing",
+            "uploaded_at": func.now()
+        }, synchronize_session=False)
+        publish(self.db, self.session_id, "import", {
+            "id": self.import_id, "status": "processing", "messages": self.messages, "jobs": self.jobs
+        })
+        self.db.commit()
+
+    def fail(self, error: str):
+        """Record a rejected upload; batches stored before the error are kept and processed"""
+        self.db.rollback()
+        self.db.query(Import).filter(Import.id == self.import_id).update({
+            "status": "failed",
+            "error_text": error,
+            "bytes_received": self.bytes_received
+        }, synchronize_session=False)
+        self.db.commit()
+
+    def _flush(self):
+        """One INSERT for the batch's messages, one for their jobs, one commit"""
+        if not self._pending:
+            return
+        rows = [
+            {
+                "session_id": self.session_id,
+                "role": record["role"],
+                "content_text": record["text"],
+                "imported_created_at": record["created_at"],
+            }
+            for record in self._pending
+        ]
+        self._pending = []
+        # One statement in upload order; undated rows get the server time like other messages
+        stmt = insert(Message).values(
+            created_at=func.coalesce(
+                bindparam("imported_created_at", type_=DateTime(timezone=True)), func.now()
+            )
+        ).returning(Message.id, Message.role, sort_by_parameter_order=True)
+        inserted = self.db.execute(stmt, rows).all()
+        user_message_ids = sorted(message_id for message_id, role in inserted if role == "user")
+        if user_message_ids:
+            self.db.execute(insert(ProcessingJob), [
+                {
+                    "kind": "message",
+                    "import_id": self.import_id,
+                    "session_id": self.session_id,
+                    "message_id": message_id,
+                    "status": "queued",
+                    "stage": "queued",
+                    "extractor_version": self.extractor_version,
+                    "planner_version": self.planner_version,
+                    "attempts": 0,
+                }
+                for message_id in user_message_ids
+            ])
+        self.messages += len(inserted)
+        self.jobs += len(user_message_ids)
+        self.db.query(Import).filter(Import.id == self.import_id).update({
+            "messages_total": self.messages,
+            "jobs_total": self.jobs,
+            "bytes_received": self.bytes_received
+        }, synchronize_session=False)
+        self.db.commit()
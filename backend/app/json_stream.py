@@ -0,0 +1,92 @@
+"""
+Incremental JSON parsing of streamed extractor output.
+
+The extractor answers with {"memories": [{...}, {...}], "unknowns": [...], ...}.
+StreamingArrayParser is fed the text chunks as they arrive and returns every
+element of the watched top-level array ("memories") as soon as its closing
+brace is seen, so a memory can be stored while the model is still writing
+the next one. Only a lightweight scanner state (string / escape flags and the
+container stack) is kept between chunks; each element is parsed once with
+json.loads when it is complete.
+"""
+import json
+from typing import Any, List, Optional
+
+
+class StreamingArrayParser:
+    def __init__(self, key: str = "memories"):
+        self.key = key
+        self.buffer: List[str] = []  # all chunks, the full text is "".join(buffer)
+        self._text = ""  # unscanned tail + current element
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start: Optional[int] = None
+        self._last_key: Optional[str] = None
+        self._in_target = False
+        self._element_start: Optional[int] = None
+        self.errors = 0
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Scan chunk, return the array elements completed by it"""
+        self.buffer.append(chunk)
+        offset = len(self._text)
+        self._text += chunk
+        completed: List[Any] = []
+
+        for position in range(offset, len(self._text)):
+            char = self._text[position]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._string_start is not None:
+                        # Strings directly in the root object: the last one before "[" is the key
+                        self._last_key = self._text[self._string_start + 1:position]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = position
+            elif char in "{[":
+                if (
+                    char == "[" and self._stack == ["{"]
+                    and self._last_key == self.key
+                ):
+                    self._in_target = True
+                elif self._in_target and len(self._stack) == 2 and char == "{":
+                    self._element_start = position
+                self._stack.append(char)
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if self._in_target and len(self._stack) == 2 and char == "}" and self._element_start is not None:
+                    element_text = self._text[self._element_start:position + 1]
+                    self._element_start = None
+                    try:
+                        completed.append(json.loads(element_text))
+                    except ValueError:
+                        self.errors += 1
+                elif self._in_target and len(self._stack) == 1 and char == "]":
+                    self._in_target = False
+
+        # Keep only what an unfinished element still needs
+        if self._element_start is not None:
+            self._text = self._text[self._element_start:]
+            if self._string_start is not None:
+                self._string_start -= self._element_start
+            self._element_start = 0
+        elif self._in_string and self._string_start is not None:
+            self._text = self._text[self._string_start:]
+            self._string_start = 0
+        else:
+            self._text = ""
+            self._string_start = None
+        return completed
+
+    @property
+    def text(self) -> str:
+        return "".join(self.buffer)
@@ -0,0 +1,241 @@
+"""
+Persistent LLM response cache.
+
+Responses are keyed by a canonical hash of (prompt_name, prompt_version, model,
+context) and stored in the `llm_cache` table. An in-process LRU with TTL and
+size-based eviction sits in front of the table, so repeated calls neither hit
+the provider nor the database.
+
+The LRU keeps the validated output model of a response, so memory hits skip
+parsing and validation; rows read from the table are validated once.
+
+The key holds the requested model. With the router a different backend model
+may answer; it is stored with the entry and returned as LLMResult.model.
+"""
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy.dialects.postgresql import insert
+from app.database import SessionLocal
+from app.llm_provider import LLMResult
+from app.models import LLMCacheEntry
+from app.structured_output import OUTPUT_MODELS
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+def cache_key(prompt_name: str, prompt_version: str, model: str, context: Dict[str, Any]) -> str:
+    """Canonical SHA-256 of the call inputs"""
+    payload = json.dumps(
+        [prompt_name, prompt_version, model, context],
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """In-memory LRU with per-entry TTL, bounded by entry count and total bytes"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, size, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Any, size: int, ttl_seconds: Optional[float] = None):
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self.total_bytes += size
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class LLMResponseCache:
+    """Two-level (memory, then Postgres) cache for provider responses"""
+
+    def __init__(
+        self,
+        enabled: bool = LLM_CACHE_ENABLED,
+        ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.memory = LRUCache(max_entries, max_bytes, ttl_seconds)
+
+    async def get_or_call(
+        self,
+        prompt_name: str,
+        prompt_version: str,
+        model: str,
+        context: Dict[str, Any],
+        call: Callable[[], Awaitable[LLMResult]],
+    ) -> Tuple[LLMResult, Optional[bool]]:
+        """Return (result, cache_hit). cache_hit is None when the cache is disabled.
+
+        Cache hits report zero tokens, since nothing was sent to the provider,
+        and the model that served the cached answer.
+        """
+        if not self.enabled:
+            return await call(), None
+
+        start_time = time.time()
+        key = cache_key(prompt_name, prompt_version, model, context)
+        cached = self._get(key, prompt_name)
+        if cached is not None:
+            cached.latency_ms = int((time.time() - start_time) * 1000)
+            return cached, True
+
+        result = await call()
+        # Кэшируем только успешные ответы, ошибки провайдера должны повторяться
+        if result.output is not None:
+            self._put(key, prompt_name, prompt_version, model, result)
+        return result, False
+
+    def lookup(
+        self, prompt_name: str, prompt_version: str, model: str, context: Dict[str, Any]
+    ) -> Optional[LLMResult]:
+        """Cached response, for callers that can't use get_or_call"""
+        if not self.enabled:
+            return None
+        return self._get(cache_key(prompt_name, prompt_version, model, context), prompt_name)
+
+    def store(
+        self,
+        prompt_name: str,
+        prompt_version: str,
+        model: str,
+        context: Dict[str, Any],
+        result: LLMResult,
+    ):
+        if self.enabled and result.output is not None:
+            key = cache_key(prompt_name, prompt_version, model, context)
+            self._put(key, prompt_name, prompt_version, model, result)
+
+    def _get(self, key: str, prompt_name: str) -> Optional[LLMResult]:
+        """A fresh LLMResult (zero tokens) sharing the cached output model"""
+        value = self.memory.get(key)
+        if value is None:
+            value = self._load(key, prompt_name)
+        if value is None:
+            return None
+        output_text, output, served_model = value
+        return LLMResult(output_text, output, model=served_model)
+
+    def _load(self, key: str, prompt_name: str) -> Optional[Tuple[str, Any, Optional[str]]]:
+        db = SessionLocal()
+        try:
+            entry = db.query(LLMCacheEntry).filter(
+                LLMCacheEntry.key == key,
+                LLMCacheEntry.expires_at > datetime.now(timezone.utc)
+            ).first()
+            if not entry:
+                return None
+            output_text, output_json, served_model = entry.output_text, entry.output_json, entry.served_model
+            remaining = (entry.expires_at - datetime.now(timezone.utc)).total_seconds()
+        except Exception as e:
+            print(f"LLM cache read failed: {e}")
+            return None
+        finally:
+            db.close()
+
+        try:
+            output = OUTPUT_MODELS[prompt_name].model_validate(output_json)
+        except ValidationError:
+            # Stored under an older output schema: a miss, the new answer overwrites it
+            return None
+        value = (output_text, output, served_model)
+        self.memory.put(key, value, self._size(output_text), ttl_seconds=remaining)
+        return value
+
+    def _put(
+        self,
+        key: str,
+        prompt_name: str,
+        prompt_version: str,
+        model: str,
+        result: LLMResult,
+    ):
+        self.memory.put(
+            key, (result.output_text, result.output, result.model), self._size(result.output_text)
+        )
+
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+        values = {
+            "key": key,
+            "prompt_name": prompt_name,
+            "prompt_version": prompt_version,
+            "model": model,
+            "served_model": result.model,
+            "output_text": result.output_text,
+            "output_json": result.output_json,
+            "token_in": result.token_in,
+            "token_out": result.token_out,
+            "expires_at": expires_at,
+        }
+        db = SessionLocal()
+        try:
+            stmt = insert(LLMCacheEntry).values(**values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[LLMCacheEntry.key],
+                set_={k: v for k, v in values.items() if k != "key"},
+            )
+            db.execute(stmt)
+            db.commit()
+        except Exception as e:
+            # Кэш не должен ломать основной pipeline
+            db.rollback()
+            print(f"LLM cache write failed: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _size(output_text: str) -> int:
+        # The output model holds the same content as the text: count it twice
+        return 2 * len(output_text.encode("utf-8"))
+
+
+_llm_cache: Optional[LLMResponseCache] = None
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Return the process-wide response cache"""
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMResponseCache()
+    return _llm_cache
@@ -2,9 +2,89 @@ import os
 import json
 import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
-from openai import OpenAI
-from app.schemas import ExtractorOutput, PlannerOutput
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from functools import cached_property
+from typing import AsyncIterator, Dict, Any, List, Optional
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from pydantic import BaseModel
+from app.prompt_serializer import serialize_context
+from app.context_packer import estimate_tokens
+from app.rate_limiter import RateLimiter
+from app.resilience import ResilientCaller
+from app.structured_output import json_schema_format, parse_output
+
+# HTTP connection pool towards the OpenAI API
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", str(OPENAI_MAX_CONNECTIONS)))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "true").lower() == "true"
+# Strict JSON schema response format; models that reject it fall back to JSON mode + local repair
+LLM_STRUCTURED_OUTPUTS = os.getenv("LLM_STRUCTURED_OUTPUTS", "true").lower() == "true"
+
+
+class PoolStats:
+    """Counters fed by httpcore trace events of every request on a client"""
+
+    def __init__(self):
+        self.requests = 0
+        self.connects = 0
+        self.tls_handshakes = 0
+
+    async def on_request(self, request: httpx.Request):
+        self.requests += 1
+        request.extensions["trace"] = self.trace
+
+    async def trace(self, event_name: str, info: Dict[str, Any]):
+        if event_name == "connection.connect_tcp.complete":
+            self.connects += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+
+@dataclass
+class LLMResult:
+    """Answer of an extractor / planner call.
+
+    output is the ExtractorOutput / PlannerOutput validated once by
+    parse_output(), or None with the reason in error (provider failure,
+    refusal, answer that could not be repaired). The pipeline uses output
+    as is and never validates it again.
+
+    model is the "backend:model" that produced the answer when the router
+    chose it, so cache hits can report it; None for single providers.
+    """
+    output_text: str
+    output: Optional[BaseModel]
+    error: Optional[str] = None
+    token_in: int = 0
+    token_out: int = 0
+    latency_ms: int = 0
+    model: Optional[str] = None
+
+    @cached_property
+    def output_json(self) -> Dict[str, Any]:
+        """JSON form of the output for prompt_runs.output_json and the cache, {"error": ...} if invalid"""
+        if self.output is None:
+            return {"error": self.error}
+        return self.output.model_dump(mode="json")
+
+
+def parse_result(
+    prompt_name: str,
+    output_text: str,
+    token_in: int,
+    token_out: int,
+    latency_ms: int,
+    meta: Dict[str, Any],
+) -> LLMResult:
+    """Validate an answer into an LLMResult, reporting local repairs in meta["repairs"]"""
+    output, error, repairs = parse_output(prompt_name, output_text)
+    if repairs:
+        meta["repairs"] = repairs
+    return LLMResult(output_text, output, error, token_in, token_out, latency_ms)
 
 
 class LLMProvider(ABC):
@@ -14,8 +94,12 @@ class LLMProvider(ABC):
         prompt_text: str,
         context: Dict[str, Any],
         model: str,
-    ) -> tuple[str, Dict[str, Any], int, int, int]:
-        """Returns: (output_text, parsed_json, token_in, token_out, latency_ms)"""
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
+        """Call the extractor; provider failures are returned as a result with error set.
+
+        meta, if given, is filled with call details (e.g. queue_wait_ms).
+        """
         pass
 
     @abstractmethod
@@ -24,97 +108,360 @@ class LLMProvider(ABC):
         prompt_text: str,
         context: Dict[str, Any],
         model: str,
-    ) -> tuple[str, Dict[str, Any], int, int, int]:
-        """Returns: (output_text, parsed_json, token_in, token_out, latency_ms)"""
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
+        """Call the planner; provider failures are returned as a result with error set.
+
+        meta, if given, is filled with call details (e.g. queue_wait_ms).
+        """
+        pass
+
+    async def stream_extractor(
+        self,
+        prompt_text: str,
+        context: Dict[str, Any],
+        model: str,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        """Yield the extractor output text in chunks as the model writes it.
+
+        token_in, token_out, latency_ms (and first_token_ms) are written to meta;
+        a provider failure sets meta["error_type"] / meta["error"] instead of raising.
+        Providers without streaming yield the whole answer as one chunk.
+        """
+        meta = {} if meta is None else meta
+        result = await self.call_extractor(prompt_text, context, model, meta=meta)
+        meta.update(
+            token_in=result.token_in, token_out=result.token_out,
+            latency_ms=result.latency_ms, first_token_ms=result.latency_ms
+        )
+        if meta.get("error_type"):
+            meta["error"] = result.error or result.output_text
+            return
+        yield result.output_text
+
+    def stats(self) -> Dict[str, Any]:
+        """Connection pool / runtime statistics for GET /api/llm/stats"""
+        return {"provider": type(self).__name__}
+
+    async def aclose(self):
         pass
 
 
+def _not_processed(error: BaseException) -> bool:
+    """The provider refused the request or never got it, so it used no tokens"""
+    if isinstance(error, openai.APITimeoutError):
+        return False
+    return isinstance(error, (openai.APIConnectionError, openai.APIStatusError))
+
+
 class OpenAIProvider(LLMProvider):
-    def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
+    """OpenAI provider owning one AsyncOpenAI client and its HTTP connection pool.
+
+    Created once per process (see get_llm_provider), so keep-alive connections
+    and TLS sessions are reused across requests and workers.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_connections: int = OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections: int = OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = OPENAI_KEEPALIVE_EXPIRY,
+        http2: bool = OPENAI_HTTP2,
+    ):
+        # base_url points the client to any OpenAI-compatible server (vLLM, llama.cpp, ...)
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable is required")
-        self.client = OpenAI(api_key=api_key)
+        self.base_url = base_url
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.pool_stats = PoolStats()
+        self.http_client = DefaultAsyncHttpxClient(
+            limits=self.limits,
+            http2=http2,
+            event_hooks={"request": [self.pool_stats.on_request]},
+        )
+        self.limiter = RateLimiter()
+        self.resilience = ResilientCaller()
+        # Models that answered 400 to the json_schema response format
+        self.json_schema_unsupported: set = set()
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,  # retries are done by ResilientCaller, one limiter slot per attempt
+            http_client=self.http_client,
+            timeout=httpx.Timeout(120.0, connect=10.0),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        connections = []
+        # httpx does not expose the pool publicly; httpcore connections do have is_idle()/info()
+        pool = getattr(self.http_client._transport, "_pool", None)
+        if pool is not None:
+            connections = list(pool.connections)
+        return {
+            "provider": type(self).__name__,
+            "base_url": str(self.client.base_url),
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "pool": {
+                "connections": len(connections),
+                "idle": sum(1 for c in connections if c.is_idle()),
+                "http2": sum(1 for c in connections if "HTTP/2" in c.info()),
+                "requests": self.pool_stats.requests,
+                "connects": self.pool_stats.connects,
+                "tls_handshakes": self.pool_stats.tls_handshakes,
+            },
+            "rate_limits": self.limiter.stats(),
+            "resilience": self.resilience.stats(),
+            "json_schema_unsupported": sorted(self.json_schema_unsupported),
+        }
+
+    async def aclose(self):
+        await self.client.close()
+
+    async def _create(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_completion_tokens: int,
+        meta: Dict[str, Any],
+        response_format: Dict[str, Any],
+    ):
+        """Chat completion with retries / hedging / circuit breaker, every attempt
+        under the per-model concurrency / RPM / TPM limits"""
+        # Reserve prompt + worst-case output, settled with the real usage afterwards
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        estimated_tokens = prompt_tokens + max_completion_tokens
+        meta["queue_wait_ms"] = 0
+        attempts = meta.setdefault("attempts", [])
+
+        async def attempt():
+            async with self.limiter.acquire(model, estimated_tokens, prompt_tokens) as reservation:
+                meta["queue_wait_ms"] += reservation.wait_ms
+                reservation.sent = True
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        response_format=response_format,
+                        temperature=temperature,
+                        timeout=120.0,  # 120 секунд таймаут для длинных запросов
+                        max_completion_tokens=max_completion_tokens,
+                    )
+                except openai.APIError as e:
+                    reservation.sent = not _not_processed(e)
+                    raise
+                if response.usage:
+                    reservation.actual_tokens = response.usage.total_tokens
+            return response
+
+        return await self.resilience.call(model, attempt, attempts)
+
+    def _response_format(self, prompt_name: str, model: str) -> Dict[str, Any]:
+        if LLM_STRUCTURED_OUTPUTS and model not in self.json_schema_unsupported:
+            return json_schema_format(prompt_name)
+        return {"type": "json_object"}
+
+    def _schema_rejected(self, error: Exception, model: str, response_format: Dict[str, Any]) -> bool:
+        """True (and remembered) if the model rejected the json_schema response format"""
+        if (
+            response_format["type"] == "json_schema"
+            and isinstance(error, openai.BadRequestError)
+            and ("response_format" in str(error) or "json_schema" in str(error))
+        ):
+            self.json_schema_unsupported.add(model)
+            return True
+        return False
+
+    async def _create_structured(
+        self,
+        prompt_name: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_completion_tokens: int,
+        meta: Dict[str, Any],
+    ):
+        """_create with the prompt's strict JSON schema, JSON mode for models without it"""
+        response_format = self._response_format(prompt_name, model)
+        meta["response_format"] = response_format["type"]
+        try:
+            return await self._create(model, messages, temperature, max_completion_tokens, meta, response_format)
+        except openai.BadRequestError as e:
+            if not self._schema_rejected(e, model, response_format):
+                raise
+        meta["response_format"] = "json_object"
+        return await self._create(
+            model, messages, temperature, max_completion_tokens, meta, {"type": "json_object"}
+        )
+
+    async def stream_extractor(
+        self,
+        prompt_text: str,
+        context: Dict[str, Any],
+        model: str,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        meta = {} if meta is None else meta
+        start_time = time.time()
+        messages = [
+            {"role": "system", "content": prompt_text},
+            {"role": "user", "content": serialize_context("extractor", context)}
+        ]
+        max_completion_tokens = 4000
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        estimated_tokens = prompt_tokens + max_completion_tokens
+        meta["queue_wait_ms"] = 0
+        meta.update(token_in=0, token_out=0)
+        attempts = meta.setdefault("attempts", [])
+
+        response_format = self._response_format("extractor", model)
+
+        async def open_stream():
+            # The limiter slot is held until the stream is consumed, released on a failed open
+            stack = AsyncExitStack()
+            reservation = await stack.enter_async_context(
+                self.limiter.acquire(model, estimated_tokens, prompt_tokens)
+            )
+            meta["queue_wait_ms"] += reservation.wait_ms
+            reservation.sent = True
+            try:
+                stream = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    response_format=response_format,
+                    temperature=0.3,
+                    timeout=120.0,
+                    max_completion_tokens=max_completion_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+            except BaseException as e:
+                reservation.sent = not _not_processed(e)
+                await stack.aclose()
+                raise
+            return stack, reservation, stream
+
+        try:
+            # Only opening the stream is retried: chunks already sent to the caller can't be taken back
+            try:
+                stack, reservation, stream = await self.resilience.call(model, open_stream, attempts, stream=True)
+            except openai.BadRequestError as e:
+                if not self._schema_rejected(e, model, response_format):
+                    raise
+                response_format = {"type": "json_object"}
+                stack, reservation, stream = await self.resilience.call(model, open_stream, attempts, stream=True)
+            meta["response_format"] = response_format["type"]
+            async with stack:
+                async for chunk in stream:
+                    if chunk.usage:
+                        meta["token_in"] = chunk.usage.prompt_tokens
+                        meta["token_out"] = chunk.usage.completion_tokens
+                        reservation.actual_tokens = chunk.usage.total_tokens
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if "first_token_ms" not in meta:
+                            meta["first_token_ms"] = int((time.time() - start_time) * 1000) - meta["queue_wait_ms"]
+                        yield chunk.choices[0].delta.content
+        except Exception as e:
+            meta["error_type"] = type(e).__name__
+            meta["error"] = f"OpenAI API error: {str(e)}"
+        finally:
+            meta["latency_ms"] = int((time.time() - start_time) * 1000) - meta["queue_wait_ms"]
 
     async def call_extractor(
         self,
         prompt_text: str,
         context: Dict[str, Any],
         model: str,
-    ) -> tuple[str, Dict[str, Any], int, int, int]:
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
+        meta = {} if meta is None else meta
         start_time = time.time()
         
         try:
-            response = self.client.chat.completions.create(
+            response = await self._create_structured(
+                "extractor",
                 model=model,
                 messages=[
                     {"role": "system", "content": prompt_text},
-                    {"role": "user", "content": json.dumps(context, indent=2)}
+                    {"role": "user", "content": serialize_context("extractor", context)}
                 ],
-                response_format={"type": "json_object"},
                 temperature=0.3,
-                timeout=120.0,  # 120 секунд таймаут для длинных запросов
                 max_completion_tokens=4000,  # Ограничение выходных токенов для GPT-5.2 (использует max_completion_tokens вместо max_tokens)
+                meta=meta,
             )
             
-            latency_ms = int((time.time() - start_time) * 1000)
-            output_text = response.choices[0].message.content
+            latency_ms = int((time.time() - start_time) * 1000) - meta.get("queue_wait_ms", 0)
+            message = response.choices[0].message
+            output_text = message.content or ""
             token_in = response.usage.prompt_tokens
             token_out = response.usage.completion_tokens
             
-            try:
-                parsed_json = json.loads(output_text)
-                # Validate against schema
-                ExtractorOutput(**parsed_json)
-            except Exception as e:
-                parsed_json = {"error": str(e)}
-            
-            return output_text, parsed_json, token_in, token_out, latency_ms
+            if getattr(message, "refusal", None):
+                # Structured outputs report a refusal instead of schema-conforming content
+                return LLMResult(
+                    output_text, None, f"Model refused: {message.refusal}", token_in, token_out, latency_ms
+                )
+            # Validate against schema once, repairing common defects locally
+            return parse_result("extractor", output_text, token_in, token_out, latency_ms, meta)
         except Exception as e:
-            latency_ms = int((time.time() - start_time) * 1000)
+            latency_ms = int((time.time() - start_time) * 1000) - meta.get("queue_wait_ms", 0)
             error_msg = f"OpenAI API error: {str(e)}"
-            parsed_json = {"error": error_msg, "type": type(e).__name__}
-            return error_msg, parsed_json, 0, 0, latency_ms
+            meta["error_type"] = type(e).__name__
+            return LLMResult(error_msg, None, error_msg, 0, 0, latency_ms)
 
     async def call_planner(
         self,
         prompt_text: str,
         context: Dict[str, Any],
         model: str,
-    ) -> tuple[str, Dict[str, Any], int, int, int]:
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
+        meta = {} if meta is None else meta
         start_time = time.time()
         
         try:
-            response = self.client.chat.completions.create(
+            response = await self._create_structured(
+                "planner",
                 model=model,
                 messages=[
                     {"role": "system", "content": prompt_text},
-                    {"role": "user", "content": json.dumps(context, indent=2)}
+                    {"role": "user", "content": serialize_context("planner", context)}
                 ],
-                response_format={"type": "json_object"},
                 temperature=0.5,
-                timeout=120.0,  # 120 секунд таймаут для длинных запросов
                 max_completion_tokens=2000,  # Ограничение выходных токенов для GPT-5.2 (использует max_completion_tokens вместо max_tokens)
+                meta=meta,
             )
             
-            latency_ms = int((time.time() - start_time) * 1000)
-            output_text = response.choices[0].message.content
+            latency_ms = int((time.time() - start_time) * 1000) - meta.get("queue_wait_ms", 0)
+            message = response.choices[0].message
+            output_text = message.content or ""
             token_in = response.usage.prompt_tokens
             token_out = response.usage.completion_tokens
             
-            try:
-                parsed_json = json.loads(output_text)
-                # Validate against schema
-                PlannerOutput(**parsed_json)
-            except Exception as e:
-                parsed_json = {"error": str(e)}
-            
-            return output_text, parsed_json, token_in, token_out, latency_ms
+            if getattr(message, "refusal", None):
+                # Structured outputs report a refusal instead of schema-conforming content
+                return LLMResult(
+                    output_text, None, f"Model refused: {message.refusal}", token_in, token_out, latency_ms
+                )
+            # Validate against schema once, repairing common defects locally
+            return parse_result("planner", output_text, token_in, token_out, latency_ms, meta)
         except Exception as e:
-            latency_ms = int((time.time() - start_time) * 1000)
+            latency_ms = int((time.time() - start_time) * 1000) - meta.get("queue_wait_ms", 0)
             error_msg = f"OpenAI API error: {str(e)}"
-            parsed_json = {"error": error_msg, "type": type(e).__name__}
-            return error_msg, parsed_json, 0, 0, latency_ms
+            meta["error_type"] = type(e).__name__
+            return LLMResult(error_msg, None, error_msg, 0, 0, latency_ms)
 
 
 class MockLLMProvider(LLMProvider):
@@ -125,7 +472,8 @@ class MockLLMProvider(LLMProvider):
         prompt_text: str,
         context: Dict[str, Any],
         model: str,
-    ) -> tuple[str, Dict[str, Any], int, int, int]:
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
         # Mock deterministic response
         output_json = {
             "memories": [
@@ -144,14 +492,15 @@ class MockLLMProvider(LLMProvider):
             "notes": "Mock extraction"
         }
         output_text = json.dumps(output_json, indent=2)
-        return output_text, output_json, 100, 50, 200
+        return parse_result("extractor", output_text, 100, 50, 200, {} if meta is None else meta)
 
     async def call_planner(
         self,
         prompt_text: str,
         context: Dict[str, Any],
         model: str,
-    ) -> tuple[str, Dict[str, Any], int, int, int]:
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
         output_json = {
             "questions": [
                 {
@@ -163,14 +512,37 @@ class MockLLMProvider(LLMProvider):
             ]
         }
         output_text = json.dumps(output_json, indent=2)
-        return output_text, output_json, 100, 30, 150
+        return parse_result("planner", output_text, 100, 30, 150, {} if meta is None else meta)
 
 
-def get_llm_provider() -> LLMProvider:
+def create_llm_provider() -> LLMProvider:
     provider_type = os.getenv("LLM_PROVIDER", "openai")
     if provider_type == "mock":
         return MockLLMProvider()
     elif provider_type == "openai":
         return OpenAIProvider()
+    elif provider_type == "router":
+        from app.llm_router import create_routing_provider
+        return create_routing_provider()
     else:
         raise ValueError(f"Unknown LLM provider: {provider_type}")
+
+
+# Один провайдер на процесс: создается при старте приложения (lifespan)
+# или при первом обращении из worker / скриптов.
+_llm_provider: Optional[LLMProvider] = None
+
+
+def get_llm_provider() -> LLMProvider:
+    """Return the process-wide provider. Also used as a FastAPI dependency."""
+    global _llm_provider
+    if _llm_provider is None:
+        _llm_provider = create_llm_provider()
+    return _llm_provider
+
+
+async def close_llm_provider():
+    global _llm_provider
+    if _llm_provider is not None:
+        await _llm_provider.aclose()
+        _llm_provider = None
@@ -0,0 +1,273 @@
+"""
+Routing provider: one logical LLM provider over several backends.
+
+Backends are configured with LLM_BACKENDS (used when LLM_PROVIDER=router), a
+JSON list such as
+
+    [
+      {"name": "openai", "model": "gpt-4o-mini"},
+      {"name": "vllm", "base_url": "http://vllm:8000/v1", "api_key": "none",
+       "model": "Qwen/Qwen2.5-7B-Instruct", "prompts": ["extractor"]},
+      {"name": "mock", "type": "mock"}
+    ]
+
+- type: "openai" (default, any OpenAI-compatible server) or "mock"
+- base_url / api_key / api_key_env: connection of an openai backend
+- model: model used on this backend; without it the requested model is sent
+- prompts: restrict the backend to these prompt names
+
+For every call the backends are ranked by a rolling latency / error EWMA kept
+per (backend, prompt). The best healthy backend is tried first, the others
+follow as fallback when a call fails. The backend and model that answered are
+reported as meta["model"] ("vllm:Qwen/Qwen2.5-7B-Instruct") and stored in
+PromptRun.model, on cache hits too (the cache keeps it as LLMResult.model);
+meta["route"] lists every backend tried.
+"""
+import json
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from app.llm_provider import LLMProvider, LLMResult, MockLLMProvider, OpenAIProvider
+
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "[]")
+# Smoothing factor of the latency / error EWMA: higher reacts faster
+LLM_ROUTER_EWMA_ALPHA = float(os.getenv("LLM_ROUTER_EWMA_ALPHA", "0.2"))
+# Backends above this error rate are only used as fallback
+LLM_ROUTER_MAX_ERROR_RATE = float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", "0.5"))
+# Share of calls sent to a random healthy backend so the others keep fresh latency samples
+LLM_ROUTER_EXPLORE_RATE = float(os.getenv("LLM_ROUTER_EXPLORE_RATE", "0.05"))
+# An error counts as this many seconds of latency when ranking
+ERROR_PENALTY_SECONDS = 30.0
+
+ProviderCall = Callable[[LLMProvider, str, Dict[str, Any]], Awaitable[LLMResult]]
+
+
+class BackendHealth:
+    """Rolling latency and error rate of one backend for one prompt"""
+
+    def __init__(self, alpha: float = LLM_ROUTER_EWMA_ALPHA):
+        self.alpha = alpha
+        self.latency: Optional[float] = None  # seconds
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, latency: float, ok: bool):
+        self.calls += 1
+        if not ok:
+            self.errors += 1
+        else:
+            # Failed calls often return fast, they must not make a backend look quick
+            self.latency = latency if self.latency is None else (
+                self.alpha * latency + (1 - self.alpha) * self.latency
+            )
+        self.error_rate = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * self.error_rate
+
+    @property
+    def healthy(self) -> bool:
+        return self.error_rate < LLM_ROUTER_MAX_ERROR_RATE
+
+    def score(self) -> float:
+        """Expected cost of a call in seconds, lower is better; unknown backends go first"""
+        if self.latency is None:
+            return self.error_rate * ERROR_PENALTY_SECONDS
+        return self.latency + self.error_rate * ERROR_PENALTY_SECONDS
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency_ms": int(self.latency * 1000) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "healthy": self.healthy,
+        }
+
+
+class Backend:
+    def __init__(
+        self,
+        name: str,
+        provider: LLMProvider,
+        model: Optional[str] = None,
+        prompts: Optional[List[str]] = None,
+    ):
+        self.name = name
+        self.provider = provider
+        self.model = model
+        self.prompts = set(prompts) if prompts else None
+        self.health: Dict[str, BackendHealth] = {}
+
+    def serves(self, prompt_name: str) -> bool:
+        return self.prompts is None or prompt_name in self.prompts
+
+    def health_for(self, prompt_name: str) -> BackendHealth:
+        if prompt_name not in self.health:
+            self.health[prompt_name] = BackendHealth()
+        return self.health[prompt_name]
+
+
+class RoutingLLMProvider(LLMProvider):
+    """Sends each call to the fastest healthy backend, falling back to the next on errors"""
+
+    def __init__(self, backends: List[Backend], explore_rate: float = LLM_ROUTER_EXPLORE_RATE):
+        if not backends:
+            raise ValueError("RoutingLLMProvider needs at least one backend (LLM_BACKENDS)")
+        self.backends = backends
+        self.explore_rate = explore_rate
+
+    def rank(self, prompt_name: str) -> List[Backend]:
+        candidates = [b for b in self.backends if b.serves(prompt_name)] or list(self.backends)
+        healthy = sorted(
+            (b for b in candidates if b.health_for(prompt_name).healthy),
+            key=lambda b: b.health_for(prompt_name).score(),
+        )
+        unhealthy = sorted(
+            (b for b in candidates if not b.health_for(prompt_name).healthy),
+            key=lambda b: b.health_for(prompt_name).error_rate,
+        )
+        if len(healthy) > 1 and random.random() < self.explore_rate:
+            explored = random.choice(healthy[1:])
+            healthy.remove(explored)
+            healthy.insert(0, explored)
+        return healthy + unhealthy
+
+    async def _route(
+        self,
+        prompt_name: str,
+        model: str,
+        meta: Optional[Dict[str, Any]],
+        call: ProviderCall,
+    ) -> LLMResult:
+        meta = {} if meta is None else meta
+        route: List[Dict[str, Any]] = []
+        result = None
+        backend_meta: Dict[str, Any] = {}
+        for backend in self.rank(prompt_name):
+            backend_model = backend.model or model
+            backend_meta = {}
+            start = time.monotonic()
+            result = await call(backend.provider, backend_model, backend_meta)
+            elapsed = time.monotonic() - start
+            failed = bool(backend_meta.get("error_type"))
+            # Invalid output lowers the backend's rank but is returned as is
+            ok = not failed and result.output is not None
+            backend.health_for(prompt_name).record(elapsed, ok)
+            route.append({
+                "backend": backend.name,
+                "model": backend_model,
+                "outcome": "ok" if ok else (backend_meta["error_type"] if failed else "invalid_output"),
+                "elapsed_ms": int(elapsed * 1000),
+            })
+            if not failed:
+                break
+        # Call details of the backend that answered (or failed last)
+        meta.update(backend_meta)
+        meta["model"] = f"{route[-1]['backend']}:{route[-1]['model']}"
+        meta["route"] = route
+        result.model = meta["model"]
+        return result
+
+    async def call_extractor(
+        self,
+        prompt_text: str,
+        context: Dict[str, Any],
+        model: str,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
+        return await self._route(
+            "extractor", model, meta,
+            lambda provider, backend_model, backend_meta: provider.call_extractor(
+                prompt_text, context, backend_model, meta=backend_meta
+            ),
+        )
+
+    async def call_planner(
+        self,
+        prompt_text: str,
+        context: Dict[str, Any],
+        model: str,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
+        return await self._route(
+            "planner", model, meta,
+            lambda provider, backend_model, backend_meta: provider.call_planner(
+                prompt_text, context, backend_model, meta=backend_meta
+            ),
+        )
+
+    async def stream_extractor(
+        self,
+        prompt_text: str,
+        context: Dict[str, Any],
+        model: str,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        """Stream from the best backend; fall back only while nothing was yielded yet"""
+        meta = {} if meta is None else meta
+        route: List[Dict[str, Any]] = []
+        backend_meta: Dict[str, Any] = {}
+        for backend in self.rank("extractor"):
+            backend_model = backend.model or model
+            backend_meta = {}
+            start = time.monotonic()
+            yielded = False
+            async for chunk in backend.provider.stream_extractor(
+                prompt_text, context, backend_model, meta=backend_meta
+            ):
+                yielded = True
+                yield chunk
+            elapsed = time.monotonic() - start
+            failed = bool(backend_meta.get("error_type"))
+            backend.health_for("extractor").record(elapsed, not failed)
+            route.append({
+                "backend": backend.name,
+                "model": backend_model,
+                "outcome": backend_meta["error_type"] if failed else "ok",
+                "elapsed_ms": int(elapsed * 1000),
+            })
+            if not failed or yielded:
+                break
+        meta.update(backend_meta)
+        meta["model"] = f"{route[-1]['backend']}:{route[-1]['model']}"
+        meta["route"] = route
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "provider": type(self).__name__,
+            "backends": {
+                backend.name: {
+                    "model": backend.model,
+                    "prompts": sorted(backend.prompts) if backend.prompts else None,
+                    "health": {name: h.stats() for name, h in backend.health.items()},
+                    "provider": backend.provider.stats(),
+                }
+                for backend in self.backends
+            },
+        }
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.provider.aclose()
+
+
+def create_routing_provider(config: Optional[str] = None) -> RoutingLLMProvider:
+    backends = []
+    for entry in json.loads(config or LLM_BACKENDS):
+        backend_type = entry.get("type", "openai")
+        if backend_type == "mock":
+            provider: LLMProvider = MockLLMProvider()
+        elif backend_type == "openai":
+            api_key = entry.get("api_key")
+            if not api_key and entry.get("api_key_env"):
+                api_key = os.getenv(entry["api_key_env"])
+            provider = OpenAIProvider(api_key=api_key, base_url=entry.get("base_url"))
+        else:
+            raise ValueError(f"Unknown LLM backend type: {backend_type}")
+        backends.append(Backend(
+            name=entry.get("name", backend_type),
+            provider=provider,
+            model=entry.get("model"),
+            prompts=entry.get("prompts"),
+        ))
+    return RoutingLLMProvider(backends)
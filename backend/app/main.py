@@ -1,12 +1,34 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.database import engine, Base
-from app.routers import sessions, memories, persons, chapters, prompt_runs, questions, users
+from app.routers import sessions, memories, persons, chapters, prompt_runs, questions, users, jobs, llm, imports
+from app.worker import JobWorkerPool, JOB_WORKERS
+from app.llm_provider import get_llm_provider, close_llm_provider
+from app.events import EventListener, get_event_bus
 
 # Create tables
 Base.metadata.create_all(bind=engine)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One LLM provider (and HTTP connection pool) for all requests and workers
+    provider = get_llm_provider()
+    # Background workers for mode=async message processing (JOB_WORKERS=0 disables)
+    worker_pool = JobWorkerPool(JOB_WORKERS, provider)
+    worker_pool.start()
+    # Session events (pg_notify) from this and other processes, for SSE clients
+    event_listener = EventListener(get_event_bus())
+    await event_listener.start()
+    yield
+    await event_listener.stop()
+    await worker_pool.stop()
+    await close_llm_provider()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="LifeBook Lab Console API",
     description="Developer-facing API for debugging AI memory extraction",
     version="1.0.0",
@@ -34,6 +56,9 @@ app.include_router(persons.router, prefix="/api/persons", tags=["persons"])
 app.include_router(chapters.router, prefix="/api/chapters", tags=["chapters"])
 app.include_router(prompt_runs.router, prefix="/api/prompt-runs", tags=["prompt-runs"])
 app.include_router(questions.router, prefix="/api/questions", tags=["questions"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(imports.router, prefix="/api/imports", tags=["imports"])
+app.include_router(llm.router, prefix="/api/llm", tags=["llm"])
 
 
 @app.get("/")
@@ -0,0 +1,155 @@
+"""
+Cost-aware model selection per prompt.
+
+MODEL_POLICIES configures a small and a large model per prompt name, or per
+"name:version" (which wins over the name):
+
+    {
+      "extractor": {"small": "gpt-4o-mini", "large": "gpt-5.2", "max_message_tokens": 200},
+      "planner": {"small": "gpt-4o-mini"}
+    }
+
+The small model is used when the message and the packed context are small
+enough and its recent parse_ok rate for this prompt (from prompt_runs) is good
+enough; otherwise the large model. A small-model answer that fails validation
+is escalated: the call is repeated on the large model. Prompts without a
+policy use OPENAI_MODEL as before.
+
+Every decision (model, tier, reason, inputs) is stored in
+PromptRun.call_meta["policy"].
+"""
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import desc
+from sqlalchemy.orm import Session
+from app.context_packer import get_token_budget
+from app.models import PromptRun
+
+MODEL_POLICIES: Dict[str, Dict[str, Any]] = json.loads(os.getenv("MODEL_POLICIES", "{}"))
+# Recent runs per prompt version used for the parse_ok rate
+MODEL_POLICY_WINDOW = int(os.getenv("MODEL_POLICY_WINDOW", "200"))
+MODEL_POLICY_STATS_TTL_SECONDS = int(os.getenv("MODEL_POLICY_STATS_TTL_SECONDS", "300"))
+
+DEFAULT_MAX_MESSAGE_TOKENS = 200
+DEFAULT_MIN_PARSE_OK_RATE = 0.9
+# Below this many runs the small model is trusted, so it collects its own history
+DEFAULT_MIN_SAMPLES = 20
+
+
+@dataclass
+class ModelDecision:
+    model: str
+    tier: str  # "small" | "large" | "default"
+    reason: str
+    message_tokens: int = 0
+    context_tokens: int = 0
+    parse_ok_rate: Optional[float] = None
+    samples: int = 0
+    escalated_from_run_id: Optional[int] = None
+    escalate_to: Optional[str] = field(default=None, repr=False)
+
+    def to_meta(self) -> Dict[str, Any]:
+        meta = asdict(self)
+        meta.pop("escalate_to")
+        return {key: value for key, value in meta.items() if value is not None}
+
+
+class ModelPolicy:
+    def __init__(self, default_model: str, policies: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.default_model = default_model
+        self.policies = MODEL_POLICIES if policies is None else policies
+        # (prompt_name, prompt_version) -> (expires_at, {model: (ok, total)})
+        self._rates: Dict[Tuple[str, str], Tuple[float, Dict[str, Tuple[int, int]]]] = {}
+
+    def config(self, prompt_name: str, version: str) -> Optional[Dict[str, Any]]:
+        return self.policies.get(f"{prompt_name}:{version}") or self.policies.get(prompt_name)
+
+    def parse_ok_rates(self, db: Session, prompt_name: str, version: str) -> Dict[str, Tuple[int, int]]:
+        """(parse_ok runs, runs) per model over the recent window, cached per process"""
+        key = (prompt_name, version)
+        cached = self._rates.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        rows = db.query(PromptRun.model, PromptRun.parse_ok).filter(
+            PromptRun.prompt_name == prompt_name,
+            PromptRun.prompt_version == version,
+            # Provider outages say nothing about the model's answers
+            PromptRun.call_meta["error_type"].as_string().is_(None)
+        ).order_by(desc(PromptRun.id)).limit(MODEL_POLICY_WINDOW).all()
+
+        rates: Dict[str, Tuple[int, int]] = {}
+        for model, parse_ok in rows:
+            # Routed runs are stored as "backend:model"
+            model = model.split(":", 1)[-1]
+            ok, total = rates.get(model, (0, 0))
+            rates[model] = (ok + bool(parse_ok), total + 1)
+        self._rates[key] = (time.monotonic() + MODEL_POLICY_STATS_TTL_SECONDS, rates)
+        return rates
+
+    def choose(
+        self,
+        db: Session,
+        prompt_name: str,
+        version: str,
+        context_tokens: Dict[str, int],
+    ) -> ModelDecision:
+        """Pick the model for a call from the packed context's token usage"""
+        config = self.config(prompt_name, version)
+        message_tokens = context_tokens.get("message_text", 0)
+        total_tokens = context_tokens.get("total", 0)
+        if not config or not config.get("small"):
+            return ModelDecision(self.default_model, "default", "no policy", message_tokens, total_tokens)
+
+        small = config["small"]
+        large = config.get("large", self.default_model)
+        decision = ModelDecision(large, "large", "", message_tokens, total_tokens)
+
+        max_message_tokens = config.get("max_message_tokens", DEFAULT_MAX_MESSAGE_TOKENS)
+        max_context_tokens = config.get("max_context_tokens", get_token_budget(small))
+        if message_tokens > max_message_tokens:
+            decision.reason = f"message {message_tokens} > {max_message_tokens} tokens"
+            return decision
+        if total_tokens > max_context_tokens:
+            decision.reason = f"context {total_tokens} > {max_context_tokens} tokens"
+            return decision
+
+        ok, total = self.parse_ok_rates(db, prompt_name, version).get(small, (0, 0))
+        decision.samples = total
+        if total:
+            decision.parse_ok_rate = round(ok / total, 3)
+        min_rate = config.get("min_parse_ok_rate", DEFAULT_MIN_PARSE_OK_RATE)
+        if total >= config.get("min_samples", DEFAULT_MIN_SAMPLES) and ok / total < min_rate:
+            decision.reason = f"{small} parse_ok {ok}/{total} < {min_rate}"
+            return decision
+
+        decision.model = small
+        decision.tier = "small"
+        decision.reason = "small message and context"
+        if config.get("escalate", True) and large != small:
+            decision.escalate_to = large
+        return decision
+
+    def escalate(self, decision: ModelDecision, failed_run_id: int) -> Optional[ModelDecision]:
+        """Large-model decision for a small-model answer that failed validation"""
+        if not decision.escalate_to:
+            return None
+        return ModelDecision(
+            decision.escalate_to, "large", f"escalated: {decision.model} output failed validation",
+            decision.message_tokens, decision.context_tokens,
+            escalated_from_run_id=failed_run_id,
+        )
+
+
+_model_policy: Optional[ModelPolicy] = None
+
+
+def get_model_policy() -> ModelPolicy:
+    """Return the process-wide policy (keeps the parse_ok stats cache)"""
+    global _model_policy
+    if _model_policy is None:
+        _model_policy = ModelPolicy(os.getenv("OPENAI_MODEL", "gpt-5.2"))
+    return _model_policy
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, JSON, ARRAY
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, JSON, ARRAY, Index, LargeBinary, text
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
 from app.database import Base
+from app.names import normalize_name
 
 
 class User(Base):
@@ -12,6 +13,10 @@ class User(Base):
     locale = Column(String, default="en")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
+
     sessions = relationship("Session", back_populates="user")
     memories = relationship("Memory", back_populates="user")
     persons = relationship("Person", back_populates="user")
@@ -26,6 +31,11 @@ class Session(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_sessions_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_sessions_created_at_id", "created_at", "id"),
+    )
+
     user = relationship("User", back_populates="sessions")
     messages = relationship("Message", back_populates="session")
     memories = relationship("Memory", back_populates="session")
@@ -42,6 +52,10 @@ class Message(Base):
     content_text = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_messages_session_id_created_at", "session_id", "created_at"),
+    )
+
     session = relationship("Session", back_populates="messages")
     memories = relationship("Memory", back_populates="source_message")
     prompt_runs = relationship("PromptRun", back_populates="message")
@@ -62,6 +76,11 @@ class Memory(Base):
     importance_score = Column(Float, default=0.5)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_memories_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_memories_session_id_created_at_id", "session_id", "created_at", "id"),
+    )
+
     user = relationship("User", back_populates="memories")
     session = relationship("Session", back_populates="memories")
     source_message = relationship("Message", back_populates="memories")
@@ -78,10 +97,21 @@ class Person(Base):
     type = Column(String, nullable=False)  # "family" | "friend" | "romance" | "colleague" | "other"
     first_seen_memory_id = Column(Integer, ForeignKey("memories.id"), nullable=True)
     notes = Column(Text, nullable=True)
+    normalized_name = Column(String, nullable=True)  # trigram-indexed, see names.normalize_name
+
+    __table_args__ = (
+        Index("ix_persons_user_id_type", "user_id", "type"),
+    )
 
     user = relationship("User", back_populates="persons")
+    first_seen_memory = relationship("Memory", foreign_keys=[first_seen_memory_id])
     memories = relationship("MemoryPerson", back_populates="person")
 
+    @validates("display_name")
+    def _set_normalized_name(self, key, value):
+        self.normalized_name = normalize_name(value)
+        return value
+
 
 class Chapter(Base):
     __tablename__ = "chapters"
@@ -92,10 +122,20 @@ class Chapter(Base):
     order_index = Column(Integer, default=0)
     period_text = Column(String, nullable=True)
     status = Column(String, default="draft")  # "draft" | "ready"
+    normalized_title = Column(String, nullable=True)  # trigram-indexed, see names.normalize_name
+
+    __table_args__ = (
+        Index("ix_chapters_user_id_order_index", "user_id", "order_index"),
+    )
 
     user = relationship("User", back_populates="chapters")
     memories = relationship("MemoryChapter", back_populates="chapter")
 
+    @validates("title")
+    def _set_normalized_title(self, key, value):
+        self.normalized_title = normalize_name(value)
+        return value
+
 
 class MemoryPerson(Base):
     __tablename__ = "memory_person"
@@ -104,6 +144,10 @@ class MemoryPerson(Base):
     person_id = Column(Integer, ForeignKey("persons.id"), primary_key=True)
     confidence = Column(Float, default=0.5)
 
+    __table_args__ = (
+        Index("ix_memory_person_person_id", "person_id"),
+    )
+
     memory = relationship("Memory", back_populates="persons")
     person = relationship("Person", back_populates="memories")
 
@@ -115,6 +159,10 @@ class MemoryChapter(Base):
     chapter_id = Column(Integer, ForeignKey("chapters.id"), primary_key=True)
     confidence = Column(Float, default=0.5)
 
+    __table_args__ = (
+        Index("ix_memory_chapter_chapter_id", "chapter_id"),
+    )
+
     memory = relationship("Memory", back_populates="chapters")
     chapter = relationship("Chapter", back_populates="memories")
 
@@ -133,6 +181,12 @@ class QuestionQueue(Base):
     status = Column(String, default="pending")  # "pending" | "asked" | "dismissed"
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_question_queue_user_id_status_created_at_id", "user_id", "status", "created_at", "id"),
+        Index("ix_question_queue_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_question_queue_session_id_created_at_id", "session_id", "created_at", "id"),
+    )
+
     user = relationship("User", back_populates="questions")
     session = relationship("Session", back_populates="questions")
 
@@ -154,7 +208,106 @@ class PromptRun(Base):
     token_in = Column(Integer, nullable=True)
     token_out = Column(Integer, nullable=True)
     latency_ms = Column(Integer, nullable=True)
+    cache_hits = Column(Integer, default=0)
+    cache_misses = Column(Integer, default=0)
+    # Содержимое в таблице blobs: system prompt и большие output_text хранятся один раз
+    system_prompt_hash = Column(String(64), ForeignKey("blobs.hash"), nullable=True)
+    output_text_hash = Column(String(64), ForeignKey("blobs.hash"), nullable=True)
+    context_tokens = Column(JSON, nullable=True)  # estimated tokens per context section + total/budget
+    call_meta = Column(JSON, nullable=True)  # provider call details: queue_wait_ms, ...
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_prompt_runs_session_id_created_at_id", "session_id", "created_at", "id"),
+        # Recent runs per prompt version for the model policy's parse_ok rates
+        Index("ix_prompt_runs_prompt_name_version_id", "prompt_name", "prompt_version", "id"),
+    )
+
     session = relationship("Session", back_populates="prompt_runs")
     message = relationship("Message", back_populates="prompt_runs")
+
+
+class ProcessingJob(Base):
+    __tablename__ = "processing_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # "message": extractor for one message; "planner": debounced planner run for the session
+    kind = Column(String, nullable=False, default="message", server_default="message")
+    session_id = Column(Integer, ForeignKey("sessions.id"), nullable=False)
+    # Set for message jobs created by a bulk import; the worker bounds their concurrency
+    import_id = Column(Integer, ForeignKey("imports.id"), nullable=True)
+    # For planner jobs: the latest message whose memories triggered the run
+    message_id = Column(Integer, ForeignKey("messages.id"), nullable=False)
+    status = Column(String, nullable=False, default="queued")  # "queued" | "running" | "done" | "failed"
+    stage = Column(String, nullable=True)  # "extracting" | "planning" | "done"
+    extractor_version = Column(String, nullable=True)
+    planner_version = Column(String, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    result_json = Column(JSON, nullable=True)
+    error_text = Column(Text, nullable=True)
+    run_after = Column(DateTime(timezone=True), server_default=func.now())
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_processing_jobs_status_run_after", "status", "run_after"),
+        # At most one queued planner job per session: new triggers coalesce into it
+        Index(
+            "ux_processing_jobs_queued_planner", "session_id", unique=True,
+            postgresql_where=text("kind = 'planner' AND status = 'queued'")
+        ),
+        Index(
+            "ix_processing_jobs_import_id_status", "import_id", "status",
+            postgresql_where=text("import_id IS NOT NULL")
+        ),
+    )
+
+    session = relationship("Session")
+    message = relationship("Message")
+
+
+class Import(Base):
+    __tablename__ = "imports"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("sessions.id"), nullable=False)
+    format = Column(String, nullable=False)  # "text" | "markdown" | "ndjson"
+    status = Column(String, nullable=False, default="uploading")  # "uploading" | "processing" | "failed"
+    bytes_received = Column(Integer, nullable=False, default=0)
+    messages_total = Column(Integer, nullable=False, default=0)
+    jobs_total = Column(Integer, nullable=False, default=0)
+    error_text = Column(Text, nullable=True)
+    uploaded_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_imports_session_id_created_at", "session_id", "created_at"),
+    )
+
+    session = relationship("Session")
+
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+
+    key = Column(String(64), primary_key=True)  # sha256(prompt_name, prompt_version, model, context)
+    prompt_name = Column(String, nullable=False)
+    prompt_version = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    served_model = Column(String, nullable=True)  # "backend:model" that answered, with LLM_PROVIDER=router
+    output_text = Column(Text, nullable=False)
+    output_json = Column(JSON, nullable=False)
+    token_in = Column(Integer, nullable=True)
+    token_out = Column(Integer, nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    hash = Column(String(64), primary_key=True)  # sha256 of the uncompressed content
+    data = Column(LargeBinary, nullable=False)  # zlib-compressed utf-8 content
+    size = Column(Integer, nullable=False)  # uncompressed size in bytes
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,35 @@
+"""
+Name normalization and trigram similarity for person / chapter matching.
+
+normalize_name() is what gets stored in persons.normalized_name and
+chapters.normalized_title; trigram_similarity() mirrors pg_trgm's
+similarity() for entities that are not in the database yet.
+"""
+import re
+from typing import Set
+
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def normalize_name(name: str) -> str:
+    """Casefold, fold ё to е, drop punctuation and collapse whitespace"""
+    name = name.casefold().replace("ё", "е")
+    return " ".join(_NON_WORD.sub(" ", name).split())
+
+
+def trigrams(text: str) -> Set[str]:
+    """pg_trgm style trigrams: every word padded with two leading and one trailing space"""
+    result = set()
+    for word in normalize_name(text).split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            result.add(padded[i:i + 3])
+    return result
+
+
+def trigram_similarity(a: str, b: str) -> float:
+    a_trigrams = trigrams(a)
+    b_trigrams = trigrams(b)
+    if not a_trigrams or not b_trigrams:
+        return 0.0
+    return len(a_trigrams & b_trigrams) / len(a_trigrams | b_trigrams)
@@ -0,0 +1,63 @@
+"""
+Keyset (cursor) pagination on (created_at, id).
+
+The cursor is an opaque url-safe token encoding the (created_at, id) of the
+last returned row; the next page continues strictly after it, so every page
+costs one bounded index range scan regardless of table size.
+"""
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(
+    query: Query,
+    created_at_column,
+    id_column,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    descending: bool = True
+) -> Tuple[List[Any], Optional[str]]:
+    """Apply keyset pagination to query. Returns (items, next_cursor)."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    key = tuple_(created_at_column, id_column)
+
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        if descending:
+            query = query.filter(key < tuple_(created_at, row_id))
+        else:
+            query = query.filter(key > tuple_(created_at, row_id))
+
+    if descending:
+        query = query.order_by(created_at_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(created_at_column, id_column)
+
+    rows = query.limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, created_at_column.key), getattr(last, id_column.key))
+    return items, next_cursor
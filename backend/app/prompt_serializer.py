@@ -0,0 +1,57 @@
+"""
+Compact, deterministic serialization of prompt contexts.
+
+The user message sent to the model is the context as JSON. It is emitted
+without indentation, with non-ASCII text kept as is (\\u escapes cost several
+tokens per Cyrillic letter) and with a fixed section order: sections that
+rarely change between calls (known chapters and persons) come first, the new
+message comes last. Together with the constant system prompt this keeps a long
+identical prefix across calls, which is what providers' automatic prompt
+caching matches on.
+"""
+import json
+from typing import Any, Dict, List
+
+# Section order per prompt: stable sections first, volatile ones last.
+# Keys not listed here go between them, sorted by name.
+SECTION_ORDER: Dict[str, Dict[str, List[str]]] = {
+    "extractor": {
+        "stable": ["known_chapters", "known_persons"],
+        # recent_memories gains the memories of every message: volatile like in the planner
+        "volatile": ["session_id", "recent_memories", "message_history", "message_part", "message_text"],
+    },
+    "planner": {
+        "stable": ["chapters", "known_gaps"],
+        "volatile": ["recent_memories"],
+    },
+}
+
+# Within these sections items are ordered by id, not by rank, so the packed
+# subset of persons / chapters serializes the same way from call to call
+ID_ORDERED_SECTIONS = {"known_chapters", "known_persons", "chapters"}
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), sort_keys=True, default=str)
+
+
+def ordered_keys(prompt_name: str, context: Dict[str, Any]) -> List[str]:
+    order = SECTION_ORDER.get(prompt_name, {"stable": [], "volatile": []})
+    listed = set(order["stable"]) | set(order["volatile"])
+    middle = sorted(key for key in context if key not in listed)
+    return (
+        [key for key in order["stable"] if key in context]
+        + middle
+        + [key for key in order["volatile"] if key in context]
+    )
+
+
+def serialize_context(prompt_name: str, context: Dict[str, Any]) -> str:
+    """Serialize context for the user message of prompt_name"""
+    parts = []
+    for key in ordered_keys(prompt_name, context):
+        value = context[key]
+        if key in ID_ORDERED_SECTIONS and isinstance(value, list):
+            value = sorted(value, key=lambda item: item.get("id") or 0 if isinstance(item, dict) else 0)
+        parts.append(f"{_dumps(key)}:{_dumps(value)}")
+    return "{" + ",".join(parts) + "}"
@@ -0,0 +1,214 @@
+"""
+Per-model concurrency and rate limiting for LLM calls.
+
+Every model gets a FIFO semaphore (max concurrent requests) and two token
+buckets: requests per minute and tokens per minute. A call reserves its
+estimated tokens (prompt + max output) up front; the difference to the real
+usage is settled when the call finishes. A call that ends without usage is
+charged its prompt estimate if the request was sent (cancelled stream, losing
+hedge, timeout) and refunded if it never reached the provider. Waiters are
+served strictly in arrival order, so a burst queues up and drains at the
+provider's limit instead of turning into a wave of 429s.
+
+Limits are per process; with standalone workers (`python -m app.worker`)
+configure each process with its share of the account limits.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+# Per-model overrides, e.g. {"gpt-4o": {"concurrency": 8, "rpm": 500, "tpm": 30000}}; 0 disables a limit
+LLM_RATE_LIMITS: Dict[str, Dict[str, int]] = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+
+
+class FairSemaphore:
+    """Semaphore that hands out permits strictly in FIFO order"""
+
+    def __init__(self, value: int):
+        self.value = value
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self):
+        if self.value > 0 and not self._waiters:
+            self.value -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The permit was handed over just before cancellation
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.value += 1
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at per_minute / 60 per second"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        # asyncio.Lock wakes waiters in FIFO order, so the bucket is fair too
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def adjust(self, delta: float):
+        """Settle a reservation: positive delta takes more tokens (may go into debt), negative refunds"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+    def available(self) -> int:
+        self._refill()
+        return int(self.tokens)
+
+
+class Reservation:
+    def __init__(self, estimated_tokens: int, prompt_tokens: int, wait_ms: int):
+        self.estimated_tokens = estimated_tokens
+        self.prompt_tokens = prompt_tokens
+        self.wait_ms = wait_ms
+        self.actual_tokens: Optional[int] = None
+        # Set by the caller while the request is with the provider
+        self.sent = False
+
+
+class ModelLimiter:
+    def __init__(self, model: str, concurrency: int, rpm: int, tpm: int):
+        self.model = model
+        self.concurrency = concurrency
+        self.rpm = rpm
+        self.tpm = tpm
+        self.semaphore = FairSemaphore(concurrency) if concurrency > 0 else None
+        self.requests_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens_bucket = TokenBucket(tpm) if tpm > 0 else None
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.requests = 0
+        self.total_wait_ms = 0
+        self.max_wait_ms = 0
+        self._recent_waits: Deque[int] = deque(maxlen=500)
+
+    @asynccontextmanager
+    async def acquire(self, estimated_tokens: int, prompt_tokens: int = 0) -> AsyncIterator[Reservation]:
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            if self.semaphore:
+                await self.semaphore.acquire()
+            try:
+                if self.requests_bucket:
+                    await self.requests_bucket.acquire(1)
+                if self.tokens_bucket:
+                    await self.tokens_bucket.acquire(estimated_tokens)
+            except BaseException:
+                if self.semaphore:
+                    self.semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+
+        wait_ms = int((time.monotonic() - start) * 1000)
+        self.requests += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        self._recent_waits.append(wait_ms)
+
+        reservation = Reservation(estimated_tokens, prompt_tokens, wait_ms)
+        self.in_flight += 1
+        try:
+            yield reservation
+        finally:
+            self.in_flight -= 1
+            if self.semaphore:
+                self.semaphore.release()
+            if self.tokens_bucket:
+                if reservation.actual_tokens is not None:
+                    used = reservation.actual_tokens
+                elif reservation.sent:
+                    # Cancelled stream, losing hedge, timeout: the prompt was read at least
+                    used = reservation.prompt_tokens
+                else:
+                    # Never reached the provider (connection error, 429, 5xx): refund it all,
+                    # or retries would drain the bucket
+                    used = 0
+                self.tokens_bucket.adjust(used - estimated_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._recent_waits)
+        return {
+            "concurrency": self.concurrency,
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "requests": self.requests,
+            "avg_wait_ms": int(self.total_wait_ms / self.requests) if self.requests else 0,
+            "p95_wait_ms": waits[int(len(waits) * 0.95)] if waits else 0,
+            "max_wait_ms": self.max_wait_ms,
+            "tokens_available": self.tokens_bucket.available() if self.tokens_bucket else None,
+        }
+
+
+class RateLimiter:
+    """Per-model limiters, created on first use from env configuration"""
+
+    def __init__(self):
+        self._models: Dict[str, ModelLimiter] = {}
+
+    def for_model(self, model: str) -> ModelLimiter:
+        limiter = self._models.get(model)
+        if limiter is None:
+            config = LLM_RATE_LIMITS.get(model, {})
+            limiter = ModelLimiter(
+                model,
+                concurrency=config.get("concurrency", LLM_MAX_CONCURRENCY),
+                rpm=config.get("rpm", LLM_REQUESTS_PER_MINUTE),
+                tpm=config.get("tpm", LLM_TOKENS_PER_MINUTE),
+            )
+            self._models[model] = limiter
+        return limiter
+
+    def acquire(self, model: str, estimated_tokens: int, prompt_tokens: int = 0):
+        """async with limiter.acquire(model, tokens, prompt_tokens) as reservation: ..."""
+        return self.for_model(model).acquire(estimated_tokens, prompt_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        return {model: limiter.stats() for model, limiter in self._models.items()}
@@ -0,0 +1,273 @@
+"""
+Resilience layer for provider calls: retries, hedging and a circuit breaker.
+
+- Transient failures (connection errors, timeouts, 408/409/429/5xx) are
+  retried with exponential backoff and full jitter, honouring Retry-After.
+- Optional hedging: when an attempt runs longer than the model's recent p95
+  latency, a second identical request is started and the first response wins.
+- A per-model circuit breaker opens after consecutive transient failures and
+  fails calls immediately until a cooldown passes; then a single probe call
+  decides whether it closes again.
+
+Every attempt is appended to the `attempts` list passed in by the caller,
+which ends up in PromptRun.call_meta.
+"""
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+import openai
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+# Hedge only once the p95 is based on enough samples
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while the model's circuit is open"""
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, cooldown_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = "closed"  # "closed" | "open" | "half_open"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self.rejected = 0
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError if the call must not go out; True if it is the half-open probe"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown_seconds:
+                self.rejected += 1
+                raise CircuitOpenError("LLM circuit is open, provider considered degraded")
+            self.state = "half_open"
+            return True
+        if self.state == "half_open":
+            # Only one probe while half open
+            self.rejected += 1
+            raise CircuitOpenError("LLM circuit is half open, waiting for the probe call")
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.opened_count += 1
+
+    def release_probe(self):
+        """The probe ended without an outcome (cancelled): the next call probes again"""
+        if self.state == "half_open":
+            # opened_at is past the cooldown already
+            self.state = "open"
+
+    def record_neutral(self):
+        # A non-transient error on the probe call still proves the upstream is reachable
+        if self.state == "half_open":
+            self.record_success()
+
+
+class ModelResilience:
+    def __init__(self):
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN_SECONDS)
+        self.latencies: Deque[float] = deque(maxlen=200)
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95)]
+
+    def stats(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "circuit_opened": self.breaker.opened_count,
+            "rejected": self.breaker.rejected,
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p95_latency_ms": int(p95 * 1000) if p95 is not None else None,
+        }
+
+
+class ResilientCaller:
+    """Runs provider attempts with retries, hedging and a per-model breaker"""
+
+    def __init__(
+        self,
+        max_retries: int = LLM_MAX_RETRIES,
+        base_delay: float = LLM_RETRY_BASE_DELAY,
+        max_delay: float = LLM_RETRY_MAX_DELAY,
+        hedge: bool = LLM_HEDGE_ENABLED,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self._models: Dict[str, ModelResilience] = {}
+
+    def for_model(self, model: str) -> ModelResilience:
+        if model not in self._models:
+            self._models[model] = ModelResilience()
+        return self._models[model]
+
+    async def call(
+        self,
+        model: str,
+        attempt: Callable[[], Awaitable[Any]],
+        attempts: List[Dict[str, Any]],
+        stream: bool = False,
+    ) -> Any:
+        """Run attempt() until it succeeds, a non-transient error or retries run out.
+
+        stream=True for attempts that only open a response stream: they are
+        never hedged and their (time to first byte) latency stays out of p95.
+        """
+        state = self.for_model(model)
+        state.calls += 1
+        last_error: Optional[Exception] = None
+        for retry in range(self.max_retries + 1):
+            try:
+                probe = state.breaker.before_call()
+            except CircuitOpenError:
+                attempts.append({"attempt": len(attempts) + 1, "outcome": "circuit_open"})
+                # The circuit opened during our own retries: report the upstream error
+                if last_error is not None:
+                    raise last_error
+                raise
+            try:
+                if stream:
+                    result = await self._timed(state, attempt, attempts, hedge=False, sample=False)
+                else:
+                    result = await self._run_hedged(state, attempt, attempts)
+                state.breaker.record_success()
+                return result
+            except Exception as e:
+                if not is_transient(e):
+                    state.breaker.record_neutral()
+                    raise
+                state.breaker.record_failure()
+                last_error = e
+                if retry == self.max_retries:
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    # Full jitter: uniform(0, base * 2^retry), capped
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+                state.retries += 1
+                attempts[-1]["retry_in_ms"] = int(delay * 1000)
+                await asyncio.sleep(min(delay, self.max_delay))
+            except BaseException:
+                # Cancelled (hedge loser, client gone, speculative task): no verdict on the upstream
+                if probe:
+                    state.breaker.release_probe()
+                raise
+
+    async def _run_hedged(
+        self,
+        state: ModelResilience,
+        attempt: Callable[[], Awaitable[Any]],
+        attempts: List[Dict[str, Any]],
+    ) -> Any:
+        hedge_after = state.p95() if self.hedge else None
+        primary = asyncio.create_task(self._timed(state, attempt, attempts, hedge=False))
+        if hedge_after is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        state.hedges += 1
+        hedged = asyncio.create_task(self._timed(state, attempt, attempts, hedge=True))
+        pending = {primary, hedged}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedged:
+                            state.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            # Let the losing attempt release its limiter slot and finish its record
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _timed(
+        self,
+        state: ModelResilience,
+        attempt: Callable[[], Awaitable[Any]],
+        attempts: List[Dict[str, Any]],
+        hedge: bool,
+        sample: bool = True,
+    ) -> Any:
+        record: Dict[str, Any] = {"attempt": len(attempts) + 1, "hedge": hedge}
+        attempts.append(record)
+        start = time.monotonic()
+        try:
+            result = await attempt()
+        except asyncio.CancelledError:
+            record["outcome"] = "cancelled"
+            raise
+        except Exception as e:
+            record["outcome"] = "error"
+            record["error"] = type(e).__name__
+            status_code = getattr(e, "status_code", None)
+            if status_code:
+                record["status_code"] = status_code
+            raise
+        finally:
+            record["latency_ms"] = int((time.monotonic() - start) * 1000)
+        record["outcome"] = "ok"
+        if sample:
+            state.latencies.append(time.monotonic() - start)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {model: state.stats() for model, state in self._models.items()}
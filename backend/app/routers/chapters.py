@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import Chapter, Memory, MemoryChapter
-from app.schemas import ChapterResponse, MemoryResponse
+from app.schemas import ChapterResponse, MemoryResponse, Page
+from app.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 router = APIRouter()
 
@@ -25,16 +26,20 @@ async def get_chapter(chapter_id: int, db: Session = Depends(get_db)):
     return chapter
 
 
-@router.get("/{chapter_id}/memories", response_model=list[MemoryResponse])
-async def get_chapter_memories(chapter_id: int, db: Session = Depends(get_db)):
-    """Get all memories linked to a chapter"""
-    memory_ids = db.query(MemoryChapter.memory_id).filter(
-        MemoryChapter.chapter_id == chapter_id
-    ).all()
-    memory_ids = [m[0] for m in memory_ids]
+@router.get("/{chapter_id}/memories", response_model=Page[MemoryResponse])
+async def get_chapter_memories(
+    chapter_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = Query(None),
+    db: Session = Depends(get_db)
+):
+    """Get memories linked to a chapter, newest first"""
+    query = db.query(Memory).join(
+        MemoryChapter, MemoryChapter.memory_id == Memory.id
+    ).filter(MemoryChapter.chapter_id == chapter_id)
     
-    memories = db.query(Memory).filter(Memory.id.in_(memory_ids)).all()
-    return memories
+    memories, next_cursor = paginate(query, Memory.created_at, Memory.id, limit, cursor)
+    return {"items": memories, "next_cursor": next_cursor}
 
 
 @router.get("/{chapter_id}/coverage")
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from app.database import get_db
+from app.models import Import, ProcessingJob
+from app.schemas import ImportResponse
+
+router = APIRouter()
+
+
+@router.get("/{import_id}", response_model=ImportResponse)
+async def get_import(import_id: int, db: Session = Depends(get_db)):
+    """Get bulk import progress: upload state and processing job counts"""
+    record = db.query(Import).filter(Import.id == import_id).first()
+    if not record:
+        raise HTTPException(status_code=404, detail="Import not found")
+
+    counts = dict(
+        db.query(ProcessingJob.status, func.count(ProcessingJob.id))
+        .filter(ProcessingJob.import_id == import_id)
+        .group_by(ProcessingJob.status)
+        .all()
+    )
+    status = record.status
+    if status == "processing" and not counts.get("queued") and not counts.get("running"):
+        status = "done"
+    return ImportResponse(
+        id=record.id,
+        session_id=record.session_id,
+        format=record.format,
+        status=status,
+        bytes_received=record.bytes_received,
+        messages_total=record.messages_total,
+        jobs_total=record.jobs_total,
+        jobs_queued=counts.get("queued", 0),
+        jobs_running=counts.get("running", 0),
+        jobs_done=counts.get("done", 0),
+        jobs_failed=counts.get("failed", 0),
+        error_text=record.error_text,
+        created_at=record.created_at,
+        uploaded_at=record.uploaded_at
+    )
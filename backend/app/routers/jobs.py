@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.models import ProcessingJob
+from app.schemas import ProcessingJobResponse
+
+router = APIRouter()
+
+
+@router.get("/{job_id}", response_model=ProcessingJobResponse)
+async def get_job(job_id: int, db: Session = Depends(get_db)):
+    """Get processing job status"""
+    job = db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
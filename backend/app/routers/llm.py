@@ -0,0 +1,10 @@
+from fastapi import APIRouter, Depends
+from app.llm_provider import LLMProvider, get_llm_provider
+
+router = APIRouter()
+
+
+@router.get("/stats", response_model=dict)
+async def get_llm_stats(llm: LLMProvider = Depends(get_llm_provider)):
+    """LLM provider statistics: HTTP connection pool usage, reused connections"""
+    return llm.stats()
@@ -2,15 +2,18 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import Memory
-from app.schemas import MemoryResponse
+from app.schemas import MemoryResponse, Page
+from app.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 router = APIRouter()
 
 
-@router.get("/", response_model=list[MemoryResponse])
+@router.get("/", response_model=Page[MemoryResponse])
 async def list_memories(
     user_id: int = Query(None),
     session_id: int = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = Query(None),
     db: Session = Depends(get_db)
 ):
     """List memories with optional filters"""
@@ -20,8 +23,8 @@ async def list_memories(
     if session_id:
         query = query.filter(Memory.session_id == session_id)
     
-    memories = query.order_by(Memory.created_at.desc()).all()
-    return memories
+    memories, next_cursor = paginate(query, Memory.created_at, Memory.id, limit, cursor)
+    return {"items": memories, "next_cursor": next_cursor}
 
 
 @router.get("/{memory_id}", response_model=MemoryResponse)
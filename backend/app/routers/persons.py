@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from app.database import get_db
 from app.models import Person, Memory, MemoryPerson
-from app.schemas import PersonResponse, MemoryResponse
+from app.schemas import PersonResponse, MemoryResponse, Page
+from app.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 router = APIRouter()
 
@@ -28,16 +29,20 @@ async def get_person(person_id: int, db: Session = Depends(get_db)):
     return person
 
 
-@router.get("/{person_id}/memories", response_model=list[MemoryResponse])
-async def get_person_memories(person_id: int, db: Session = Depends(get_db)):
-    """Get all memories linked to a person"""
-    memory_ids = db.query(MemoryPerson.memory_id).filter(
-        MemoryPerson.person_id == person_id
-    ).all()
-    memory_ids = [m[0] for m in memory_ids]
+@router.get("/{person_id}/memories", response_model=Page[MemoryResponse])
+async def get_person_memories(
+    person_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = Query(None),
+    db: Session = Depends(get_db)
+):
+    """Get memories linked to a person, newest first"""
+    query = db.query(Memory).join(
+        MemoryPerson, MemoryPerson.memory_id == Memory.id
+    ).filter(MemoryPerson.person_id == person_id)
     
-    memories = db.query(Memory).filter(Memory.id.in_(memory_ids)).all()
-    return memories
+    memories, next_cursor = paginate(query, Memory.created_at, Memory.id, limit, cursor)
+    return {"items": memories, "next_cursor": next_cursor}
 
 
 @router.post("/{person_id}/merge")
@@ -1,23 +1,96 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.orm import Session, load_only
 from app.database import get_db
 from app.models import PromptRun, Session as DBSession
-from app.schemas import PromptRunResponse
+from app.schemas import PromptRunResponse, PromptRunSummary, Page
+from app.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.blob_store import get_blobs
 
 router = APIRouter()
 
+# Колонки для списка: без системного промпта и ответов модели
+SUMMARY_COLUMNS = [
+    PromptRun.id,
+    PromptRun.session_id,
+    PromptRun.message_id,
+    PromptRun.prompt_name,
+    PromptRun.prompt_version,
+    PromptRun.model,
+    PromptRun.parse_ok,
+    PromptRun.error_text,
+    PromptRun.token_in,
+    PromptRun.token_out,
+    PromptRun.latency_ms,
+    PromptRun.cache_hits,
+    PromptRun.cache_misses,
+    PromptRun.context_tokens,
+    PromptRun.call_meta,
+    PromptRun.created_at,
+]
 
-@router.get("/", response_model=list[PromptRunResponse])
+# Heavy columns that can be requested with ?fields=
+PAYLOAD_COLUMNS = {
+    "input_json": PromptRun.input_json,
+    "output_text": PromptRun.output_text,
+    "output_json": PromptRun.output_json,
+}
+
+
+# Hash references, loaded alongside payload fields to rehydrate them from blobs
+BLOB_COLUMNS = [PromptRun.system_prompt_hash, PromptRun.output_text_hash]
+
+
+def _rehydrate(db: Session, runs, items):
+    """Put blob-stored system prompts and outputs back into the serialized runs"""
+    hashes = []
+    for run, item in zip(runs, items):
+        if "input_json" in item:
+            hashes.append(run.system_prompt_hash)
+        if "output_text" in item:
+            hashes.append(run.output_text_hash)
+    blobs = get_blobs(db, hashes)
+
+    for run, item in zip(runs, items):
+        if "input_json" in item and run.system_prompt_hash in blobs:
+            item["input_json"] = {**(item["input_json"] or {}), "system_prompt": blobs[run.system_prompt_hash]}
+        if "output_text" in item and run.output_text_hash in blobs:
+            item["output_text"] = blobs[run.output_text_hash]
+    return items
+
+
+def _parse_fields(fields: str):
+    if not fields:
+        return []
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in PAYLOAD_COLUMNS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(PAYLOAD_COLUMNS)}"
+        )
+    return [PAYLOAD_COLUMNS[name] for name in dict.fromkeys(names)]
+
+
+@router.get("/", response_model=Page[PromptRunSummary], response_model_exclude_unset=True)
 async def list_prompt_runs(
     session_id: int = Query(None),
     user_id: int = Query(None),
     prompt_name: str = Query(None),
     parse_ok: bool = Query(None),
     model: str = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = Query(None),
+    fields: str = Query(None, description="Comma-separated payload fields: input_json, output_text, output_json"),
     db: Session = Depends(get_db)
 ):
-    """List prompt runs with filters"""
-    query = db.query(PromptRun)
+    """List prompt runs with filters.
+
+    Returns the summary projection; the full payload is served by GET /{run_id}
+    or selected columns via ?fields=.
+    """
+    columns = SUMMARY_COLUMNS + _parse_fields(fields)
+    query = db.query(PromptRun).options(load_only(*columns, *BLOB_COLUMNS))
     
     if session_id:
         query = query.filter(PromptRun.session_id == session_id)
@@ -29,7 +102,7 @@ async def list_prompt_runs(
             query = query.filter(PromptRun.session_id.in_(session_ids))
         else:
             # No sessions for this user, return empty
-            return []
+            return {"items": [], "next_cursor": None}
     
     if prompt_name:
         query = query.filter(PromptRun.prompt_name == prompt_name)
@@ -38,8 +111,39 @@ async def list_prompt_runs(
     if model:
         query = query.filter(PromptRun.model == model)
     
-    runs = query.order_by(PromptRun.created_at.desc()).all()
-    return runs
+    runs, next_cursor = paginate(query, PromptRun.created_at, PromptRun.id, limit, cursor)
+    # Явно собираем только загруженные колонки, чтобы не вызвать lazy load остальных
+    items = [{column.key: getattr(run, column.key) for column in columns} for run in runs]
+    return {"items": _rehydrate(db, runs, items), "next_cursor": next_cursor}
+
+
+@router.get("/speculation", response_model=dict)
+async def get_speculation_stats(session_id: int = Query(None), db: Session = Depends(get_db)):
+    """Outcomes of speculative planner runs (?speculative=true): reuse and waste rates"""
+    outcome = PromptRun.call_meta[("speculation", "outcome")].as_string()
+    query = db.query(
+        outcome,
+        func.count(PromptRun.id),
+        func.coalesce(func.sum(PromptRun.token_in + PromptRun.token_out), 0),
+        func.coalesce(func.sum(PromptRun.call_meta[("speculation", "saved_ms")].as_integer()), 0)
+    ).filter(PromptRun.prompt_name == "planner", outcome.isnot(None))
+    if session_id:
+        query = query.filter(PromptRun.session_id == session_id)
+
+    outcomes = {
+        name: {"runs": runs, "tokens": tokens, "saved_ms": saved}
+        for name, runs, tokens, saved in query.group_by(outcome).all()
+    }
+    total = sum(o["runs"] for o in outcomes.values())
+    kept = outcomes.get("kept", {}).get("runs", 0)
+    return {
+        "runs": total,
+        "outcomes": outcomes,
+        "reuse_rate": round(kept / total, 3) if total else None,
+        "waste_rate": round((total - kept) / total, 3) if total else None,
+        "wasted_tokens": sum(o["tokens"] for name, o in outcomes.items() if name != "kept"),
+        "saved_ms": outcomes.get("kept", {}).get("saved_ms", 0),
+    }
 
 
 @router.get("/{run_id}", response_model=PromptRunResponse)
@@ -48,4 +152,5 @@ async def get_prompt_run(run_id: int, db: Session = Depends(get_db)):
     run = db.query(PromptRun).filter(PromptRun.id == run_id).first()
     if not run:
         raise HTTPException(status_code=404, detail="Prompt run not found")
-    return run
+    item = PromptRunResponse.model_validate(run).model_dump()
+    return _rehydrate(db, [run], [item])[0]
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import QuestionQueue
-from app.schemas import QuestionResponse
+from app.schemas import QuestionResponse, Page
+from app.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -12,11 +13,13 @@ class QuestionStatusUpdate(BaseModel):
     status: str  # "pending" | "asked" | "dismissed"
 
 
-@router.get("/", response_model=list[QuestionResponse])
+@router.get("/", response_model=Page[QuestionResponse])
 async def list_questions(
     user_id: int = None,
     session_id: int = None,
     status: str = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = Query(None),
     db: Session = Depends(get_db)
 ):
     """List questions with optional filters"""
@@ -29,8 +32,8 @@ async def list_questions(
     if status:
         query = query.filter(QuestionQueue.status == status)
     
-    questions = query.order_by(QuestionQueue.created_at.desc()).all()
-    return questions
+    questions, next_cursor = paginate(query, QuestionQueue.created_at, QuestionQueue.id, limit, cursor)
+    return {"items": questions, "next_cursor": next_cursor}
 
 
 @router.get("/{question_id}", response_model=QuestionResponse)
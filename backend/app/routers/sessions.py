@@ -1,10 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
+from starlette.requests import ClientDisconnect
 from pydantic import BaseModel
-from app.database import get_db
-from app.models import Session as DBSession, Message, User
-from app.schemas import MessageCreate, MessageResponse, SessionResponse
-from app.service import ProcessingService
+import asyncio
+import json
+import traceback
+from app.database import get_db, SessionLocal
+from app.models import Session as DBSession, Message, User, Import
+from app.schemas import MessageCreate, MessageResponse, SessionResponse, Page
+from app.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.service import ProcessingService, LLMCallFailed
+from app.llm_provider import LLMProvider, get_llm_provider
+from app.worker import enqueue_message_job
+from app.prompts import get_prompt
+from app.events import get_event_bus
+from app.importer import IMPORT_FORMATS, ImportFormatError, ImportTooLarge, MessageImporter
+
+# Comment line sent on an idle event stream so proxies keep the connection open
+SSE_KEEPALIVE_SECONDS = 15
 
 router = APIRouter()
 
@@ -13,11 +27,20 @@ class SessionCreate(BaseModel):
     user_id: int = None
 
 
-@router.get("/", response_model=list[SessionResponse])
-async def list_sessions(db: Session = Depends(get_db)):
-    """List all sessions"""
-    sessions = db.query(DBSession).all()
-    return sessions
+@router.get("/", response_model=Page[SessionResponse])
+async def list_sessions(
+    user_id: int = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = Query(None),
+    db: Session = Depends(get_db)
+):
+    """List sessions, newest first, optionally for one user"""
+    query = db.query(DBSession)
+    if user_id:
+        query = query.filter(DBSession.user_id == user_id)
+    
+    sessions, next_cursor = paginate(query, DBSession.created_at, DBSession.id, limit, cursor)
+    return {"items": sessions, "next_cursor": next_cursor}
 
 
 @router.get("/{session_id}", response_model=SessionResponse)
@@ -60,10 +83,49 @@ async def create_session(
     return session
 
 
+@router.get("/{session_id}/events")
+async def session_events(session_id: int, request: Request, db: Session = Depends(get_db)):
+    """Live feed of a session as Server-Sent Events.
+
+    Event types: message, stage (extracting / planning / done / failed), memory,
+    person, chapter, question, prompt_run (summary) and job (async job outcome).
+    Each event's data is JSON; oversized ones carry "truncated": true and omit
+    long fields. Events are sent once the producing transaction has committed.
+    """
+    session = db.query(DBSession).filter(DBSession.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    # The stream may stay open for hours, don't keep a pooled connection for it
+    db.close()
+    
+    bus = get_event_bus()
+    queue = bus.subscribe(session_id)
+    
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                data = json.dumps(event["data"], ensure_ascii=False, default=str)
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+        finally:
+            bus.unsubscribe(session_id, queue)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/{session_id}/messages", response_model=list[MessageResponse])
 async def get_session_messages(session_id: int, db: Session = Depends(get_db)):
     """Get all messages for a session"""
-    messages = db.query(Message).filter(Message.session_id == session_id).order_by(Message.created_at).all()
+    messages = db.query(Message).filter(Message.session_id == session_id).order_by(Message.created_at, Message.id).all()
     return messages
 
 
@@ -73,24 +135,67 @@ async def create_message(
     message: MessageCreate,
     extractor_version: str = Query("v3"),
     planner_version: str = Query("v1"),
-    db: Session = Depends(get_db)
+    mode: str = Query("sync"),
+    speculative: bool = Query(False),
+    db: Session = Depends(get_db),
+    llm: LLMProvider = Depends(get_llm_provider)
 ):
-    """Process a new message through the AI pipeline"""
+    """Process a new message through the AI pipeline.
+
+    mode=sync runs the pipeline in the request; mode=async stores the message,
+    enqueues a processing job and returns 202 with the job id.
+    speculative=true (sync only) runs the planner concurrently with the extractor
+    and returns its questions when the extraction confirms them.
+    """
+    if mode not in ["sync", "async"]:
+        raise HTTPException(status_code=400, detail="Invalid mode")
+    if speculative and mode != "sync":
+        raise HTTPException(status_code=400, detail="speculative requires mode=sync")
+    
     try:
         session = db.query(DBSession).filter(DBSession.id == session_id).first()
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        service = ProcessingService(db)
+        service = ProcessingService(db, llm)
+        if mode == "async":
+            # Fail fast on unknown prompt versions instead of inside the worker
+            try:
+                get_prompt("extractor", extractor_version)
+                get_prompt("planner", planner_version)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            
+            new_message = service.create_message(session_id, message.text)
+            job = enqueue_message_job(
+                db, session_id, new_message.id, extractor_version, planner_version
+            )
+            job_id = job.id
+            message_id = new_message.id
+            db.commit()
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "job_id": job_id,
+                    "message_id": message_id,
+                    "status": "queued",
+                    "status_url": f"/api/jobs/{job_id}"
+                }
+            )
+        
         result = await service.process_message(
-            session_id, message.text, extractor_version, planner_version
+            session_id, message.text, extractor_version, planner_version, speculative
         )
         return result
     except HTTPException:
         raise
+    except LLMCallFailed as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"LLM provider unavailable, message {e.message_id} was stored but not processed: {e}"
+        )
     except Exception as e:
         # Логировать ошибку для отладки
-        import traceback
         error_details = traceback.format_exc()
         print(f"Error processing message: {e}")
         print(error_details)
@@ -98,3 +203,134 @@ async def create_message(
             status_code=500,
             detail=f"Error processing message: {str(e)}"
         )
+
+
+@router.post("/{session_id}/messages/stream")
+async def stream_message(
+    session_id: int,
+    message: MessageCreate,
+    extractor_version: str = Query("v3"),
+    planner_version: str = Query("v1"),
+    speculative: bool = Query(False),
+    db: Session = Depends(get_db),
+    llm: LLMProvider = Depends(get_llm_provider)
+):
+    """Process a message, streaming progress as NDJSON (one JSON object per line).
+
+    Events: message (stored message id), memory (each memory as soon as it is
+    extracted and saved), extractor, done (same fields as the sync response)
+    or error (with the HTTP status the sync endpoint would have returned).
+    """
+    session = db.query(DBSession).filter(DBSession.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    try:
+        get_prompt("extractor", extractor_version)
+        get_prompt("planner", planner_version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    new_message = ProcessingService(db, llm).create_message(session_id, message.text)
+    message_id = new_message.id
+    db.commit()
+    
+    def line(event: dict) -> str:
+        return json.dumps(event, ensure_ascii=False, default=str) + "\n"
+    
+    async def events():
+        # The request's session may be closed before the body is streamed: use our own
+        stream_db = SessionLocal()
+        try:
+            yield line({"type": "message", "message_id": message_id})
+            service = ProcessingService(stream_db, llm)
+            async for event in service.stream_pipeline(
+                message_id, extractor_version, planner_version, speculative
+            ):
+                yield line(event)
+        except LLMCallFailed as e:
+            yield line({
+                "type": "error",
+                "status": 503,
+                "detail": f"LLM provider unavailable, message {e.message_id} was stored but not processed: {e}"
+            })
+        except Exception as e:
+            stream_db.rollback()
+            print(f"Error streaming message: {e}")
+            print(traceback.format_exc())
+            yield line({"type": "error", "status": 500, "detail": f"Error processing message: {str(e)}"})
+        finally:
+            stream_db.close()
+    
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/{session_id}/import")
+async def import_messages(
+    session_id: int,
+    request: Request,
+    format: str = Query("text"),
+    extractor_version: str = Query("v3"),
+    planner_version: str = Query("v1"),
+    db: Session = Depends(get_db)
+):
+    """Bulk import a transcript / diary: the raw request body, streamed.
+
+    format=text (blank-line separated), markdown (split on headings and ---)
+    or ndjson ({"text", "role", "created_at"} per line). Messages are stored
+    in batches while the body arrives, each user message gets a processing
+    job; returns 202 with the import id, progress at /api/imports/{id}.
+    """
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format, allowed: {', '.join(IMPORT_FORMATS)}")
+    session = db.query(DBSession).filter(DBSession.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    try:
+        get_prompt("extractor", extractor_version)
+        get_prompt("planner", planner_version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    record = Import(
+        session_id=session_id,
+        format=format,
+        status="uploading",
+        bytes_received=0,
+        messages_total=0,
+        jobs_total=0
+    )
+    db.add(record)
+    db.commit()
+    importer = MessageImporter(db, record, extractor_version, planner_version)
+    try:
+        async for chunk in request.stream():
+            importer.feed(chunk)
+        importer.finish()
+    except (ImportFormatError, ImportTooLarge, ClientDisconnect) as e:
+        error = str(e) or "Upload interrupted"
+        importer.fail(error)
+        status_code = 413 if isinstance(e, ImportTooLarge) else 400
+        raise HTTPException(
+            status_code=status_code,
+            detail=f"Import {importer.import_id} failed after {importer.messages} messages: {error}"
+        )
+    except Exception as e:
+        print(f"Error importing messages: {e}")
+        print(traceback.format_exc())
+        importer.fail(str(e))
+        raise HTTPException(status_code=500, detail=f"Error importing messages: {str(e)}")
+
+    return JSONResponse(
+        status_code=202,
+        content={
+            "import_id": importer.import_id,
+            "messages": importer.messages,
+            "jobs": importer.jobs,
+            "status": "processing",
+            "status_url": f"/api/imports/{importer.import_id}"
+        }
+    )
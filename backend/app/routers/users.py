@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from datetime import datetime
 from app.database import get_db
 from app.models import User
-from app.schemas import SessionResponse
+from app.schemas import SessionResponse, Page
+from app.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 router = APIRouter()
 
@@ -23,11 +24,17 @@ class UserResponse(BaseModel):
         from_attributes = True
 
 
-@router.get("/", response_model=list[UserResponse])
-async def list_users(db: Session = Depends(get_db)):
-    """List all users"""
-    users = db.query(User).order_by(User.created_at).all()
-    return users
+@router.get("/", response_model=Page[UserResponse])
+async def list_users(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = Query(None),
+    db: Session = Depends(get_db)
+):
+    """List users, oldest first"""
+    users, next_cursor = paginate(
+        db.query(User), User.created_at, User.id, limit, cursor, descending=False
+    )
+    return {"items": users, "next_cursor": next_cursor}
 
 
 @router.get("/{user_id}", response_model=UserResponse)
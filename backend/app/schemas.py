@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Literal
+from typing import Dict, Generic, List, Optional, Literal, TypeVar
 from datetime import datetime
 
 
@@ -50,6 +50,15 @@ class PlannerOutput(BaseModel):
 
 
 # API Request/Response Schemas
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    """One page of a keyset-paginated list; pass next_cursor as ?cursor= for the next page"""
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+
 class MessageCreate(BaseModel):
     text: str
 
@@ -137,12 +146,44 @@ class PromptRunResponse(BaseModel):
     token_in: Optional[int]
     token_out: Optional[int]
     latency_ms: Optional[int]
+    cache_hits: Optional[int]
+    cache_misses: Optional[int]
+    system_prompt_hash: Optional[str] = None
+    output_text_hash: Optional[str] = None
+    context_tokens: Optional[Dict[str, int]] = None
+    call_meta: Optional[dict] = None
     created_at: datetime
 
     class Config:
         from_attributes = True
 
 
+class PromptRunSummary(BaseModel):
+    """List projection of a prompt run: scalar columns only.
+
+    Payload fields are present only when requested via ?fields=.
+    """
+    id: int
+    session_id: int
+    message_id: Optional[int]
+    prompt_name: str
+    prompt_version: str
+    model: str
+    parse_ok: bool
+    error_text: Optional[str]
+    token_in: Optional[int]
+    token_out: Optional[int]
+    latency_ms: Optional[int]
+    cache_hits: Optional[int]
+    cache_misses: Optional[int]
+    context_tokens: Optional[Dict[str, int]] = None
+    call_meta: Optional[dict] = None
+    created_at: datetime
+    input_json: Optional[dict] = None
+    output_text: Optional[str] = None
+    output_json: Optional[dict] = None
+
+
 class SessionResponse(BaseModel):
     id: int
     user_id: int
@@ -150,3 +191,41 @@ class SessionResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class ProcessingJobResponse(BaseModel):
+    id: int
+    kind: str
+    session_id: int
+    message_id: int
+    status: str
+    stage: Optional[str]
+    extractor_version: Optional[str]
+    planner_version: str
+    import_id: Optional[int] = None
+    attempts: int
+    result_json: Optional[dict]
+    error_text: Optional[str]
+    created_at: datetime
+    finished_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
+
+
+class ImportResponse(BaseModel):
+    id: int
+    session_id: int
+    format: str
+    # "uploading" | "processing" | "done" | "failed"; done once every job finished
+    status: str
+    bytes_received: int
+    messages_total: int
+    jobs_total: int
+    jobs_queued: int
+    jobs_running: int
+    jobs_done: int
+    jobs_failed: int
+    error_text: Optional[str]
+    created_at: datetime
+    uploaded_at: Optional[datetime]
@@ -1,33 +1,63 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from typing import List, Dict, Any
+from sqlalchemy import desc, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+import asyncio
 import json
+import time
+from datetime import datetime, timedelta, timezone
 from app.models import (
     User, Session as DBSession, Message, Memory, Person, Chapter,
-    MemoryPerson, MemoryChapter, QuestionQueue, PromptRun
+    MemoryPerson, MemoryChapter, QuestionQueue, PromptRun, ProcessingJob
 )
-from app.schemas import ExtractorOutput, PlannerOutput, ExtractorMemory, ExtractorPerson
-from app.llm_provider import get_llm_provider
+from app.schemas import ExtractorOutput, PlannerOutput, ExtractorMemory
+from app.llm_provider import LLMProvider, LLMResult, get_llm_provider
+from app.llm_cache import get_llm_cache
+from app.blob_store import put_blob, put_large_text
+from app.entity_resolver import EntityResolver
+from app.context_packer import (
+    Section, pack_sections, estimate_tokens, truncate_to_tokens, get_token_budget,
+    mentioned, recency_scores, CONTEXT_CANDIDATE_LIMIT,
+    RECENCY_WEIGHT, IMPORTANCE_WEIGHT, MENTION_WEIGHT
+)
+from app.names import normalize_name
 from app.prompts import get_prompt
+from app.model_policy import ModelDecision, get_model_policy
+from app.json_stream import StreamingArrayParser
+from app.structured_output import parse_output, validate_item
+from app.chunking import MESSAGE_MAX_CHUNKS, merge_outputs, split_text
+from app.events import publish
 import os
 
+# Share of the token budget the incoming message (or one chunk of it) may take
+MESSAGE_MAX_SHARE = 0.5
+HISTORY_ITEM_MAX_TOKENS = int(os.getenv("HISTORY_ITEM_MAX_TOKENS", "300"))
+PLANNER_NARRATIVE_MAX_TOKENS = int(os.getenv("PLANNER_NARRATIVE_MAX_TOKENS", "80"))
+# Messages of a session within this window share one planner run
+PLANNER_DEBOUNCE_SECONDS = float(os.getenv("PLANNER_DEBOUNCE_SECONDS", "10"))
+# Tokens of the new message shown to a speculative planner as a pending memory
+SPECULATIVE_MESSAGE_MAX_TOKENS = int(os.getenv("SPECULATIVE_MESSAGE_MAX_TOKENS", "200"))
+
+
+class LLMCallFailed(Exception):
+    """The provider call failed after retries; the message (or planner job) stays unprocessed"""
+
+    def __init__(self, message_id: int, run_id: int, error: str):
+        super().__init__(error)
+        self.message_id = message_id
+        self.run_id = run_id
+
 
 class ProcessingService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, llm: Optional[LLMProvider] = None):
         self.db = db
-        self.llm = get_llm_provider()
+        self.llm = llm or get_llm_provider()
+        self.cache = get_llm_cache()
+        self.policy = get_model_policy()
         self.model = os.getenv("OPENAI_MODEL", "gpt-5.2")
 
-    async def process_message(
-        self,
-        session_id: int,
-        message_text: str,
-        extractor_version: str = "v3",
-        planner_version: str = "v1"
-    ) -> Dict[str, Any]:
-        """Main pipeline: process user message through extractor and planner"""
-        
-        # 1. Create message record
+    def create_message(self, session_id: int, message_text: str) -> Message:
+        """Persist a user message (flush only, the caller commits)"""
         message = Message(
             session_id=session_id,
             role="user",
@@ -35,229 +65,875 @@ class ProcessingService:
         )
         self.db.add(message)
         self.db.flush()
+        self._publish(session_id, "message", {
+            "id": message.id,
+            "session_id": session_id,
+            "role": message.role,
+            "content_text": message.content_text
+        })
+        return message
+
+    async def process_message(
+        self,
+        session_id: int,
+        message_text: str,
+        extractor_version: str = "v3",
+        planner_version: str = "v1",
+        speculative: bool = False
+    ) -> Dict[str, Any]:
+        """Main pipeline: process user message through the extractor, schedule the planner"""
+        message = self.create_message(session_id, message_text)
+        return await self.run_pipeline(
+            message.id, extractor_version, planner_version, speculative=speculative
+        )
+
+    async def run_pipeline(
+        self,
+        message_id: int,
+        extractor_version: str = "v3",
+        planner_version: str = "v1",
+        job_id: Optional[int] = None,
+        speculative: bool = False
+    ) -> Dict[str, Any]:
+        """Run the extractor for an already persisted message.
+
+        The planner does not run here: when the message added memories or
+        chapters, a debounced planner job is scheduled for the session
+        (see _schedule_planner) and runs off the request path. With
+        speculative=True the planner runs concurrently with the extractor
+        instead and its questions are kept if the extraction confirms them
+        (see _settle_speculation).
+
+        The pipeline is split into short DB phases around the LLM awaits:
+        the session is committed before every LLM call, so no pooled
+        connection or open transaction is held while the model is thinking.
+        When job_id is given, the job's stage is updated inside those phases.
+
+        Long messages are split into chunks, extracted concurrently and
+        merged (see _extract and app.chunking).
+        """
         
-        # 2. Get context for extractor
-        session = self.db.query(DBSession).filter(DBSession.id == session_id).first()
-        if not session:
-            raise ValueError(f"Session {session_id} not found")
-        context = self._build_extractor_context(session.user_id, session_id)
+        # 1. Short transaction: build extractor context
+        message = self.db.query(Message).filter(Message.id == message_id).first()
+        if not message:
+            raise ValueError(f"Message {message_id} not found")
+        session_id = message.session_id
+        message_text = message.content_text
+        user_id = message.session.user_id
         
-        # 3. Run extractor
-        extractor_result = await self._run_extractor(
-            message_text, context, message.id, extractor_version
+        contexts, context_tokens = self._build_extractor_context(
+            user_id, session_id, message_id, message_text
         )
+        decision = self.policy.choose(self.db, "extractor", extractor_version, context_tokens)
+        speculation = self._start_speculation(user_id, message_text, planner_version) if speculative else None
+        self._enter_stage(session_id, message_id, "extracting", job_id)
+        self.db.commit()  # Release the connection before waiting on the LLM
+        
+        # 2-3. Run extractor (no connection held), the speculative planner alongside;
+        # short transaction: store runs, apply extractor results
+        try:
+            extractor_result, applied = await self._extract(
+                user_id, session_id, message_id, contexts, context_tokens,
+                extractor_version, decision, speculation
+            )
+        except BaseException:
+            if speculation:
+                speculation["task"].cancel()
+            raise
+        
+        # 4. Planner: debounced job in the same transaction as the new memories, or
+        # speculative answer awaited after they are committed
+        planner = await self._finish_planner(session_id, message_id, planner_version, applied, speculation)
+        self._enter_stage(session_id, message_id, "done", job_id)
+        self.db.commit()
         
-        # 4. Apply extractor results
-        applied = self._apply_extractor_results(
-            session.user_id, session_id, message.id, extractor_result
+        return self._pipeline_result(message_id, extractor_result, applied, planner)
+
+    @staticmethod
+    def _pipeline_result(
+        message_id: int,
+        extractor_result: Dict[str, Any],
+        applied: Dict[str, Any],
+        planner: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        result = {
+            "message_id": message_id,
+            "extractor_run_id": extractor_result["run_id"],
+            **planner,
+            "memories_created": applied["memories"],
+            "persons_created": applied["persons"],
+            "chapters_created": applied["chapters"]
+        }
+        if "run_ids" in extractor_result:
+            result["extractor_run_ids"] = extractor_result["run_ids"]
+            result["duplicates_merged"] = extractor_result["duplicates"]
+        return result
+
+    async def _finish_planner(
+        self,
+        session_id: int,
+        message_id: int,
+        planner_version: str,
+        applied: Dict[str, Any],
+        speculation: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Settle the speculative planner or schedule the debounced one (caller commits).
+
+        Settling commits the extractor results before waiting on the planner.
+        """
+        if speculation:
+            return await self._settle_speculation(speculation, session_id, message_id, applied)
+        return self._planner_outcome(self._schedule_planner(
+            session_id, message_id, planner_version, applied["memories"] + applied["chapters"]
+        ))
+
+    async def _extract(
+        self,
+        user_id: int,
+        session_id: int,
+        message_id: int,
+        contexts: List[Dict[str, Any]],
+        context_tokens: Dict[str, int],
+        version: str,
+        decision: ModelDecision,
+        speculation: Optional[Dict[str, Any]]
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Extract the message (one call per chunk, concurrently), store the runs, apply the result.
+
+        Returns (extractor result, applied counts). Chunk answers are merged
+        before the apply step, so memories repeated in the chunk overlap are
+        stored once and persons are resolved once.
+        """
+        # Every chunk call waits in the provider's rate limiter, not here
+        calls = list(await asyncio.gather(*(
+            self._call_extractor(context, version, decision) for context in contexts
+        )))
+        results = [
+            self._record_extractor_run(context, message_id, version, call, context_tokens)
+            for context, call in zip(contexts, calls)
+        ]
+        escalations = [self._escalation(decision, call, result) for call, result in zip(calls, results)]
+        retry = [index for index, escalation in enumerate(escalations) if escalation]
+        if retry:
+            # Small model answer failed validation: keep its run, ask the large model
+            self.db.commit()
+            retried = await asyncio.gather(*(
+                self._call_extractor(contexts[index], version, escalations[index]) for index in retry
+            ))
+            for index, call in zip(retry, retried):
+                calls[index] = call
+                results[index] = self._record_extractor_run(
+                    contexts[index], message_id, version, call, context_tokens
+                )
+        
+        failed = next((index for index, call in enumerate(calls) if call["meta"].get("error_type")), None)
+        if failed is not None:
+            # Provider failure (not a bad answer): keep the failed run, don't pretend
+            # the message had nothing in it. Async jobs are retried by the worker,
+            # chunks that were answered come from the LLM cache then.
+            self._publish(session_id, "stage", {"message_id": message_id, "stage": "failed"})
+            self.db.commit()
+            if speculation:
+                await self._settle_speculation(speculation, session_id, message_id, None)
+                self.db.commit()
+            raise LLMCallFailed(message_id, results[failed]["run_id"], calls[failed]["result"].error)
+        
+        extractor_result = self._merge_extractor_results(results)
+        applied = self._apply_extractor_results(user_id, session_id, message_id, extractor_result)
+        return extractor_result, applied
+
+    @staticmethod
+    def _merge_extractor_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """One extractor result from the results of a message's chunks"""
+        if len(results) == 1:
+            return results[0]
+        merged, duplicates = merge_outputs([result["parsed"] for result in results if result["parse_ok"]])
+        return {
+            "run_id": results[0]["run_id"],
+            "run_ids": [result["run_id"] for result in results],
+            "parsed": merged,
+            "parse_ok": any(result["parse_ok"] for result in results),
+            "duplicates": duplicates
+        }
+
+    async def stream_pipeline(
+        self,
+        message_id: int,
+        extractor_version: str = "v3",
+        planner_version: str = "v1",
+        speculative: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Run the pipeline with a streamed extractor call, yielding progress events.
+
+        Every memory is stored, linked and committed as soon as its JSON object
+        is complete in the stream, then yielded as {"type": "memory", ...};
+        {"type": "extractor", ...} follows once the answer is complete and
+        {"type": "done", ...} (the run_pipeline result) once the planner is
+        scheduled or, with speculative=True, its concurrent answer is settled.
+
+        Long messages are extracted in concurrent chunks like in run_pipeline,
+        without streaming; their memories are yielded once the merge is applied.
+        """
+        message = self.db.query(Message).filter(Message.id == message_id).first()
+        if not message:
+            raise ValueError(f"Message {message_id} not found")
+        session_id = message.session_id
+        user_id = message.session.user_id
+        
+        contexts, context_tokens = self._build_extractor_context(
+            user_id, session_id, message_id, message.content_text
+        )
+        decision = self.policy.choose(self.db, "extractor", extractor_version, context_tokens)
+        resolver = EntityResolver(self.db, user_id)
+        speculation = (
+            self._start_speculation(user_id, message.content_text, planner_version) if speculative else None
         )
+        self._enter_stage(session_id, message_id, "extracting")
+        self.db.commit()
         
-        # 5. Run planner
-        planner_result = await self._run_planner(
-            session.user_id, session_id, context, planner_version
+        try:
+            if len(contexts) > 1:
+                events = self._chunked_extraction(
+                    user_id, session_id, message_id, extractor_version, planner_version,
+                    contexts, context_tokens, decision, speculation
+                )
+            else:
+                events = self._stream_extraction(
+                    user_id, session_id, message_id, extractor_version, planner_version,
+                    contexts[0], context_tokens, decision, resolver, speculation
+                )
+            async for event in events:
+                yield event
+        finally:
+            if speculation:
+                # Client gone or extraction failed before the planner answer was used
+                speculation["task"].cancel()
+
+    async def _chunked_extraction(
+        self,
+        user_id: int,
+        session_id: int,
+        message_id: int,
+        extractor_version: str,
+        planner_version: str,
+        contexts: List[Dict[str, Any]],
+        context_tokens: Dict[str, int],
+        decision: ModelDecision,
+        speculation: Optional[Dict[str, Any]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """stream_pipeline events for a message extracted in chunks"""
+        extractor_result, applied = await self._extract(
+            user_id, session_id, message_id, contexts, context_tokens,
+            extractor_version, decision, speculation
         )
+        self.db.commit()
+        for payload in applied["memory_payloads"]:
+            yield {"type": "memory", "memory": payload}
+        yield {
+            "type": "extractor",
+            "run_id": extractor_result["run_id"],
+            "parse_ok": extractor_result["parse_ok"],
+            "memories_created": applied["memories"]
+        }
         
-        # 6. Apply planner results
-        self._apply_planner_results(session.user_id, session_id, planner_result)
+        planner = await self._finish_planner(session_id, message_id, planner_version, applied, speculation)
+        self._enter_stage(session_id, message_id, "done")
+        self.db.commit()
+        yield {"type": "done", **self._pipeline_result(message_id, extractor_result, applied, planner)}
+
+    async def _stream_extraction(
+        self,
+        user_id: int,
+        session_id: int,
+        message_id: int,
+        extractor_version: str,
+        planner_version: str,
+        context: Dict[str, Any],
+        context_tokens: Dict[str, int],
+        decision: ModelDecision,
+        resolver: EntityResolver,
+        speculation: Optional[Dict[str, Any]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """stream_pipeline events for a message extracted in one streamed call"""
+        memories_created = 0
+        while True:
+            call: Dict[str, Any] = {}
+            async for mem_data in self._stream_extractor(context, extractor_version, decision, call):
+                # Short transaction per memory, no connection held between chunks
+                known_persons = len(resolver.created_persons)
+                known_chapters = len(resolver.created_chapters)
+                resolver.prefetch([mem_data])
+                memory, persons, chapters = self._add_memory(
+                    user_id, session_id, message_id, mem_data, resolver
+                )
+                self.db.flush()
+                event = {"type": "memory", "memory": self._memory_payload(memory, persons, chapters)}
+                self._publish_entities(
+                    session_id, [event["memory"]],
+                    resolver.created_persons[known_persons:], resolver.created_chapters[known_chapters:]
+                )
+                self.db.commit()
+                memories_created += 1
+                yield event
+            
+            extractor_result = self._record_extractor_run(
+                context, message_id, extractor_version, call, context_tokens
+            )
+            # Escalate only while nothing was stored, stored memories can't be taken back
+            escalation = None if memories_created else self._escalation(decision, call, extractor_result)
+            if not escalation:
+                break
+            self.db.commit()
+            decision = escalation
         
+        if call["meta"].get("error_type") and not memories_created:
+            self._publish(session_id, "stage", {"message_id": message_id, "stage": "failed"})
+            self.db.commit()
+            if speculation:
+                await self._settle_speculation(speculation, session_id, message_id, None)
+                self.db.commit()
+            raise LLMCallFailed(message_id, extractor_result["run_id"], call["result"].error)
+        
+        persons_created = len(resolver.created_persons)
+        chapters_created = len(resolver.created_chapters)
+        yield {
+            "type": "extractor",
+            "run_id": extractor_result["run_id"],
+            "parse_ok": extractor_result["parse_ok"],
+            "memories_created": memories_created
+        }
+        
+        applied = {"memories": memories_created, "persons": persons_created, "chapters": chapters_created}
+        planner = await self._finish_planner(session_id, message_id, planner_version, applied, speculation)
+        self._enter_stage(session_id, message_id, "done")
         self.db.commit()
+        yield {
+            "type": "done",
+            "message_id": message_id,
+            "extractor_run_id": extractor_result["run_id"],
+            **planner,
+            "memories_created": memories_created,
+            "persons_created": persons_created,
+            "chapters_created": chapters_created
+        }
+
+    async def _stream_extractor(
+        self,
+        context: Dict[str, Any],
+        version: str,
+        decision: ModelDecision,
+        call: Dict[str, Any]
+    ) -> AsyncIterator[ExtractorMemory]:
+        """Stream the extractor answer and yield each valid memory as soon as it is complete.
+
+        Does not touch the database. When the stream ends, call is filled like
+        the result of _call_extractor. Cached answers are replayed memory by memory.
+        """
+        prompt_text = get_prompt("extractor", version)
+        model = decision.model
+        meta: Dict[str, Any] = {"policy": decision.to_meta(), "streamed": True}
+        start_time = time.time()
         
+        result = self.cache.lookup("extractor", version, model, context)
+        if result is not None:
+            for mem_data in result.output.memories:
+                yield mem_data
+            result.latency_ms = int((time.time() - start_time) * 1000)
+            if result.model:
+                meta["model"] = result.model
+            cache_hit: Optional[bool] = True
+        else:
+            parser = StreamingArrayParser("memories")
+            streamed: List[ExtractorMemory] = []
+            skipped = 0
+            item_repairs: List[str] = []
+            async for chunk in self.llm.stream_extractor(prompt_text, context, model, meta=meta):
+                for item in parser.feed(chunk):
+                    # Same local repairs as parse_output, per memory
+                    mem_data = validate_item(ExtractorMemory, item, item_repairs, "memories[]")
+                    if mem_data is None:
+                        skipped += 1
+                        continue
+                    streamed.append(mem_data)
+                    yield mem_data
+            if skipped or parser.errors:
+                meta["invalid_memories"] = skipped + parser.errors
+            token_in = meta.pop("token_in", 0)
+            token_out = meta.pop("token_out", 0)
+            latency_ms = meta.pop("latency_ms", int((time.time() - start_time) * 1000))
+            error = meta.pop("error", None)
+            if meta.get("error_type"):
+                result = LLMResult(
+                    parser.text or error, None, error, token_in, token_out, latency_ms, meta.get("model")
+                )
+            else:
+                # The streamed memories are validated already, only the rest of the answer is
+                output, error, repairs = parse_output(
+                    "extractor", parser.text, streamed if not (skipped or parser.errors) else None
+                )
+                if repairs:
+                    meta["repairs"] = repairs
+                result = LLMResult(parser.text, output, error, token_in, token_out, latency_ms, meta.get("model"))
+            self.cache.store("extractor", version, model, context, result)
+            cache_hit = False if self.cache.enabled else None
+        
+        call.update({
+            "model": model,
+            "prompt_text": prompt_text,
+            "result": result,
+            "cache_hit": cache_hit,
+            "meta": meta
+        })
+
+    @staticmethod
+    def _planner_outcome(
+        planner_job_id: Optional[int],
+        planner_run_id: Optional[int] = None,
+        speculation: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Planner fields of the pipeline result"""
+        outcome = {
+            "planner_run_id": planner_run_id,
+            "planner_scheduled": planner_job_id is not None,
+            "planner_job_id": planner_job_id,
+        }
+        if speculation:
+            outcome["speculation"] = speculation
+        return outcome
+
+    def _start_speculation(self, user_id: int, message_text: str, planner_version: str) -> Dict[str, Any]:
+        """Start the planner before extraction (inside the caller's open transaction).
+
+        The planner sees the memories stored before this message plus the
+        message itself as a pending memory; the call runs as a task next to
+        the extractor and touches no database state.
+        """
+        planner_context, planner_tokens = self._build_planner_context(user_id)
+        pending = truncate_to_tokens(message_text, SPECULATIVE_MESSAGE_MAX_TOKENS)
+        planner_context["recent_memories"] = [
+            {"id": None, "summary": pending, "narrative": None, "importance": None, "pending": True}
+        ] + planner_context["recent_memories"]
+        planner_tokens["pending_message"] = estimate_tokens(pending)
+        planner_tokens["total"] = planner_tokens.get("total", 0) + planner_tokens["pending_message"]
+        decision = self.policy.choose(self.db, "planner", planner_version, planner_tokens)
         return {
-            "message_id": message.id,
-            "extractor_run_id": extractor_result["run_id"],
+            "user_id": user_id,
+            "version": planner_version,
+            "context": planner_context,
+            "tokens": planner_tokens,
+            "task": asyncio.create_task(self._call_planner(planner_context, planner_version, decision)),
+        }
+
+    @staticmethod
+    def _judge_speculation(call: Dict[str, Any], applied: Optional[Dict[str, int]]) -> Tuple[str, str]:
+        """Cheap check whether the speculative planner answer still fits: (outcome, reason).
+
+        kept: the extraction only added memories of this message, which the
+        planner saw as pending; rerun: the planner must see the new state
+        (new chapters, or its answer was unusable) and the debounced job is
+        scheduled; discarded: the message added nothing worth planning.
+        """
+        if applied is None:
+            return "discarded", "extractor failed"
+        if not applied["memories"] and not applied["chapters"]:
+            return "discarded", "no new memories"
+        if call["meta"].get("error_type") or call["result"].output is None:
+            return "rerun", "planner output unusable"
+        if applied["chapters"]:
+            return "rerun", f"{applied['chapters']} new chapter(s) not seen by the planner"
+        return "kept", f"{applied['memories']} new memory(ies) matched the pending message"
+
+    async def _settle_speculation(
+        self,
+        speculation: Dict[str, Any],
+        session_id: int,
+        message_id: int,
+        applied: Optional[Dict[str, int]]
+    ) -> Dict[str, Any]:
+        """Wait for the speculative planner, record its run and keep or replace its questions.
+
+        Called after the extractor results are applied (applied=None if
+        extraction failed). Commits them before waiting on the planner, so no
+        connection or row lock is held while it answers; the run is then
+        recorded in a new short transaction (caller commits). Every speculative
+        run is stored with call_meta["speculation"], also the wasted ones, so
+        reuse and waste rates can be reported (GET /api/prompt-runs/speculation).
+        """
+        self.db.commit()  # Release the connection before waiting on the LLM
+        call = await speculation["task"]
+        outcome, reason = self._judge_speculation(call, applied)
+        call["meta"]["speculation"] = {
+            "outcome": outcome,
+            "reason": reason,
+            # What a serial planner call would have added to the response
+            "saved_ms": call["result"].latency_ms if outcome == "kept" else 0,
+        }
+        result = self._record_planner_run(
+            session_id, speculation["context"], speculation["version"], call, speculation["tokens"]
+        )
+        if outcome == "kept":
+            self._apply_planner_results(speculation["user_id"], session_id, result)
+            return self._planner_outcome(None, result["run_id"], outcome)
+        planner_job_id = None
+        if outcome == "rerun":
+            planner_job_id = self._schedule_planner(
+                session_id, message_id, speculation["version"], applied["memories"] + applied["chapters"]
+            )
+        return self._planner_outcome(planner_job_id, None, outcome)
+
+    def _schedule_planner(
+        self,
+        session_id: int,
+        message_id: int,
+        planner_version: str,
+        new_entities: int
+    ) -> Optional[int]:
+        """Queue the session's planner job, or fold this message into the queued one.
+
+        Nothing is scheduled when the message added no memories or chapters.
+        The job runs PLANNER_DEBOUNCE_SECONDS after the first message of a
+        burst; later messages only update it (the partial unique index allows
+        one queued planner job per session). Returns the job id.
+        """
+        if not new_entities:
+            return None
+        stmt = pg_insert(ProcessingJob).values(
+            kind="planner",
+            session_id=session_id,
+            message_id=message_id,
+            status="queued",
+            stage="queued",
+            planner_version=planner_version,
+            attempts=0,
+            run_after=datetime.now(timezone.utc) + timedelta(seconds=PLANNER_DEBOUNCE_SECONDS)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ProcessingJob.session_id],
+            index_where=(ProcessingJob.kind == "planner") & (ProcessingJob.status == "queued"),
+            set_={"message_id": stmt.excluded.message_id, "planner_version": stmt.excluded.planner_version}
+        ).returning(ProcessingJob.id)
+        return self.db.execute(stmt).scalar_one()
+
+    async def run_planner(
+        self,
+        session_id: int,
+        message_id: int,
+        planner_version: str = "v1",
+        job_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Run the planner for a session (the body of a planner job)"""
+        session = self.db.query(DBSession).filter(DBSession.id == session_id).first()
+        if not session:
+            raise ValueError(f"Session {session_id} not found")
+        planner_result = await self._run_planner(
+            session.user_id, session_id, message_id, planner_version, job_id
+        )
+        return {
+            "session_id": session_id,
+            "message_id": message_id,
             "planner_run_id": planner_result["run_id"],
-            "memories_created": applied["memories"],
-            "persons_created": applied["persons"],
-            "chapters_created": applied["chapters"]
+            "questions_created": planner_result["questions_created"]
         }
 
-    def _build_extractor_context(self, user_id: int, session_id: int) -> Dict[str, Any]:
-        """Build context for extractor prompt - ограниченный размер для предотвращения превышения лимитов токенов"""
-        # Get recent messages from this session for context (ограничить до 3)
-        recent_messages = self.db.query(Message).filter(
-            Message.session_id == session_id
-        ).order_by(desc(Message.created_at)).limit(3).all()
+    async def _run_planner(
+        self,
+        user_id: int,
+        session_id: int,
+        message_id: int,
+        planner_version: str,
+        job_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Build the planner context, call the planner and apply its questions.
+
+        Starts inside the caller's open transaction (so the context sees the
+        memories just added) and commits before the LLM call. A provider
+        failure keeps the failed run and raises LLMCallFailed, so the worker
+        retries the planner job instead of finishing it without questions.
+        """
+        planner_context, planner_tokens = self._build_planner_context(user_id)
+        decision = self.policy.choose(self.db, "planner", planner_version, planner_tokens)
+        self._enter_stage(session_id, message_id, "planning", job_id)
+        self.db.commit()
         
-        # Get recent memories (ограничить до 3)
-        recent_memories = self.db.query(Memory).filter(
-            Memory.user_id == user_id
-        ).order_by(desc(Memory.created_at)).limit(3).all()
+        # Run planner (no connection held)
+        planner_call = await self._call_planner(planner_context, planner_version, decision)
         
-        # ОГРАНИЧИТЬ количество персон (последние 20)
+        # Short transaction: store run and apply planner results
+        planner_result = self._record_planner_run(
+            session_id, planner_context, planner_version, planner_call, planner_tokens
+        )
+        escalation = self._escalation(decision, planner_call, planner_result)
+        if escalation:
+            self.db.commit()
+            planner_call = await self._call_planner(planner_context, planner_version, escalation)
+            planner_result = self._record_planner_run(
+                session_id, planner_context, planner_version, planner_call, planner_tokens
+            )
+        if planner_call["meta"].get("error_type"):
+            # Provider failure: keep the failed run, the job stays in "planning" and is retried
+            self.db.commit()
+            raise LLMCallFailed(message_id, planner_result["run_id"], planner_call["result"].error)
+        planner_result["questions_created"] = self._apply_planner_results(user_id, session_id, planner_result)
+        self._enter_stage(session_id, message_id, "done", job_id)
+        self.db.commit()
+        return planner_result
+
+    def _escalation(
+        self,
+        decision: ModelDecision,
+        call: Dict[str, Any],
+        result: Dict[str, Any]
+    ) -> Optional[ModelDecision]:
+        """Large-model decision if the small model answered but the answer is invalid"""
+        if result["parse_ok"] or call["meta"].get("error_type"):
+            return None
+        return self.policy.escalate(decision, result["run_id"])
+
+    def _publish(self, session_id: int, event_type: str, data: Dict[str, Any]):
+        """Announce a change on the session's live feed, sent when the transaction commits"""
+        publish(self.db, session_id, event_type, data)
+
+    def _enter_stage(self, session_id: int, message_id: int, stage: str, job_id: Optional[int] = None):
+        self._set_job_stage(job_id, stage)
+        self._publish(session_id, "stage", {"message_id": message_id, "stage": stage, "job_id": job_id})
+
+    @staticmethod
+    def _memory_payload(memory: Memory, persons: List[Person], chapters: List[Chapter]) -> Dict[str, Any]:
+        return {
+            "id": memory.id,
+            "session_id": memory.session_id,
+            "source_message_id": memory.source_message_id,
+            "summary": memory.summary,
+            "narrative": memory.narrative,
+            "time_text": memory.time_text,
+            "location_text": memory.location_text,
+            "topics": memory.topics,
+            "importance_score": memory.importance_score,
+            "persons": [p.display_name for p in persons],
+            "chapters": [c.title for c in chapters]
+        }
+
+    def _publish_entities(
+        self,
+        session_id: int,
+        memories: List[Dict[str, Any]],
+        persons: List[Person],
+        chapters: List[Chapter]
+    ):
+        """Publish new memories and the persons / chapters created for them (after flush)"""
+        for memory in memories:
+            self._publish(session_id, "memory", memory)
+        for person in persons:
+            self._publish(session_id, "person", {"id": person.id, "display_name": person.display_name, "type": person.type})
+        for chapter in chapters:
+            self._publish(session_id, "chapter", {"id": chapter.id, "title": chapter.title, "status": chapter.status})
+
+    def _publish_run(self, run: PromptRun):
+        """Prompt run summary (the fields of PromptRunSummary) for the live feed"""
+        self._publish(run.session_id, "prompt_run", {
+            "id": run.id,
+            "session_id": run.session_id,
+            "message_id": run.message_id,
+            "prompt_name": run.prompt_name,
+            "prompt_version": run.prompt_version,
+            "model": run.model,
+            "parse_ok": run.parse_ok,
+            "error_text": run.error_text,
+            "token_in": run.token_in,
+            "token_out": run.token_out,
+            "latency_ms": run.latency_ms,
+            "cache_hits": run.cache_hits,
+            "cache_misses": run.cache_misses,
+            "context_tokens": run.context_tokens,
+            "call_meta": run.call_meta
+        })
+
+    def _set_job_stage(self, job_id: Optional[int], stage: str):
+        """Update processing job stage within the current transaction"""
+        if job_id is None:
+            return
+        self.db.query(ProcessingJob).filter(
+            ProcessingJob.id == job_id
+        ).update({"stage": stage}, synchronize_session=False)
+
+    def _build_extractor_context(
+        self,
+        user_id: int,
+        session_id: int,
+        message_id: int,
+        message_text: str
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """Build the extractor context within the model's token budget.
+
+        A message over its share of the budget is split into chunks
+        (app.chunking); the other sections are packed once, for the longest
+        chunk, and shared by every chunk's context.
+
+        Returns (one context per chunk, tokens used per section).
+        """
+        budget = get_token_budget(self.model)
+        chunks = split_text(message_text, int(budget * MESSAGE_MAX_SHARE))
+        chunks_dropped = max(len(chunks) - MESSAGE_MAX_CHUNKS, 0)
+        chunks = chunks[:MESSAGE_MAX_CHUNKS]
+        message_tokens = max(estimate_tokens(chunk) for chunk in chunks)
+        message_words = normalize_name(message_text).split()
+
+        # Previous messages of the session; the current one is message_text.
+        # Earlier ids only: imported messages are processed while later ones already exist
+        history = self.db.query(Message).filter(
+            Message.session_id == session_id,
+            Message.id < message_id
+        ).order_by(desc(Message.created_at), desc(Message.id)).limit(CONTEXT_CANDIDATE_LIMIT).all()
+
+        memories = self.db.query(Memory).filter(
+            Memory.user_id == user_id
+        ).order_by(desc(Memory.created_at), desc(Memory.id)).limit(CONTEXT_CANDIDATE_LIMIT).all()
+
         persons = self.db.query(Person).filter(
             Person.user_id == user_id
-        ).order_by(desc(Person.id)).limit(20).all()
-        
-        # ОГРАНИЧИТЬ количество глав (последние 15)
+        ).order_by(desc(Person.id)).limit(CONTEXT_CANDIDATE_LIMIT).all()
+
         chapters = self.db.query(Chapter).filter(
             Chapter.user_id == user_id
-        ).order_by(desc(Chapter.id)).limit(15).all()
-        
-        return {
+        ).order_by(desc(Chapter.id)).limit(CONTEXT_CANDIDATE_LIMIT).all()
+
+        # Persons named in the message first, then the most recently created
+        mentioned_ids = {p.id for p in persons if mentioned(message_words, p.display_name)}
+        persons.sort(key=lambda p: p.id not in mentioned_ids)
+
+        # Memories: recency + importance + linked to a person named in the message
+        linked_ids = set()
+        if mentioned_ids and memories:
+            linked_ids = {
+                row.memory_id for row in self.db.query(MemoryPerson.memory_id).filter(
+                    MemoryPerson.memory_id.in_([m.id for m in memories]),
+                    MemoryPerson.person_id.in_(mentioned_ids)
+                )
+            }
+        scores = {
+            m.id: RECENCY_WEIGHT * recency + IMPORTANCE_WEIGHT * (m.importance_score or 0)
+            + MENTION_WEIGHT * (m.id in linked_ids)
+            for m, recency in zip(memories, recency_scores(len(memories)))
+        }
+        memories.sort(key=lambda m: scores[m.id], reverse=True)
+
+        packed, used = pack_sections([
+            Section("known_persons", [
+                {"id": p.id, "name": p.display_name, "type": p.type} for p in persons
+            ], share=0.3),
+            Section("message_history", [
+                {"role": m.role, "text": truncate_to_tokens(m.content_text, HISTORY_ITEM_MAX_TOKENS)}
+                for m in history
+            ], share=0.3),
+            Section("recent_memories", [
+                {"summary": m.summary} for m in memories  # summary достаточно, narrative засоряет контекст
+            ], share=0.25),
+            Section("known_chapters", [
+                {"id": c.id, "title": c.title, "status": c.status} for c in chapters
+            ], share=0.15),
+        ], budget - message_tokens)
+
+        context = {
             "session_id": session_id,
-            "message_text": "",  # Will be filled in
-            "message_history": [
-                {"role": m.role, "text": m.content_text[:500]}  # Ограничить длину сообщений до 500 символов
-                for m in reversed(recent_messages[:-1])  # All except the last (current) message
-            ],
-            "known_persons": [
-                {"id": p.id, "name": p.display_name, "type": p.type}
-                for p in persons
-            ],
-            "known_chapters": [
-                {"id": c.id, "title": c.title, "status": c.status}
-                for c in chapters
-            ],
-            "recent_memories": [
-                {"summary": m.summary}  # Убрали narrative - он засоряет контекст, summary достаточно
-                for m in recent_memories[:3]  # Уменьшить до 3
-            ]
+            "message_text": chunks[0],
+            "message_history": list(reversed(packed["message_history"])),  # chronological order
+            "known_persons": packed["known_persons"],
+            "known_chapters": packed["known_chapters"],
+            "recent_memories": packed["recent_memories"]
         }
+        usage = self._context_usage(budget, message_text=message_tokens, **used)
+        if len(chunks) == 1:
+            return [context], usage
+        usage["chunks"] = len(chunks)
+        if chunks_dropped:
+            usage["chunks_dropped"] = chunks_dropped
+        contexts = [
+            dict(context, message_text=chunk, message_part={"index": index + 1, "of": len(chunks)})
+            for index, chunk in enumerate(chunks)
+        ]
+        return contexts, usage
+
+    @staticmethod
+    def _context_usage(budget: int, **sections: int) -> Dict[str, int]:
+        """Tokens per context section, stored in PromptRun.context_tokens"""
+        usage = dict(sections)
+        usage["total"] = sum(sections.values())
+        usage["budget"] = budget
+        return usage
 
-    async def _run_extractor(
+    async def _call_extractor(
         self,
-        message_text: str,
         context: Dict[str, Any],
-        message_id: int,
-        version: str
+        version: str,
+        decision: ModelDecision
     ) -> Dict[str, Any]:
-        """Run extractor prompt and store results"""
-        # Ограничить длину message_text до 2000 символов для предотвращения превышения лимитов
-        context["message_text"] = message_text[:2000] if len(message_text) > 2000 else message_text
+        """Call the extractor LLM with the model chosen by the policy. Does not touch the database."""
         prompt_text = get_prompt("extractor", version)
+        model = decision.model
+        meta: Dict[str, Any] = {"policy": decision.to_meta()}
         
-        output_text, parsed_json, token_in, token_out, latency_ms = \
-            await self.llm.call_extractor(prompt_text, context, self.model)
+        result, cache_hit = await self.cache.get_or_call(
+            "extractor", version, model, context,
+            lambda: self.llm.call_extractor(prompt_text, context, model, meta=meta)
+        )
+        if cache_hit and result.model:
+            # The backend model that served the cached answer, not the requested one
+            meta["model"] = result.model
         
-        # Validate parsing
-        parse_ok = False
-        error_text = None
-        try:
-            if "error" not in parsed_json:
-                ExtractorOutput(**parsed_json)
-                parse_ok = True
-        except Exception as e:
-            error_text = str(e)
+        return {
+            "model": model,
+            "prompt_text": prompt_text,
+            "result": result,
+            "cache_hit": cache_hit,
+            "meta": meta
+        }
+
+    def _record_extractor_run(
+        self,
+        context: Dict[str, Any],
+        message_id: int,
+        version: str,
+        call: Dict[str, Any],
+        context_tokens: Optional[Dict[str, int]] = None
+    ) -> Dict[str, Any]:
+        """Store the prompt run; the output was validated by the provider"""
+        result: LLMResult = call["result"]
         
-        # Store prompt run with full prompt text in input_json
-        input_data = context.copy()
-        input_data["system_prompt"] = prompt_text  # Сохранить полный system prompt
+        # System prompt and large outputs go to the blob store, the run keeps their hashes
+        output_text_hash = put_large_text(self.db, result.output_text)
         
         run = PromptRun(
             session_id=context.get("session_id"),
             message_id=message_id,
             prompt_name="extractor",
             prompt_version=version,
-            model=self.model,
-            input_json=input_data,
-            output_text=output_text,
-            output_json=parsed_json,
-            parse_ok=parse_ok,
-            error_text=error_text,
-            token_in=token_in,
-            token_out=token_out,
-            latency_ms=latency_ms
+            # With LLM_PROVIDER=router: "backend:model" that answered
+            model=call["meta"].get("model", call["model"]),
+            input_json=context,
+            system_prompt_hash=put_blob(self.db, call["prompt_text"]),
+            output_text=None if output_text_hash else result.output_text,
+            output_text_hash=output_text_hash,
+            output_json=result.output_json,
+            context_tokens=context_tokens,
+            call_meta=call["meta"] or None,
+            parse_ok=result.output is not None,
+            error_text=result.error,
+            token_in=result.token_in,
+            token_out=result.token_out,
+            latency_ms=result.latency_ms,
+            cache_hits=1 if call["cache_hit"] else 0,
+            cache_misses=1 if call["cache_hit"] is False else 0
         )
         self.db.add(run)
         self.db.flush()
+        self._publish_run(run)
         
         return {
             "run_id": run.id,
-            "parsed": parsed_json if parse_ok else None,
-            "parse_ok": parse_ok
+            "parsed": result.output,
+            "parse_ok": result.output is not None
         }
 
-    def _find_or_create_person(
-        self,
-        user_id: int,
-        person_data: ExtractorPerson,
-        message_id: int,
-        memory_id: int
-    ) -> Person:
-        """Smart person finding/creation with role and name matching"""
-        import re
-        
-        name = person_data.name.strip()
-        person_type = person_data.type
-        
-        # Get the source message for context
-        message = self.db.query(Message).filter(Message.id == message_id).first()
-        message_text = message.content_text.lower() if message else ""
-        
-        # 1. Exact match by name
-        person = self.db.query(Person).filter(
-            Person.user_id == user_id,
-            Person.display_name.ilike(name)
-        ).first()
-        
-        if person:
-            return person
-        
-        # 2. For family members: check if role and name appear together in message
-        if person_type == "family":
-            # Family role mappings
-            family_roles = {
-                "папа": ["отец", "dad", "папочка", "пап"],
-                "мама": ["мать", "mother", "мамочка", "мам"],
-                "брат": ["brother"],
-                "сестра": ["sister", "сестренка"]
-            }
-            
-            # Check if message contains both role and a name
-            # Pattern: "роль ИМЯ" or "ИМЯ, мой роль"
-            name_pattern = r'\b([А-ЯЁ][а-яё]+)\b'
-            names_in_message = re.findall(name_pattern, message_text)
-            
-            # If we have a role and a name in the message, try to link them
-            role_lower = name.lower()
-            for found_name in names_in_message:
-                # Check if this name is close to the role in text
-                role_pos = message_text.find(role_lower)
-                name_pos = message_text.find(found_name.lower())
-                
-                if role_pos != -1 and name_pos != -1 and abs(role_pos - name_pos) < 30:
-                    # Check if there's already a person with this name
-                    existing_person = self.db.query(Person).filter(
-                        Person.user_id == user_id,
-                        Person.display_name.ilike(found_name)
-                    ).first()
-                    
-                    if existing_person and existing_person.type == "family":
-                        # Use the existing person with the name
-                        return existing_person
-                    elif not existing_person:
-                        # Create new person with the name (not the role)
-                        person = Person(
-                            user_id=user_id,
-                            display_name=found_name,
-                            type=person_type,
-                            first_seen_memory_id=memory_id
-                        )
-                        self.db.add(person)
-                        self.db.flush()
-                        return person
-            
-            # 3. Check if there's a person of the same type that might be the same
-            same_type_persons = self.db.query(Person).filter(
-                Person.user_id == user_id,
-                Person.type == person_type
-            ).all()
-            
-            # If only one person of this type exists, might be the same
-            if len(same_type_persons) == 1:
-                return same_type_persons[0]
-        
-        # 4. Create new person
-        person = Person(
-            user_id=user_id,
-            display_name=name,
-            type=person_type,
-            first_seen_memory_id=memory_id
-        )
-        self.db.add(person)
-        self.db.flush()
-        return person
-
     def _apply_extractor_results(
         self,
         user_id: int,
@@ -265,225 +941,208 @@ class ProcessingService:
         message_id: int,
         result: Dict[str, Any]
     ) -> Dict[str, Any]:
-        """Apply extractor results to database"""
-        if not result["parse_ok"] or not result["parsed"]:
-            return {"memories": 0, "persons": 0, "chapters": 0}
+        """Apply extractor results to database.
+
+        Entities are resolved in memory by EntityResolver and everything
+        (memories, new persons/chapters, links) is written with one flush,
+        so the number of queries does not grow with the extraction size.
+        """
+        if result["parsed"] is None:
+            return {"memories": 0, "persons": 0, "chapters": 0, "memory_payloads": []}
         
-        extractor_output = ExtractorOutput(**result["parsed"])
+        extractor_output: ExtractorOutput = result["parsed"]
+        resolver = EntityResolver(self.db, user_id)
+        resolver.prefetch(extractor_output.memories)
         memories_created = 0
-        persons_created = 0
-        chapters_created = 0
         
+        added = []
         for mem_data in extractor_output.memories:
-            # Create memory
-            memory = Memory(
-                user_id=user_id,
-                session_id=session_id,
-                source_message_id=message_id,
-                summary=mem_data.summary,
-                narrative=mem_data.narrative,
-                time_text=mem_data.time_text,
-                location_text=mem_data.location_text,
-                topics=mem_data.topics,
-                importance_score=mem_data.importance
-            )
-            self.db.add(memory)
-            self.db.flush()
+            added.append(self._add_memory(user_id, session_id, message_id, mem_data, resolver))
             memories_created += 1
-            
-            # Отслеживать уже обработанные связи для этой памяти (чтобы избежать дубликатов в одной транзакции)
-            processed_person_links = {}  # {(memory_id, person_id): max_confidence}
-            
-            # Create/update persons with improved matching
-            for person_data in mem_data.persons:
-                # Check if person exists before creating
-                existing_person = self.db.query(Person).filter(
-                    Person.user_id == user_id,
-                    Person.display_name.ilike(person_data.name)
-                ).first()
-                
-                person = self._find_or_create_person(
-                    user_id=user_id,
-                    person_data=person_data,
-                    message_id=message_id,
-                    memory_id=memory.id
-                )
-                
-                # Check if this is a new person (wasn't in DB before)
-                if not existing_person:
-                    # Check if person was just created (has the memory_id we passed)
-                    if person.first_seen_memory_id == memory.id:
-                        persons_created += 1
-                
-                # Проверить, не обрабатывали ли мы уже эту связь в текущей транзакции
-                link_key = (memory.id, person.id)
-                if link_key in processed_person_links:
-                    # Обновить confidence, если новая выше
-                    if person_data.confidence > processed_person_links[link_key]:
-                        processed_person_links[link_key] = person_data.confidence
-                    continue
-                
-                # Проверить, не существует ли уже связь в базе данных
-                existing_link = self.db.query(MemoryPerson).filter(
-                    MemoryPerson.memory_id == memory.id,
-                    MemoryPerson.person_id == person.id
-                ).first()
-                
-                if not existing_link:
-                    # Link memory to person
-                    link = MemoryPerson(
-                        memory_id=memory.id,
-                        person_id=person.id,
-                        confidence=person_data.confidence
-                    )
-                    self.db.add(link)
-                    processed_person_links[link_key] = person_data.confidence
-                else:
-                    # Обновить confidence, если новая выше
-                    if person_data.confidence > existing_link.confidence:
-                        existing_link.confidence = person_data.confidence
-                    processed_person_links[link_key] = max(person_data.confidence, existing_link.confidence)
-            
-            # Отслеживать уже обработанные связи глав для этой памяти
-            processed_chapter_links = {}  # {(memory_id, chapter_id): max_confidence}
-            
-            # Handle chapter suggestions
-            for chapter_suggestion in mem_data.chapter_suggestions:
-                if chapter_suggestion.confidence > 0.7:
-                    chapter = self.db.query(Chapter).filter(
-                        Chapter.user_id == user_id,
-                        Chapter.title.ilike(chapter_suggestion.title)
-                    ).first()
-                    
-                    if not chapter:
-                        # Get max order_index
-                        max_order = self.db.query(Chapter).filter(
-                            Chapter.user_id == user_id
-                        ).count()
-                        chapter = Chapter(
-                            user_id=user_id,
-                            title=chapter_suggestion.title,
-                            order_index=max_order,
-                            status="draft"
-                        )
-                        self.db.add(chapter)
-                        self.db.flush()
-                        chapters_created += 1
-                    
-                    # Проверить, не обрабатывали ли мы уже эту связь в текущей транзакции
-                    chapter_link_key = (memory.id, chapter.id)
-                    if chapter_link_key in processed_chapter_links:
-                        # Обновить confidence, если новая выше
-                        if chapter_suggestion.confidence > processed_chapter_links[chapter_link_key]:
-                            processed_chapter_links[chapter_link_key] = chapter_suggestion.confidence
-                        continue
-                    
-                    # Проверить, не существует ли уже связь в базе данных
-                    existing_chapter_link = self.db.query(MemoryChapter).filter(
-                        MemoryChapter.memory_id == memory.id,
-                        MemoryChapter.chapter_id == chapter.id
-                    ).first()
-                    
-                    if not existing_chapter_link:
-                        # Link memory to chapter
-                        link = MemoryChapter(
-                            memory_id=memory.id,
-                            chapter_id=chapter.id,
-                            confidence=chapter_suggestion.confidence
-                        )
-                        self.db.add(link)
-                        processed_chapter_links[chapter_link_key] = chapter_suggestion.confidence
-                    else:
-                        # Обновить confidence, если новая выше
-                        if chapter_suggestion.confidence > existing_chapter_link.confidence:
-                            existing_chapter_link.confidence = chapter_suggestion.confidence
-                        processed_chapter_links[chapter_link_key] = max(chapter_suggestion.confidence, existing_chapter_link.confidence)
+        
+        self.db.flush()
+        payloads = [self._memory_payload(*entry) for entry in added]
+        self._publish_entities(session_id, payloads, resolver.created_persons, resolver.created_chapters)
         
         return {
             "memories": memories_created,
-            "persons": persons_created,
-            "chapters": chapters_created
+            "persons": len(resolver.created_persons),
+            "chapters": len(resolver.created_chapters),
+            "memory_payloads": payloads
         }
 
-    async def _run_planner(
+    def _add_memory(
         self,
         user_id: int,
         session_id: int,
-        context: Dict[str, Any],
-        version: str
-    ) -> Dict[str, Any]:
-        """Run planner prompt and store results - ограниченный контекст"""
-        # Build planner context (ограничить размер)
-        recent_memories = self.db.query(Memory).filter(
-            Memory.user_id == user_id
-        ).order_by(desc(Memory.created_at)).limit(10).all()  # Было 20
+        message_id: int,
+        mem_data: ExtractorMemory,
+        resolver: EntityResolver
+    ) -> Tuple[Memory, List[Person], List[Chapter]]:
+        """Add one extracted memory with its person / chapter links (no flush)"""
+        memory = Memory(
+            user_id=user_id,
+            session_id=session_id,
+            source_message_id=message_id,
+            summary=mem_data.summary,
+            narrative=mem_data.narrative,
+            time_text=mem_data.time_text,
+            location_text=mem_data.location_text,
+            topics=mem_data.topics,
+            importance_score=mem_data.importance
+        )
+        self.db.add(memory)
+        
+        # Одна связь на пару (memory, person) с максимальной confidence
+        person_links: Dict[Person, float] = {}
+        for person_data in mem_data.persons:
+            person = resolver.resolve_person(person_data, memory)
+            person_links[person] = max(person_links.get(person, 0.0), person_data.confidence)
+        
+        # Chapter suggestions with high confidence only
+        chapter_links: Dict[Chapter, float] = {}
+        for chapter_suggestion in mem_data.chapter_suggestions:
+            if chapter_suggestion.confidence > 0.7:
+                chapter = resolver.resolve_chapter(chapter_suggestion.title)
+                chapter_links[chapter] = max(
+                    chapter_links.get(chapter, 0.0), chapter_suggestion.confidence
+                )
         
+        self.db.add_all([
+            MemoryPerson(memory=memory, person=person, confidence=confidence)
+            for person, confidence in person_links.items()
+        ])
+        self.db.add_all([
+            MemoryChapter(memory=memory, chapter=chapter, confidence=confidence)
+            for chapter, confidence in chapter_links.items()
+        ])
+        return memory, list(person_links), list(chapter_links)
+
+    def _build_planner_context(self, user_id: int) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """Build the planner context within the model's token budget.
+
+        Returns (context, tokens used per section).
+        """
+        budget = get_token_budget(self.model)
+
+        memories = self.db.query(Memory).filter(
+            Memory.user_id == user_id
+        ).order_by(desc(Memory.created_at), desc(Memory.id)).limit(CONTEXT_CANDIDATE_LIMIT).all()
+        scores = {
+            m.id: RECENCY_WEIGHT * recency + IMPORTANCE_WEIGHT * (m.importance_score or 0)
+            for m, recency in zip(memories, recency_scores(len(memories)))
+        }
+        memories.sort(key=lambda m: scores[m.id], reverse=True)
+
         chapters = self.db.query(Chapter).filter(
             Chapter.user_id == user_id
-        ).order_by(desc(Chapter.id)).limit(15).all()  # Ограничить вместо .all()
-        
-        planner_context = {
-            "recent_memories": [
+        ).order_by(desc(Chapter.id)).limit(CONTEXT_CANDIDATE_LIMIT).all()
+        # Memory counts in one grouped query instead of loading c.memories per chapter
+        memory_counts = dict(
+            self.db.query(MemoryChapter.chapter_id, func.count(MemoryChapter.memory_id)).filter(
+                MemoryChapter.chapter_id.in_([c.id for c in chapters])
+            ).group_by(MemoryChapter.chapter_id).all()
+        ) if chapters else {}
+
+        packed, used = pack_sections([
+            Section("recent_memories", [
                 {
                     "id": m.id,
                     "summary": m.summary,
-                    "narrative": m.narrative[:150],  # Было 300, уменьшить до 150
+                    "narrative": truncate_to_tokens(m.narrative, PLANNER_NARRATIVE_MAX_TOKENS),
                     "importance": m.importance_score
                 }
-                for m in recent_memories[:5]  # Ограничить до 5
-            ],
-            "chapters": [
+                for m in memories
+            ], share=0.7),
+            Section("chapters", [
                 {
                     "id": c.id,
                     "title": c.title,
                     "status": c.status,
-                    "memory_count": len(c.memories)
+                    "memory_count": memory_counts.get(c.id, 0)
                 }
                 for c in chapters
-            ],
+            ], share=0.3),
+        ], budget)
+
+        context = {
+            "recent_memories": packed["recent_memories"],
+            "chapters": packed["chapters"],
             "known_gaps": []  # Could be enhanced
         }
-        
+        return context, self._context_usage(budget, **used)
+
+    async def _call_planner(
+        self,
+        planner_context: Dict[str, Any],
+        version: str,
+        decision: ModelDecision
+    ) -> Dict[str, Any]:
+        """Call the planner LLM with the model chosen by the policy. Does not touch the database."""
         prompt_text = get_prompt("planner", version)
+        model = decision.model
+        meta: Dict[str, Any] = {"policy": decision.to_meta()}
         
-        output_text, parsed_json, token_in, token_out, latency_ms = \
-            await self.llm.call_planner(prompt_text, planner_context, self.model)
+        result, cache_hit = await self.cache.get_or_call(
+            "planner", version, model, planner_context,
+            lambda: self.llm.call_planner(prompt_text, planner_context, model, meta=meta)
+        )
+        if cache_hit and result.model:
+            # The backend model that served the cached answer, not the requested one
+            meta["model"] = result.model
         
-        parse_ok = False
-        error_text = None
-        try:
-            if "error" not in parsed_json:
-                PlannerOutput(**parsed_json)
-                parse_ok = True
-        except Exception as e:
-            error_text = str(e)
+        return {
+            "model": model,
+            "prompt_text": prompt_text,
+            "result": result,
+            "cache_hit": cache_hit,
+            "meta": meta
+        }
+
+    def _record_planner_run(
+        self,
+        session_id: int,
+        planner_context: Dict[str, Any],
+        version: str,
+        call: Dict[str, Any],
+        context_tokens: Optional[Dict[str, int]] = None
+    ) -> Dict[str, Any]:
+        """Store the prompt run; the output was validated by the provider"""
+        result: LLMResult = call["result"]
         
-        # Store prompt run with full prompt text in input_json
-        input_data = planner_context.copy()
-        input_data["system_prompt"] = prompt_text  # Сохранить полный system prompt
+        # System prompt and large outputs go to the blob store, the run keeps their hashes
+        output_text_hash = put_large_text(self.db, result.output_text)
         
         run = PromptRun(
             session_id=session_id,
             message_id=None,
             prompt_name="planner",
             prompt_version=version,
-            model=self.model,
-            input_json=input_data,
-            output_text=output_text,
-            output_json=parsed_json,
-            parse_ok=parse_ok,
-            error_text=error_text,
-            token_in=token_in,
-            token_out=token_out,
-            latency_ms=latency_ms
+            # With LLM_PROVIDER=router: "backend:model" that answered
+            model=call["meta"].get("model", call["model"]),
+            input_json=planner_context,
+            system_prompt_hash=put_blob(self.db, call["prompt_text"]),
+            output_text=None if output_text_hash else result.output_text,
+            output_text_hash=output_text_hash,
+            output_json=result.output_json,
+            context_tokens=context_tokens,
+            call_meta=call["meta"] or None,
+            parse_ok=result.output is not None,
+            error_text=result.error,
+            token_in=result.token_in,
+            token_out=result.token_out,
+            latency_ms=result.latency_ms,
+            cache_hits=1 if call["cache_hit"] else 0,
+            cache_misses=1 if call["cache_hit"] is False else 0
         )
         self.db.add(run)
         self.db.flush()
+        self._publish_run(run)
         
         return {
             "run_id": run.id,
-            "parsed": parsed_json if parse_ok else None,
-            "parse_ok": parse_ok
+            "parsed": result.output,
+            "parse_ok": result.output is not None
         }
 
     def _apply_planner_results(
@@ -491,12 +1150,13 @@ class ProcessingService:
         user_id: int,
         session_id: int,
         result: Dict[str, Any]
-    ):
-        """Apply planner results to question_queue"""
-        if not result["parse_ok"] or not result["parsed"]:
-            return
+    ) -> int:
+        """Apply planner results to question_queue, return the number of questions added"""
+        if result["parsed"] is None:
+            return 0
         
-        planner_output = PlannerOutput(**result["parsed"])
+        planner_output: PlannerOutput = result["parsed"]
+        questions = []
         
         for question_data in planner_output.questions:
             question = QuestionQueue(
@@ -510,3 +1170,17 @@ class ProcessingService:
                 status="pending"
             )
             self.db.add(question)
+            questions.append(question)
+        
+        self.db.flush()
+        for question in questions:
+            self._publish(session_id, "question", {
+                "id": question.id,
+                "question_text": question.question_text,
+                "reason": question.reason,
+                "confidence": question.confidence,
+                "target_type": question.target_type,
+                "target_ref": question.target_ref,
+                "status": question.status
+            })
+        return len(questions)
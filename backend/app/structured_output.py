@@ -0,0 +1,317 @@
+"""
+Structured outputs for the extractor and planner.
+
+- strict_json_schema() turns the Pydantic output models from app.schemas into
+  a strict JSON schema (every object closed, every property required,
+  optional ones nullable) for the provider's `json_schema` response format,
+  so the model can only generate schema-conforming JSON.
+- parse_output() is the local fallback for providers / models without
+  structured outputs: it parses the answer and, if it does not validate,
+  repairs common defects (code fences, prose around the JSON, trailing
+  commas, Python literals, truncated output, numbers as strings, values out
+  of range, unknown enum values, null lists) and drops array items that are
+  still invalid, instead of throwing the whole call away.
+
+Every repair is reported, the provider stores them in call_meta["repairs"].
+A valid answer is parsed and validated in one model_validate_json pass; the
+resulting model travels through the pipeline without being validated again.
+"""
+import copy
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple, Type
+from pydantic import BaseModel, ValidationError
+from app.json_stream import StreamingArrayParser
+from app.schemas import ExtractorOutput, PlannerOutput
+
+OUTPUT_MODELS: Dict[str, Type[BaseModel]] = {
+    "extractor": ExtractorOutput,
+    "planner": PlannerOutput,
+}
+# Top-level array holding the items of each output, salvaged from truncated answers
+ITEMS_KEYS = {"extractor": "memories", "planner": "questions"}
+MAX_REPORTED_REPAIRS = 20
+
+_FENCE_PATTERN = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL)
+_BOUND_KEYWORDS = ("minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum")
+_schema_cache: Dict[str, Dict[str, Any]] = {}
+
+
+def strict_json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """JSON schema of model in the subset accepted by strict structured outputs"""
+    schema = model.model_json_schema()
+
+    def fix(node: Any):
+        if isinstance(node, list):
+            for item in node:
+                fix(item)
+            return
+        if not isinstance(node, dict):
+            return
+        node.pop("title", None)
+        node.pop("default", None)
+        # Numeric bounds are not supported in strict mode: tell the model, validate locally
+        bounds = {key: node.pop(key) for key in _BOUND_KEYWORDS if key in node}
+        if bounds:
+            low = bounds.get("minimum", bounds.get("exclusiveMinimum"))
+            high = bounds.get("maximum", bounds.get("exclusiveMaximum"))
+            node["description"] = f"number from {low} to {high}"
+        if node.get("type") == "object" and "properties" in node:
+            node["additionalProperties"] = False
+            node["required"] = list(node["properties"])
+            for value in node["properties"].values():
+                fix(value)
+        for key, value in node.items():
+            if key != "properties":
+                fix(value)
+
+    fix(schema)
+    return schema
+
+
+def json_schema_format(prompt_name: str) -> Dict[str, Any]:
+    """response_format for the prompt's output model (cached)"""
+    if prompt_name not in _schema_cache:
+        _schema_cache[prompt_name] = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": f"{prompt_name}_output",
+                "strict": True,
+                "schema": strict_json_schema(OUTPUT_MODELS[prompt_name]),
+            },
+        }
+    return _schema_cache[prompt_name]
+
+
+def repair_syntax(text: str, repairs: List[str]) -> str:
+    """Fix JSON syntax defects outside of strings; closes what a truncated answer left open"""
+    stripped = text.strip()
+    fenced = _FENCE_PATTERN.match(stripped)
+    if fenced:
+        stripped = fenced.group(1)
+        repairs.append("removed code fence")
+    starts = [index for index in (stripped.find("{"), stripped.find("[")) if index >= 0]
+    start = min(starts) if starts else 0
+    if start > 0:
+        stripped = stripped[start:]
+        repairs.append("removed text before JSON")
+
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = escape = False
+    position = 0
+    while position < len(stripped):
+        char = stripped[position]
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            position += 1
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                out.append(char)
+                if stripped[position + 1:].strip():
+                    repairs.append("removed text after JSON")
+                break
+        elif char == ",":
+            following = stripped[position + 1:].lstrip()
+            if following[:1] in ("}", "]"):
+                repairs.append("removed trailing comma")
+                position += 1
+                continue
+        else:
+            for literal, replacement in (("True", "true"), ("False", "false"), ("None", "null")):
+                if stripped.startswith(literal, position):
+                    out.append(replacement)
+                    position += len(literal)
+                    repairs.append(f"replaced {literal} with {replacement}")
+                    break
+            else:
+                out.append(char)
+                position += 1
+            continue
+        out.append(char)
+        position += 1
+
+    if in_string or stack:
+        repairs.append("closed truncated JSON")
+        if in_string:
+            out.append('"')
+        fixed = "".join(out).rstrip()
+        # A dangling key or separator can't be closed into valid JSON: cut it
+        fixed = re.sub(r'(,\s*"[^"]*"\s*:?\s*|,\s*|:\s*)$', "", fixed)
+        return fixed + "".join(reversed(stack))
+    return "".join(out)
+
+
+def _resolve(schema: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in schema:
+        return defs[schema["$ref"].split("/")[-1]]
+    return schema
+
+
+def coerce(value: Any, schema: Dict[str, Any], defs: Dict[str, Any], repairs: List[str], path: str) -> Any:
+    """Coerce value towards schema: numbers from strings, clamped bounds, enums, null lists"""
+    schema = _resolve(schema, defs)
+    if "anyOf" in schema:
+        if value is None and any(option.get("type") == "null" for option in schema["anyOf"]):
+            return None
+        options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+        if not options:
+            return value
+        schema = _resolve(options[0], defs)
+
+    schema_type = schema.get("type")
+    if schema_type == "object" and isinstance(value, dict):
+        properties = schema.get("properties", {})
+        return {
+            key: coerce(item, properties[key], defs, repairs, f"{path}.{key}" if path else key)
+            if key in properties else item
+            for key, item in value.items()
+        }
+    if schema_type == "array":
+        if value is None:
+            repairs.append(f"{path}: null -> []")
+            return []
+        if not isinstance(value, list):
+            repairs.append(f"{path}: wrapped single value in a list")
+            value = [value]
+        items = schema.get("items", {})
+        return [coerce(item, items, defs, repairs, f"{path}[{index}]") for index, item in enumerate(value)]
+    if schema_type in ("number", "integer"):
+        if isinstance(value, str):
+            try:
+                value = float(value.strip().rstrip("%")) / (100 if value.strip().endswith("%") else 1)
+                repairs.append(f"{path}: string -> number")
+            except ValueError:
+                return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            low = schema.get("minimum", schema.get("exclusiveMinimum"))
+            high = schema.get("maximum", schema.get("exclusiveMaximum"))
+            if low is not None and value < low:
+                repairs.append(f"{path}: {value} clamped to {low}")
+                value = low
+            elif high is not None and value > high:
+                repairs.append(f"{path}: {value} clamped to {high}")
+                value = high
+        return value
+    if schema_type == "string":
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            repairs.append(f"{path}: number -> string")
+            value = str(value)
+        enum = schema.get("enum")
+        if enum and isinstance(value, str) and value not in enum:
+            normalized = value.strip().lower()
+            if normalized in enum:
+                value = normalized
+            elif "other" in enum:
+                value = "other"
+            else:
+                return value
+            repairs.append(f"{path}: enum value -> {value}")
+        return value
+    return value
+
+
+def validate_item(model: Type[BaseModel], data: Any, repairs: List[str], path: str = "") -> Optional[BaseModel]:
+    """Validate data as model, coercing it once if needed; None if it stays invalid"""
+    try:
+        return model(**data)
+    except (TypeError, ValidationError):
+        pass
+    schema = model.model_json_schema()
+    item_repairs: List[str] = []
+    coerced = coerce(data, schema, schema.get("$defs", {}), item_repairs, path)
+    try:
+        item = model(**coerced)
+    except (TypeError, ValidationError):
+        return None
+    repairs.extend(item_repairs)
+    return item
+
+
+def parse_output(
+    prompt_name: str,
+    text: Optional[str],
+    items: Optional[List[BaseModel]] = None
+) -> Tuple[Optional[BaseModel], Optional[str], List[str]]:
+    """Parse and validate a model answer once, repairing it locally if needed.
+
+    Returns (output, error, repairs): the validated output model, or None and
+    the reason the answer could not be turned into a valid output. items are
+    the answer's items already validated while streaming, used as they are.
+    """
+    model = OUTPUT_MODELS[prompt_name]
+    items_key = ITEMS_KEYS[prompt_name]
+    repairs: List[str] = []
+    if not text or not text.strip():
+        return None, "Empty response", repairs
+
+    if items is not None:
+        try:
+            data = json.loads(text)
+            if isinstance(data, dict):
+                # Validated model instances are not validated again
+                return model.model_validate({**data, items_key: items}), None, repairs
+        except (ValueError, ValidationError):
+            pass
+    else:
+        # Fast path: JSON parsing and validation in one pass, no intermediate dict
+        try:
+            return model.model_validate_json(text), None, repairs
+        except ValidationError:
+            pass
+
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        try:
+            data = json.loads(repair_syntax(text, repairs))
+        except ValueError:
+            # Keep the items that were complete before the answer broke off
+            parser = StreamingArrayParser(items_key)
+            salvaged = parser.feed(text)
+            if not salvaged:
+                return None, f"Invalid JSON: {e}", repairs
+            data = {items_key: salvaged}
+            repairs.append(f"salvaged {len(salvaged)} complete {items_key} from invalid JSON")
+
+    if isinstance(data, list):
+        data = {items_key: data}
+        repairs.append(f"wrapped top-level list in {items_key}")
+    if not isinstance(data, dict):
+        return None, f"Expected a JSON object, got {type(data).__name__}", repairs
+
+    try:
+        return model.model_validate(data), None, repairs[:MAX_REPORTED_REPAIRS]
+    except ValidationError as e:
+        error = e
+
+    schema = model.model_json_schema()
+    data = coerce(copy.deepcopy(data), schema, schema.get("$defs", {}), repairs, "")
+    if isinstance(data.get(items_key), list):
+        item_model = model.model_fields[items_key].annotation.__args__[0]
+        kept = []
+        for index, item in enumerate(data[items_key]):
+            validated = validate_item(item_model, item, repairs, f"{items_key}[{index}]")
+            if validated is not None:
+                kept.append(validated)
+            else:
+                repairs.append(f"{items_key}[{index}]: dropped invalid item")
+        data[items_key] = kept
+    try:
+        output = model.model_validate(data)
+    except (TypeError, ValidationError):
+        return None, str(error), repairs[:MAX_REPORTED_REPAIRS]
+    return output, None, repairs[:MAX_REPORTED_REPAIRS]
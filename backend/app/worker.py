@@ -0,0 +1,256 @@
+"""
+Background job queue for message processing.
+
+Jobs live in the `processing_jobs` table. Workers claim them with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers (in the API
+process or standalone via `python -m app.worker`) can share one queue.
+
+Two kinds of jobs share the queue: "message" jobs run the extractor for
+one message (mode=async), "planner" jobs run the planner for a session.
+Planner jobs are scheduled by the pipeline itself, debounced per session
+(ProcessingService._schedule_planner).
+
+Message jobs created by a bulk import (app.importer) carry import_id: they
+are claimed after interactive jobs, and at most IMPORT_MAX_CONCURRENCY of
+one import run at a time so a large upload does not occupy every worker
+and the provider's whole rate limit.
+"""
+import asyncio
+import os
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql import func
+from app.database import SessionLocal
+from app.models import ProcessingJob
+from app.service import ProcessingService
+from app.events import publish
+from app.llm_provider import LLMProvider, get_llm_provider, close_llm_provider
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Running jobs not finished after this long are considered abandoned (worker crashed)
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+# Stages in which a failed or abandoned job has not applied any results yet
+RETRYABLE_STAGES = {
+    "message": ("queued", "extracting"),
+    "planner": ("queued", "planning"),
+}
+# Jobs of one bulk import running at the same time
+IMPORT_MAX_CONCURRENCY = int(os.getenv("IMPORT_MAX_CONCURRENCY", "4"))
+
+
+def enqueue_message_job(
+    db: Session,
+    session_id: int,
+    message_id: int,
+    extractor_version: str,
+    planner_version: str
+) -> ProcessingJob:
+    """Add a processing job for a message (flush only, the caller commits)"""
+    job = ProcessingJob(
+        kind="message",
+        session_id=session_id,
+        message_id=message_id,
+        status="queued",
+        stage="queued",
+        extractor_version=extractor_version,
+        planner_version=planner_version,
+        attempts=0
+    )
+    db.add(job)
+    db.flush()
+    return job
+
+
+def _retryable():
+    """Jobs in a stage that has not applied any results yet"""
+    return or_(*(
+        and_(ProcessingJob.kind == kind, ProcessingJob.stage.in_(stages))
+        for kind, stages in RETRYABLE_STAGES.items()
+    ))
+
+
+def fail_abandoned_jobs(db: Session, stale_before: datetime):
+    """Fail stale running jobs that can't be reclaimed (flush only, the caller commits).
+
+    A worker that died on a job's last attempt, or after the job's results
+    were applied, would otherwise leave it "running" forever.
+    """
+    abandoned = db.query(ProcessingJob).filter(
+        ProcessingJob.status == "running",
+        ProcessingJob.locked_at < stale_before,
+        or_(ProcessingJob.attempts >= JOB_MAX_ATTEMPTS, ~_retryable())
+    ).with_for_update(skip_locked=True).all()
+    for job in abandoned:
+        job.status = "failed"
+        job.finished_at = func.now()
+        job.error_text = (
+            f"Worker stopped responding in stage {job.stage!r} (attempt {job.attempts} of {JOB_MAX_ATTEMPTS})"
+        )
+        publish(db, job.session_id, "job", {
+            "id": job.id, "kind": job.kind, "message_id": job.message_id,
+            "status": job.status, "error_text": job.error_text
+        })
+    db.flush()
+
+
+def claim_job(db: Session) -> Optional[int]:
+    """Claim the next runnable job. Returns its id or None if the queue is empty."""
+    stale_before = datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_SECONDS)
+    fail_abandoned_jobs(db, stale_before)
+    # Best effort under concurrent claims: two workers may both see one free slot
+    running = aliased(ProcessingJob)
+    import_running = db.query(func.count(running.id)).filter(
+        running.import_id == ProcessingJob.import_id,
+        running.status == "running"
+    ).correlate(ProcessingJob).scalar_subquery()
+    job = db.query(ProcessingJob).filter(
+        or_(
+            and_(
+                ProcessingJob.status == "queued",
+                ProcessingJob.run_after <= func.now(),
+                or_(ProcessingJob.import_id.is_(None), import_running < IMPORT_MAX_CONCURRENCY)
+            ),
+            and_(
+                ProcessingJob.status == "running",
+                ProcessingJob.locked_at < stale_before,
+                _retryable(),
+                ProcessingJob.attempts < JOB_MAX_ATTEMPTS
+            )
+        )
+    ).order_by(
+        # Interactive jobs first, imported ones fill the idle workers
+        ProcessingJob.import_id.isnot(None), ProcessingJob.run_after, ProcessingJob.id
+    ).with_for_update(skip_locked=True).first()
+
+    if not job:
+        db.commit()
+        return None
+
+    job_id = job.id
+    job.status = "running"
+    job.locked_at = func.now()
+    job.attempts = job.attempts + 1
+    db.commit()
+    return job_id
+
+
+async def run_job(job_id: int, llm: Optional[LLMProvider] = None):
+    """Run the pipeline for a claimed job and record the outcome"""
+    db = SessionLocal()
+    try:
+        job = db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+        kind = job.kind
+        session_id = job.session_id
+        message_id = job.message_id
+        extractor_version = job.extractor_version
+        planner_version = job.planner_version
+
+        try:
+            service = ProcessingService(db, llm)
+            if kind == "planner":
+                result = await service.run_planner(session_id, message_id, planner_version, job_id=job_id)
+            else:
+                result = await service.run_pipeline(
+                    message_id, extractor_version, planner_version, job_id=job_id
+                )
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            print(traceback.format_exc())
+            db.rollback()
+            job = db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+            job.error_text = str(e)
+            # Retry only if results were not applied yet, otherwise
+            # a second run would duplicate memories / questions
+            if job.stage in RETRYABLE_STAGES[kind] and job.attempts < JOB_MAX_ATTEMPTS:
+                job.status = "queued"
+                job.run_after = datetime.now(timezone.utc) + timedelta(seconds=2 ** job.attempts)
+            else:
+                job.status = "failed"
+                job.finished_at = func.now()
+            publish(db, session_id, "job", {
+                "id": job_id, "kind": kind, "message_id": message_id,
+                "status": job.status, "error_text": job.error_text
+            })
+            db.commit()
+            return
+
+        db.query(ProcessingJob).filter(ProcessingJob.id == job_id).update({
+            "status": "done",
+            "stage": "done",
+            "result_json": result,
+            "error_text": None,
+            "finished_at": func.now()
+        }, synchronize_session=False)
+        publish(db, session_id, "job", {
+            "id": job_id, "kind": kind, "message_id": message_id, "status": "done", "result": result
+        })
+        db.commit()
+    finally:
+        db.close()
+
+
+class JobWorkerPool:
+    """A pool of asyncio workers polling the processing_jobs queue"""
+
+    def __init__(self, size: int = JOB_WORKERS, llm: Optional[LLMProvider] = None):
+        self.size = size
+        self.llm = llm
+        self._stop = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        for i in range(self.size):
+            self._tasks.append(asyncio.create_task(self._worker_loop(i)))
+
+    async def stop(self):
+        self._stop.set()
+        for task in self._tasks:
+            task.cancel()
+        # Cancelled jobs stay "running" and are picked up again once stale
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker_loop(self, worker_index: int):
+        while not self._stop.is_set():
+            try:
+                db = SessionLocal()
+                try:
+                    job_id = claim_job(db)
+                finally:
+                    db.close()
+
+                if job_id is not None:
+                    await run_job(job_id, self.llm)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Worker {worker_index} error: {e}")
+
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def _run_standalone():
+    pool = JobWorkerPool(max(JOB_WORKERS, 1), get_llm_provider())
+    pool.start()
+    print(f"Processing {pool.size} job worker(s), Ctrl+C to stop")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await pool.stop()
+        await close_llm_provider()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_run_standalone())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark: prompt context serialization.
+
+Compares the old `json.dumps(context, indent=2)` payload with the compact,
+ordered payload from app.prompt_serializer over a simulated session, for every
+prompt version. Reports tokens per call and the shared prefix between
+consecutive calls (system prompt + user message), which is what provider
+prompt caching can reuse.
+
+Run: python benchmark_serialization.py
+Token counts use tiktoken when installed, otherwise the local estimate
+from app.context_packer.
+"""
+import json
+from app.context_packer import estimate_tokens
+from app.prompt_serializer import serialize_context
+from app.prompts import PROMPTS
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_encoding.encode(text))
+
+    TOKENIZER = "tiktoken o200k_base"
+except ImportError:
+    count_tokens = estimate_tokens
+    TOKENIZER = "local estimate"
+
+MESSAGES = 12
+PERSON_NAMES = [
+    "Маша", "Бабушка Нина", "Дядя Коля", "Сергей Петрович", "Оля", "Anna", "Mr. Thompson",
+    "Дедушка", "Света", "Mike", "Лена из школы", "Папа", "Мама", "Игорь", "Professor Klein",
+]
+CHAPTER_TITLES = [
+    "Детство в Самаре", "Школьные годы", "College years", "Первая работа",
+    "Переезд в Москву", "Family", "Путешествия",
+]
+PERSON_TYPES = ["family", "friend", "colleague"]
+MESSAGE_TEXTS = [
+    "Летом мы с Машей ездили к бабушке Нине на дачу, там был огромный сад.",
+    "Дядя Коля учил меня рыбачить на озере, мы вставали в пять утра.",
+    "In college I met Anna, we shared a tiny apartment near the campus.",
+    "Первая работа была в типографии, Сергей Петрович был строгим, но справедливым.",
+    "Папа всегда говорил, что главное — не бояться начинать сначала.",
+    "Когда мы переехали в Москву, Оля помогла мне найти квартиру.",
+]
+
+
+def build_contexts(step: int):
+    """Extractor and planner contexts shaped like ProcessingService builds them"""
+    message_text = MESSAGE_TEXTS[step % len(MESSAGE_TEXTS)]
+    # New persons / chapters appear every few messages, memories with every message
+    persons = [
+        {"id": i + 1, "name": name, "type": PERSON_TYPES[i % len(PERSON_TYPES)]}
+        for i, name in enumerate(PERSON_NAMES[:8 + step // 4])
+    ]
+    # The packer ranks persons named in the message first
+    persons.sort(key=lambda p: p["name"].split()[0][:3].lower() not in message_text.lower())
+    chapters = [
+        {"id": i + 1, "title": title, "status": "draft"}
+        for i, title in enumerate(CHAPTER_TITLES[:3 + step // 6])
+    ]
+    memories = [
+        {"summary": f"Воспоминание {i}: {MESSAGE_TEXTS[i % len(MESSAGE_TEXTS)][:60]}"}
+        for i in range(step, max(step - 5, -1), -1)
+    ]
+    history = [
+        {"role": "user", "text": MESSAGE_TEXTS[i % len(MESSAGE_TEXTS)]}
+        for i in range(max(0, step - 3), step)
+    ]
+    extractor = {
+        "session_id": 1,
+        "message_text": message_text,
+        "message_history": history,
+        "known_persons": persons,
+        "known_chapters": chapters,
+        "recent_memories": memories,
+    }
+    planner = {
+        "recent_memories": [
+            {"id": 100 - i, "summary": m["summary"], "narrative": m["summary"] * 2, "importance": 0.7}
+            for i, m in enumerate(memories)
+        ],
+        "chapters": [dict(c, memory_count=step) for c in chapters],
+        "known_gaps": [],
+    }
+    return {"extractor": extractor, "planner": planner}
+
+
+def common_prefix(a: str, b: str) -> str:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return a[:length]
+
+
+def run_benchmark():
+    steps = [build_contexts(step) for step in range(MESSAGES)]
+
+    print(f"Tokenizer: {TOKENIZER}, {MESSAGES} simulated messages")
+    print()
+    header = f"{'prompt':<16}{'old tok/call':>14}{'new tok/call':>14}{'saved':>8}{'old prefix':>16}{'new prefix':>16}"
+    print(header)
+    print("-" * len(header))
+
+    for prompt_name, versions in PROMPTS.items():
+        if prompt_name not in ("extractor", "planner"):
+            continue
+        for version, system_prompt in versions.items():
+            totals = {"old": 0, "new": 0}
+            prefixes = {"old": 0, "new": 0}
+            previous = {"old": None, "new": None}
+            for contexts in steps:
+                context = contexts[prompt_name]
+                payloads = {
+                    "old": json.dumps(context, indent=2),
+                    "new": serialize_context(prompt_name, context),
+                }
+                for kind, payload in payloads.items():
+                    full = system_prompt + "\n" + payload
+                    totals[kind] += count_tokens(full)
+                    if previous[kind] is not None:
+                        prefixes[kind] += count_tokens(common_prefix(previous[kind], full))
+                    previous[kind] = full
+
+            calls = len(steps)
+            old_avg = totals["old"] / calls
+            new_avg = totals["new"] / calls
+            saved = (1 - new_avg / old_avg) * 100 if old_avg else 0.0
+            old_prefix = prefixes["old"] / (calls - 1)
+            new_prefix = prefixes["new"] / (calls - 1)
+            print(
+                f"{prompt_name + ' ' + version:<16}{old_avg:>14.0f}{new_avg:>14.0f}{saved:>7.1f}%"
+                f"{old_prefix:>9.0f} ({old_prefix / old_avg:>3.0%}){new_prefix:>9.0f} ({new_prefix / new_avg:>3.0%})"
+            )
+
+    print()
+    print("prefix = average tokens (share of the call) identical to the previous call, i.e. cacheable by the provider")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Benchmark: structured outputs and local repair.
+
+Generates extractor and planner answers shaped like real model output and
+injects the defects JSON mode lets through (code fences, prose around the
+JSON, trailing commas, Python literals, truncation at max_completion_tokens,
+numbers as strings, out-of-range confidences, unknown enum values, null
+lists). Compares the old parsing (json.loads + Pydantic validation, any
+error throws the call away) with app.structured_output.parse_output.
+
+Reports the parse failure rate, the output tokens wasted on failed calls
+(which the caller pays again on escalation / retry), the memories and
+questions kept, and the most frequent repairs. Also prints the size of the
+strict JSON schemas sent with `response_format=json_schema`, where the
+provider guarantees schema-conforming output and none of this is needed.
+
+Run: python benchmark_structured_output.py
+"""
+import json
+import random
+from collections import Counter
+from app.context_packer import estimate_tokens
+from app.schemas import ExtractorOutput, PlannerOutput
+from app.structured_output import ITEMS_KEYS, json_schema_format, parse_output
+
+CALLS = 400
+# Share of answers that get one defect; JSON mode on small models sees a few percent
+DEFECT_RATE = 0.15
+OUTPUT_MODELS = {"extractor": ExtractorOutput, "planner": PlannerOutput}
+
+SUMMARIES = [
+    "Лето на даче у бабушки Нины", "Рыбалка с дядей Колей на озере",
+    "Shared apartment with Anna near the campus", "Первая работа в типографии",
+    "Переезд в Москву", "Папины советы",
+]
+PERSONS = [("Бабушка Нина", "family"), ("Дядя Коля", "family"), ("Anna", "friend"), ("Сергей Петрович", "colleague")]
+QUESTIONS = [
+    "Каким был сад у бабушки Нины?", "What did you and Anna cook together?",
+    "Чему вас научил Сергей Петрович?", "Почему вы решили переехать в Москву?",
+]
+
+
+def extractor_answer(rng: random.Random) -> dict:
+    memories = []
+    for _ in range(rng.randint(1, 4)):
+        name, person_type = rng.choice(PERSONS)
+        summary = rng.choice(SUMMARIES)
+        memories.append({
+            "summary": summary,
+            "narrative": f"{summary}. " * rng.randint(2, 5),
+            "time_text": rng.choice([None, "в детстве", "in 1998", "летом"]),
+            "location_text": rng.choice([None, "Самара", "Москва"]),
+            "topics": rng.sample(["семья", "детство", "работа", "travel", "friends"], 2),
+            "importance": round(rng.uniform(0.2, 0.95), 2),
+            "persons": [{"name": name, "type": person_type, "confidence": round(rng.uniform(0.6, 1.0), 2)}],
+            "chapter_suggestions": [{"title": "Детство", "confidence": 0.8}],
+        })
+    return {"memories": memories, "unknowns": [], "notes": None}
+
+
+def planner_answer(rng: random.Random) -> dict:
+    return {"questions": [
+        {
+            "question_text": question,
+            "reason": "gap in chapter",
+            "confidence": round(rng.uniform(0.5, 0.9), 2),
+            "target": {"type": rng.choice(["person", "chapter", "memory", "global"]), "ref": None},
+        }
+        for question in rng.sample(QUESTIONS, rng.randint(1, 3))
+    ]}
+
+
+def _first_item(data: dict, prompt_name: str) -> dict:
+    return data[ITEMS_KEYS[prompt_name]][0]
+
+
+# Each defect takes (answer dict, rng) and returns the raw text
+def fence(data, prompt_name, rng):
+    return "```json\n" + json.dumps(data, ensure_ascii=False, indent=2) + "\n```"
+
+
+def prose(data, prompt_name, rng):
+    return "Here is the JSON:\n" + json.dumps(data, ensure_ascii=False) + "\nLet me know if you need more."
+
+
+def trailing_comma(data, prompt_name, rng):
+    return json.dumps(data, ensure_ascii=False, indent=2).replace("\n  ]", ",\n  ]", 1)
+
+
+def python_literals(data, prompt_name, rng):
+    return json.dumps(data, ensure_ascii=False).replace("null", "None")
+
+
+def truncated(data, prompt_name, rng):
+    text = json.dumps(data, ensure_ascii=False)
+    return text[:int(len(text) * rng.uniform(0.55, 0.95))]
+
+
+def string_number(data, prompt_name, rng):
+    item = _first_item(data, prompt_name)
+    key = "importance" if prompt_name == "extractor" else "confidence"
+    item[key] = rng.choice([str(item[key]), f"{int(item[key] * 100)}%"])
+    return json.dumps(data, ensure_ascii=False)
+
+
+def out_of_range(data, prompt_name, rng):
+    item = _first_item(data, prompt_name)
+    item["importance" if prompt_name == "extractor" else "confidence"] = rng.choice([1.2, 8, -0.1])
+    return json.dumps(data, ensure_ascii=False)
+
+
+def unknown_enum(data, prompt_name, rng):
+    item = _first_item(data, prompt_name)
+    if prompt_name == "extractor":
+        item["persons"][0]["type"] = rng.choice(["Family", "neighbor", "teacher"])
+    else:
+        item["target"]["type"] = rng.choice(["Person", "session"])
+    return json.dumps(data, ensure_ascii=False)
+
+
+def null_list(data, prompt_name, rng):
+    item = _first_item(data, prompt_name)
+    if prompt_name == "extractor":
+        item["persons"] = None
+    else:
+        data["questions"] = data["questions"][0]
+    return json.dumps(data, ensure_ascii=False)
+
+
+DEFECTS = [fence, prose, trailing_comma, python_literals, truncated, string_number, out_of_range, unknown_enum, null_list]
+
+
+def old_parse(prompt_name: str, text: str) -> dict:
+    """Parsing before structured outputs"""
+    try:
+        parsed_json = json.loads(text)
+        OUTPUT_MODELS[prompt_name](**parsed_json)
+    except Exception as e:
+        parsed_json = {"error": str(e)}
+    return parsed_json
+
+
+def run_benchmark():
+    rng = random.Random(42)
+    print(f"{CALLS} simulated calls per prompt, {DEFECT_RATE:.0%} with one injected defect")
+    print()
+    header = (
+        f"{'prompt':<12}{'old failed':>12}{'new failed':>12}{'old wasted tok':>16}{'new wasted tok':>16}"
+        f"{'old items':>11}{'new items':>11}"
+    )
+    print(header)
+    print("-" * len(header))
+
+    repair_counts: Counter = Counter()
+    failures_by_defect: Counter = Counter()
+    for prompt_name, build in (("extractor", extractor_answer), ("planner", planner_answer)):
+        items_key = ITEMS_KEYS[prompt_name]
+        failed = {"old": 0, "new": 0}
+        wasted = {"old": 0, "new": 0}
+        items = {"old": 0, "new": 0}
+        for _ in range(CALLS):
+            data = build(rng)
+            defect = rng.choice(DEFECTS) if rng.random() < DEFECT_RATE else None
+            text = defect(data, prompt_name, rng) if defect else json.dumps(data, ensure_ascii=False)
+            results = {"old": old_parse(prompt_name, text)}
+            output, error, repairs = parse_output(prompt_name, text)
+            results["new"] = output.model_dump() if output is not None else {"error": error}
+            for repair in repairs:
+                # "memories[0].importance: 1.2 clamped to 1.0" -> "clamped"
+                repair_counts[" ".join(w for w in repair.split(": ")[-1].split() if not w[0].isdigit())] += 1
+            for kind, parsed in results.items():
+                if "error" in parsed:
+                    failed[kind] += 1
+                    wasted[kind] += estimate_tokens(text)
+                    if kind == "new":
+                        failures_by_defect[defect.__name__ if defect else "none"] += 1
+                else:
+                    items[kind] += len(parsed.get(items_key, []))
+        print(
+            f"{prompt_name:<12}{failed['old'] / CALLS:>12.1%}{failed['new'] / CALLS:>12.1%}"
+            f"{wasted['old']:>16}{wasted['new']:>16}{items['old']:>11}{items['new']:>11}"
+        )
+
+    print()
+    print("Most frequent repairs:")
+    for repair, count in repair_counts.most_common(10):
+        print(f"  {count:>5}  {repair}")
+    if failures_by_defect:
+        print("Still failing after repair: " + ", ".join(f"{k} {v}" for k, v in failures_by_defect.items()))
+
+    print()
+    print("Strict JSON schema (response_format=json_schema, sent with every call, cached by the provider):")
+    for prompt_name in OUTPUT_MODELS:
+        schema = json.dumps(json_schema_format(prompt_name), ensure_ascii=False, separators=(",", ":"))
+        print(f"  {prompt_name:<10}{len(schema):>6} chars {estimate_tokens(schema):>6} tokens")
+
+
+if __name__ == "__main__":
+    run_benchmark()
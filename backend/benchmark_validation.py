@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark: CPU time spent parsing and validating extractor output per message.
+
+Before the typed LLMResult the extractor answer was handled as a dict:
+json.loads + ExtractorOutput(**parsed_json) in the provider, ExtractorOutput
+again in _record_extractor_run and a third time in _apply_extractor_results.
+Now parse_output() validates the raw text once with model_validate_json and
+the model is passed through; the only extra work is model_dump for
+prompt_runs.output_json (and the cache row).
+
+Reports CPU time per message for answers of growing size, so the saving on
+large extractions (long diary entries, imports) is visible.
+
+Run: python benchmark_validation.py
+"""
+import json
+import random
+import time
+from app.schemas import ExtractorOutput
+from app.structured_output import parse_output
+
+MEMORY_COUNTS = [5, 20, 50, 200]
+# Messages processed per measurement, scaled down for large answers
+MESSAGES = 2000
+
+SUMMARIES = [
+    "Лето на даче у бабушки Нины", "Рыбалка с дядей Колей на озере",
+    "Shared apartment with Anna near the campus", "Первая работа в типографии",
+    "Переезд в Москву", "Папины советы",
+]
+PERSONS = [("Бабушка Нина", "family"), ("Дядя Коля", "family"), ("Anna", "friend"), ("Сергей Петрович", "colleague")]
+
+
+def extractor_answer(rng: random.Random, memories: int) -> str:
+    items = []
+    for _ in range(memories):
+        summary = rng.choice(SUMMARIES)
+        items.append({
+            "summary": summary,
+            "narrative": f"{summary}. " * rng.randint(3, 8),
+            "time_text": rng.choice([None, "в детстве", "in 1998", "летом"]),
+            "location_text": rng.choice([None, "Самара", "Москва"]),
+            "topics": rng.sample(["семья", "детство", "работа", "travel", "friends"], 2),
+            "importance": round(rng.uniform(0.2, 0.95), 2),
+            "persons": [
+                {"name": name, "type": person_type, "confidence": round(rng.uniform(0.6, 1.0), 2)}
+                for name, person_type in rng.sample(PERSONS, rng.randint(1, 3))
+            ],
+            "chapter_suggestions": [{"title": "Детство", "confidence": 0.8}],
+        })
+    return json.dumps({"memories": items, "unknowns": [], "notes": None}, ensure_ascii=False)
+
+
+def old_path(text: str) -> int:
+    """Provider parse + validation, re-validation when recording and when applying"""
+    parsed_json = json.loads(text)
+    ExtractorOutput(**parsed_json)  # provider (parse_output)
+    ExtractorOutput(**parsed_json)  # _record_extractor_run
+    output = ExtractorOutput(**parsed_json)  # _apply_extractor_results
+    return len(output.memories)
+
+
+def new_path(text: str) -> int:
+    """One model_validate_json, model_dump for output_json"""
+    output, _, _ = parse_output("extractor", text)
+    output.model_dump(mode="json")  # LLMResult.output_json
+    return len(output.memories)
+
+
+def cpu_ms_per_message(path, text: str, messages: int) -> float:
+    start = time.process_time()
+    for _ in range(messages):
+        path(text)
+    return (time.process_time() - start) * 1000 / messages
+
+
+def run_benchmark():
+    rng = random.Random(42)
+    print("CPU time per message, extractor output parsing and validation")
+    print()
+    header = f"{'memories':>9}{'answer KB':>11}{'old ms':>10}{'new ms':>10}{'saved ms':>10}{'saved':>8}"
+    print(header)
+    print("-" * len(header))
+    for count in MEMORY_COUNTS:
+        text = extractor_answer(rng, count)
+        assert old_path(text) == new_path(text) == count
+        messages = max(MESSAGES * 5 // count, 20)
+        old = cpu_ms_per_message(old_path, text, messages)
+        new = cpu_ms_per_message(new_path, text, messages)
+        print(
+            f"{count:>9}{len(text.encode('utf-8')) / 1024:>11.1f}{old:>10.3f}{new:>10.3f}"
+            f"{old - new:>10.3f}{(old - new) / old:>8.0%}"
+        )
+
+
+if __name__ == "__main__":
+    run_benchmark()
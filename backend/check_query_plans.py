@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Query plan regression check for the read API.
+
+Runs tests/test_query_plans.py, which seeds a large synthetic dataset into
+a scratch schema, calls the read endpoints and runs EXPLAIN on every SELECT
+they issue. Exits with code 1 if any query falls back to a sequential scan
+on a large table. The test is part of the regular suite (python -m pytest).
+
+Run: python check_query_plans.py
+Uses DATABASE_URL; all data lives in the `query_plan_check` schema,
+which is dropped afterwards.
+"""
+import os
+import sys
+import pytest
+
+TEST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "test_query_plans.py")
+
+if __name__ == "__main__":
+    sys.exit(pytest.main(["-q", "-rs", TEST_FILE]))
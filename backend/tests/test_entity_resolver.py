@@ -0,0 +1,105 @@
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+import app.entity_resolver as entity_resolver
+from app.database import SessionLocal
+from app.entity_resolver import EntityResolver
+from app.models import Chapter, Person, User
+from app.schemas import ExtractorMemory
+
+
+class ExtensionQuery:
+    """Answers the pg_extension lookup of _has_trgm"""
+
+    def __init__(self, installed: bool):
+        self.installed = installed
+        self.calls = 0
+
+    def execute(self, statement):
+        self.calls += 1
+        return self
+
+    def first(self):
+        return (1,) if self.installed else None
+
+
+def memory(persons, chapters):
+    return ExtractorMemory(
+        summary="summary", narrative="narrative", importance=0.5,
+        persons=[{"name": name, "type": person_type, "confidence": 0.9} for name, person_type in persons],
+        chapter_suggestions=[{"title": title, "confidence": 0.9} for title in chapters]
+    )
+
+
+def test_missing_trgm_is_checked_again(monkeypatch):
+    monkeypatch.setattr(entity_resolver, "_trgm_available", False)
+    monkeypatch.setattr(entity_resolver, "_trgm_checked_at", None)
+    db = ExtensionQuery(installed=False)
+    assert not entity_resolver._has_trgm(db)
+    assert not entity_resolver._has_trgm(db)
+    assert db.calls == 1  # not before TRGM_RECHECK_SECONDS
+
+    # The extension was created since the last check
+    monkeypatch.setattr(entity_resolver, "TRGM_RECHECK_SECONDS", 0)
+    db.installed = True
+    assert entity_resolver._has_trgm(db)
+    assert entity_resolver._has_trgm(db)
+    assert db.calls == 2  # a found extension is not checked again
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        installed = session.execute(
+            text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm' AND installed_version IS NOT NULL")
+        ).first()
+    except OperationalError:
+        session.close()
+        pytest.skip("database not available")
+    if not installed:
+        session.close()
+        pytest.skip("pg_trgm not installed")
+    yield session
+    session.rollback()
+    session.close()
+
+
+def test_prefetch_matches_all_names_in_one_query_per_kind(db):
+    user = User(name="resolver test")
+    db.add(user)
+    db.flush()
+    db.add_all([
+        Person(user_id=user.id, display_name="Anna Smith", type="friend"),
+        Person(user_id=user.id, display_name="Anna", type="family"),
+        Chapter(user_id=user.id, title="College years", order_index=0, status="draft"),
+    ])
+    db.flush()
+    memories = [
+        memory([("Anna Smit", "friend"), ("Nobody Known", "friend")], ["College years (Ohio)"]),
+        memory([("Ann", "family"), ("Someone Else", "colleague")], ["Army service"]),
+    ]
+    resolver = EntityResolver(db, user.id)
+    entity_resolver._has_trgm(db)
+
+    queries = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+
+    event.listen(db.get_bind(), "before_cursor_execute", count)
+    try:
+        resolver.prefetch(memories)
+        assert len(queries) == 2
+        resolved = {
+            person_data.name: resolver.resolve_person(person_data, None).display_name
+            for mem_data in memories for person_data in mem_data.persons
+        }
+        chapter = resolver.resolve_chapter("College years (Ohio)")
+        assert len(queries) == 2
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", count)
+    assert resolved["Anna Smit"] == "Anna Smith"
+    assert resolved["Ann"] == "Anna"  # same type only
+    assert resolved["Nobody Known"] == "Nobody Known"
+    assert chapter.title == "College years"
@@ -0,0 +1,77 @@
+import json
+from datetime import timezone
+import pytest
+from sqlalchemy.exc import OperationalError
+from app.database import SessionLocal
+from app.importer import MessageImporter, MessageSplitter
+from app.models import Import, Message, ProcessingJob, Session as DBSession, User
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        session.connection()
+    except OperationalError:
+        session.close()
+        pytest.skip("database not available")
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def import_record(db):
+    user = User(name="import test")
+    db.add(user)
+    db.flush()
+    chat = DBSession(user_id=user.id)
+    db.add(chat)
+    db.flush()
+    record = Import(
+        session_id=chat.id, format="ndjson", status="uploading",
+        bytes_received=0, messages_total=0, jobs_total=0
+    )
+    db.add(record)
+    db.commit()
+    yield record
+    db.rollback()
+    db.query(ProcessingJob).filter(ProcessingJob.import_id == record.id).delete()
+    db.query(Import).filter(Import.id == record.id).delete()
+    db.query(Message).filter(Message.session_id == chat.id).delete()
+    db.query(DBSession).filter(DBSession.id == chat.id).delete()
+    db.query(User).filter(User.id == user.id).delete()
+    db.commit()
+
+
+def test_ids_follow_file_order_with_mixed_dates(db, import_record):
+    lines = [
+        {"text": "a"},
+        {"text": "b", "created_at": "1995-06-01T10:00:00"},
+        {"text": "c"},
+        {"text": "d", "created_at": "1996-01-01T10:00:00+03:00", "role": "assistant"},
+        {"text": "e"},
+    ]
+    importer = MessageImporter(db, import_record, "v3", "v1")
+    importer.feed("\n".join(json.dumps(line) for line in lines).encode("utf-8"))
+    importer.finish()
+
+    messages = db.query(Message).filter(
+        Message.session_id == import_record.session_id
+    ).order_by(Message.id).all()
+    assert [m.content_text for m in messages] == ["a", "b", "c", "d", "e"]
+    assert messages[1].created_at.year == 1995
+    assert messages[0].created_at.year > 2000
+
+    job_message_ids = [
+        message_id for message_id, in db.query(ProcessingJob.message_id).filter(
+            ProcessingJob.import_id == import_record.id
+        ).order_by(ProcessingJob.id)
+    ]
+    assert job_message_ids == [m.id for m in messages if m.role == "user"]
+
+
+def test_naive_created_at_is_utc():
+    splitter = MessageSplitter("ndjson")
+    record, = splitter.feed('{"text": "x", "created_at": "1995-06-01T10:00:00"}\n')
+    assert record["created_at"].tzinfo == timezone.utc
+    assert record["created_at"].hour == 10
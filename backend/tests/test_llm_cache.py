@@ -0,0 +1,48 @@
+import asyncio
+import uuid
+import pytest
+from sqlalchemy.exc import OperationalError
+from app.database import SessionLocal
+from app.llm_cache import LLMResponseCache, cache_key
+from app.llm_provider import MockLLMProvider
+from app.llm_router import Backend, RoutingLLMProvider
+from app.models import LLMCacheEntry
+
+
+@pytest.fixture
+def context():
+    db = SessionLocal()
+    try:
+        db.connection()
+    except OperationalError:
+        db.close()
+        pytest.skip("database not available")
+    context = {"session_id": 1, "message_text": f"cache test {uuid.uuid4()}"}
+    yield context
+    db.query(LLMCacheEntry).filter(
+        LLMCacheEntry.key == cache_key("extractor", "v3", "gpt-4o-mini", context)
+    ).delete()
+    db.commit()
+    db.close()
+
+
+def test_cache_hit_reports_the_backend_model_that_answered(context):
+    router = RoutingLLMProvider([Backend("local", MockLLMProvider(), model="qwen")], explore_rate=0)
+    cache = LLMResponseCache(enabled=True)
+
+    def call(meta):
+        return cache.get_or_call(
+            "extractor", "v3", "gpt-4o-mini", context,
+            lambda: router.call_extractor("prompt", context, "gpt-4o-mini", meta=meta)
+        )
+
+    result, cache_hit = asyncio.run(call({}))
+    assert cache_hit is False
+    assert result.model == "local:qwen"
+
+    # Memory hit, then a hit read back from the table by a fresh process
+    for fresh in (cache, LLMResponseCache(enabled=True)):
+        cache = fresh
+        result, cache_hit = asyncio.run(call({}))
+        assert cache_hit is True
+        assert result.model == "local:qwen"
@@ -0,0 +1,227 @@
+"""
+Query plan regression test for the read API.
+
+Seeds a large synthetic dataset into a scratch schema, calls the read
+endpoints, captures every SELECT they issue and runs EXPLAIN on it. An
+endpoint fails if any of its queries falls back to a sequential scan on a
+large table. All data lives in the `query_plan_check` schema, which is
+dropped afterwards; skipped when there is no database.
+"""
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app.database import DATABASE_URL, Base, get_db
+from app.routers import sessions, memories, persons, chapters, prompt_runs, questions, users
+
+SCHEMA = "query_plan_check"
+
+# Dataset size: many users, so per-user filters are selective
+USERS = 500
+SESSIONS_PER_USER = 4
+MESSAGES_PER_SESSION = 10
+MEMORIES_PER_USER = 100
+PERSONS_PER_USER = 20
+CHAPTERS_PER_USER = 8
+QUESTIONS_PER_USER = 40
+PROMPT_RUNS_PER_SESSION = 20
+
+SEED_SQL = f"""
+INSERT INTO users (id, name, locale, created_at)
+SELECT u, 'User ' || u, 'en', now() - (u || ' minutes')::interval
+FROM generate_series(1, {USERS}) u;
+
+INSERT INTO sessions (id, user_id, created_at)
+SELECT s, (s - 1) / {SESSIONS_PER_USER} + 1, now() - (s || ' seconds')::interval
+FROM generate_series(1, {USERS * SESSIONS_PER_USER}) s;
+
+INSERT INTO messages (id, session_id, role, content_text, created_at)
+SELECT m, (m - 1) / {MESSAGES_PER_SESSION} + 1, 'user', 'message ' || m, now() - (m || ' seconds')::interval
+FROM generate_series(1, {USERS * SESSIONS_PER_USER * MESSAGES_PER_SESSION}) m;
+
+INSERT INTO memories (id, user_id, session_id, source_message_id, summary, narrative, topics, importance_score, created_at)
+SELECT m,
+       (m - 1) / {MEMORIES_PER_USER} + 1,
+       ((m - 1) / {MEMORIES_PER_USER}) * {SESSIONS_PER_USER} + m % {SESSIONS_PER_USER} + 1,
+       ((m - 1) / {MEMORIES_PER_USER}) * {SESSIONS_PER_USER * MESSAGES_PER_SESSION} + m % {SESSIONS_PER_USER * MESSAGES_PER_SESSION} + 1,
+       'summary ' || m, 'narrative ' || m, ARRAY['topic'], random(), now() - (m || ' seconds')::interval
+FROM generate_series(1, {USERS * MEMORIES_PER_USER}) m;
+
+INSERT INTO persons (id, user_id, display_name, normalized_name, type)
+SELECT p, (p - 1) / {PERSONS_PER_USER} + 1, 'Person ' || p, 'person ' || p,
+       (ARRAY['family', 'friend', 'romance', 'colleague', 'other'])[p % 5 + 1]
+FROM generate_series(1, {USERS * PERSONS_PER_USER}) p;
+
+INSERT INTO chapters (id, user_id, title, normalized_title, order_index, status)
+SELECT c, (c - 1) / {CHAPTERS_PER_USER} + 1, 'Chapter ' || c, 'chapter ' || c, c % {CHAPTERS_PER_USER}, 'draft'
+FROM generate_series(1, {USERS * CHAPTERS_PER_USER}) c;
+
+INSERT INTO memory_person (memory_id, person_id, confidence)
+SELECT m, ((m - 1) / {MEMORIES_PER_USER}) * {PERSONS_PER_USER} + (m + k) % {PERSONS_PER_USER} + 1, 0.8
+FROM generate_series(1, {USERS * MEMORIES_PER_USER}) m, generate_series(0, 1) k;
+
+INSERT INTO memory_chapter (memory_id, chapter_id, confidence)
+SELECT m, ((m - 1) / {MEMORIES_PER_USER}) * {CHAPTERS_PER_USER} + m % {CHAPTERS_PER_USER} + 1, 0.8
+FROM generate_series(1, {USERS * MEMORIES_PER_USER}) m;
+
+INSERT INTO question_queue (id, user_id, session_id, question_text, reason, confidence, target_type, status, created_at)
+SELECT q, (q - 1) / {QUESTIONS_PER_USER} + 1,
+       ((q - 1) / {QUESTIONS_PER_USER}) * {SESSIONS_PER_USER} + q % {SESSIONS_PER_USER} + 1,
+       'question ' || q, 'reason', 0.5, 'global',
+       (ARRAY['pending', 'asked', 'dismissed'])[q % 3 + 1], now() - (q || ' seconds')::interval
+FROM generate_series(1, {USERS * QUESTIONS_PER_USER}) q;
+
+INSERT INTO prompt_runs (id, session_id, prompt_name, prompt_version, model, parse_ok, created_at)
+SELECT r, (r - 1) / {PROMPT_RUNS_PER_SESSION} + 1,
+       (ARRAY['extractor', 'planner'])[r % 2 + 1], 'v1', 'mock', r % 7 <> 0,
+       now() - (r || ' seconds')::interval
+FROM generate_series(1, {USERS * SESSIONS_PER_USER * PROMPT_RUNS_PER_SESSION}) r;
+"""
+
+# Tables big enough that a sequential scan is a regression
+LARGE_TABLES = {
+    "sessions", "messages", "memories", "persons", "chapters",
+    "memory_person", "memory_chapter", "question_queue", "prompt_runs",
+}
+
+USER_ID = USERS // 2
+SESSION_ID = USER_ID * SESSIONS_PER_USER
+PERSON_ID = USER_ID * PERSONS_PER_USER
+CHAPTER_ID = USER_ID * CHAPTERS_PER_USER
+
+# List endpoints return {"items", "next_cursor"}; the next page is checked too
+ENDPOINTS = [
+    "/api/users/",
+    f"/api/users/{USER_ID}",
+    "/api/sessions/",
+    f"/api/sessions/?user_id={USER_ID}",
+    f"/api/sessions/{SESSION_ID}",
+    f"/api/sessions/{SESSION_ID}/messages",
+    f"/api/memories/?user_id={USER_ID}",
+    f"/api/memories/?session_id={SESSION_ID}",
+    f"/api/persons/?user_id={USER_ID}",
+    f"/api/persons/{PERSON_ID}/memories",
+    f"/api/chapters/?user_id={USER_ID}",
+    f"/api/chapters/{CHAPTER_ID}/memories",
+    f"/api/chapters/{CHAPTER_ID}/coverage",
+    f"/api/questions/?user_id={USER_ID}",
+    f"/api/questions/?user_id={USER_ID}&status=pending",
+    f"/api/questions/?session_id={SESSION_ID}",
+    f"/api/prompt-runs/?session_id={SESSION_ID}",
+    f"/api/prompt-runs/?user_id={USER_ID}",
+    f"/api/prompt-runs/?session_id={SESSION_ID}&prompt_name=extractor&parse_ok=false",
+]
+
+
+def seq_scans(plan, found=None):
+    """Collect relations read with a sequential scan anywhere in the plan tree"""
+    if found is None:
+        found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        seq_scans(child, found)
+    return found
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = create_engine(DATABASE_URL)
+
+    @event.listens_for(engine, "connect")
+    def set_search_path(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"SET search_path TO {SCHEMA}")
+        cursor.close()
+        dbapi_connection.commit()
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    except OperationalError:
+        engine.dispose()
+        pytest.skip("database not available")
+
+    try:
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            for statement in SEED_SQL.split(";"):
+                if statement.strip():
+                    conn.execute(text(statement))
+            conn.execute(text("ANALYZE"))
+        yield engine
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def client(engine):
+    TestingSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = TestingSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(users.router, prefix="/api/users")
+    app.include_router(sessions.router, prefix="/api/sessions")
+    app.include_router(memories.router, prefix="/api/memories")
+    app.include_router(persons.router, prefix="/api/persons")
+    app.include_router(chapters.router, prefix="/api/chapters")
+    app.include_router(prompt_runs.router, prefix="/api/prompt-runs")
+    app.include_router(questions.router, prefix="/api/questions")
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+def get_capturing_selects(engine, client, endpoint):
+    """GET endpoint, returning the response and the SELECTs it issued"""
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        response = client.get(endpoint)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return response, captured
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_read_endpoint_uses_indexes(engine, client, endpoint):
+    response, queries = get_capturing_selects(engine, client, endpoint)
+    assert response.status_code == 200
+    body = response.json()
+    if isinstance(body, dict) and body.get("next_cursor"):
+        separator = "&" if "?" in endpoint else "?"
+        next_page = f"{endpoint}{separator}limit=10&cursor={body['next_cursor']}"
+        response, next_queries = get_capturing_selects(engine, client, next_page)
+        assert response.status_code == 200
+        queries += next_queries
+
+    regressions = []
+    with engine.connect() as conn:
+        for statement, parameters in queries:
+            cursor = conn.connection.cursor()
+            cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+            plan = cursor.fetchone()[0]
+            cursor.close()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scanned = [t for t in seq_scans(plan[0]["Plan"]) if t in LARGE_TABLES]
+            if scanned:
+                regressions.append(f"Seq Scan on {', '.join(scanned)}: {' '.join(statement.split())}")
+    assert queries
+    assert not regressions, "\n".join(regressions)
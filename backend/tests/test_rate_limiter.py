@@ -0,0 +1,78 @@
+import asyncio
+import httpx
+import openai
+import pytest
+from app.context_packer import estimate_tokens
+from app.llm_provider import OpenAIProvider
+from app.rate_limiter import ModelLimiter
+from app.resilience import ResilientCaller
+
+
+def test_failed_call_refunds_reserved_tokens():
+    limiter = ModelLimiter("m", concurrency=4, rpm=0, tpm=60000)
+    before = limiter.stats()["tokens_available"]
+
+    async def failing_call():
+        async with limiter.acquire(10000):
+            raise TimeoutError("upstream timeout")
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(failing_call())
+    assert limiter.stats()["tokens_available"] == before
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_successful_call_is_charged_actual_usage():
+    limiter = ModelLimiter("m", concurrency=4, rpm=0, tpm=60000)
+
+    async def call():
+        async with limiter.acquire(10000) as reservation:
+            reservation.actual_tokens = 30000
+
+    asyncio.run(call())
+    # Refill during the test adds at most a few tokens
+    assert 30000 <= limiter.stats()["tokens_available"] < 30100
+
+
+def test_cancelled_call_after_send_is_charged_prompt_tokens():
+    limiter = ModelLimiter("m", concurrency=4, rpm=0, tpm=60000)
+
+    async def scenario():
+        sent = asyncio.Event()
+
+        async def streaming_call():
+            async with limiter.acquire(10000, prompt_tokens=2000) as reservation:
+                reservation.sent = True
+                sent.set()
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(streaming_call())
+        await asyncio.wait_for(sent.wait(), timeout=1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert 58000 <= limiter.stats()["tokens_available"] < 58100
+
+
+@pytest.mark.parametrize("error, charged", [
+    (openai.APIConnectionError(request=httpx.Request("POST", "http://llm")), 0),
+    (openai.APITimeoutError(request=httpx.Request("POST", "http://llm")), "prompt"),
+])
+def test_provider_charges_prompt_only_if_request_reached_provider(error, charged):
+    provider = OpenAIProvider(api_key="test")
+    provider.resilience = ResilientCaller(max_retries=0, hedge=False)
+
+    async def create(**kwargs):
+        raise error
+
+    provider.client.chat.completions.create = create
+    messages = [{"role": "user", "content": "Расскажи о детстве " * 50}]
+    prompt_tokens = estimate_tokens(messages[0]["content"])
+
+    with pytest.raises(type(error)):
+        asyncio.run(provider._create("m", messages, 0.3, 1000, {}, {"type": "json_object"}))
+    available = provider.limiter.stats()["m"]["tokens_available"]
+    expected = provider.limiter.for_model("m").tpm - (prompt_tokens if charged == "prompt" else 0)
+    assert expected <= available < expected + 100
@@ -0,0 +1,62 @@
+import asyncio
+import time
+import openai
+import pytest
+from app.resilience import CircuitOpenError, ResilientCaller
+
+
+def open_circuit(caller: ResilientCaller, model: str):
+    """Put the model's breaker in the open state with its cooldown already passed"""
+    breaker = caller.for_model(model).breaker
+    breaker.state = "open"
+    breaker.opened_at = time.monotonic() - breaker.cooldown_seconds - 1
+    return breaker
+
+
+def test_cancelled_half_open_probe_allows_next_call():
+    caller = ResilientCaller(max_retries=0, hedge=False)
+    breaker = open_circuit(caller, "m")
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def slow_attempt():
+            started.set()
+            await asyncio.sleep(10)
+
+        probe = asyncio.create_task(caller.call("m", slow_attempt, []))
+        await started.wait()
+        assert breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def ok_attempt():
+            return "ok"
+
+        return await caller.call("m", ok_attempt, [])
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_half_open_rejects_concurrent_calls():
+    caller = ResilientCaller(max_retries=0, hedge=False)
+    breaker = open_circuit(caller, "m")
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_failed_probe_reopens_circuit():
+    caller = ResilientCaller(max_retries=0, hedge=False)
+    breaker = open_circuit(caller, "m")
+
+    async def failing_attempt():
+        raise openai.APIConnectionError(request=None)
+
+    with pytest.raises(openai.APIConnectionError):
+        asyncio.run(caller.call("m", failing_attempt, []))
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
@@ -0,0 +1,73 @@
+import asyncio
+import uuid
+import pytest
+from sqlalchemy.exc import OperationalError
+from app.database import SessionLocal
+from app.llm_provider import LLMResult, MockLLMProvider
+from app.models import Memory, Message, ProcessingJob, PromptRun, Session as DBSession, User
+from app.worker import run_job
+
+
+class PlannerDown(MockLLMProvider):
+    async def call_planner(self, prompt_text, context, model, meta=None):
+        meta = {} if meta is None else meta
+        meta["error_type"] = "APITimeoutError"
+        return LLMResult("OpenAI API error: timeout", None, "OpenAI API error: timeout")
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        session.connection()
+    except OperationalError:
+        session.close()
+        pytest.skip("database not available")
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def planner_job(db):
+    user = User(name="worker test")
+    db.add(user)
+    db.flush()
+    chat = DBSession(user_id=user.id)
+    db.add(chat)
+    db.flush()
+    message = Message(session_id=chat.id, role="user", content_text="worker test")
+    db.add(message)
+    db.flush()
+    # A memory only this user has, so the planner context is not answered from the LLM cache
+    db.add(Memory(
+        user_id=user.id, session_id=chat.id, source_message_id=message.id,
+        summary=f"worker test {uuid.uuid4()}", narrative="worker test"
+    ))
+    job = ProcessingJob(
+        kind="planner", session_id=chat.id, message_id=message.id, status="running",
+        stage="queued", planner_version="v1", attempts=1
+    )
+    db.add(job)
+    db.commit()
+    yield job
+    db.rollback()
+    db.query(ProcessingJob).filter(ProcessingJob.session_id == chat.id).delete()
+    db.query(PromptRun).filter(PromptRun.session_id == chat.id).delete()
+    db.query(Memory).filter(Memory.session_id == chat.id).delete()
+    db.query(Message).filter(Message.session_id == chat.id).delete()
+    db.query(DBSession).filter(DBSession.id == chat.id).delete()
+    db.query(User).filter(User.id == user.id).delete()
+    db.commit()
+
+
+def test_planner_provider_failure_requeues_the_job(db, planner_job):
+    asyncio.run(run_job(planner_job.id, PlannerDown()))
+
+    db.expire_all()
+    job = db.query(ProcessingJob).filter(ProcessingJob.id == planner_job.id).one()
+    assert job.status == "queued"
+    assert job.stage == "planning"
+    assert "timeout" in job.error_text
+    run = db.query(PromptRun).filter(PromptRun.session_id == planner_job.session_id).one()
+    assert run.prompt_name == "planner"
+    assert not run.parse_ok
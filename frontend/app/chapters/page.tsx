@@ -60,7 +60,7 @@ export default function ChaptersPage() {
         api.getChapterMemories(chapterId),
         api.getChapterCoverage(chapterId)
       ])
-      setChapterMemories(memories)
+      setChapterMemories(memories.items)
       setCoverage(cov)
     } catch (error) {
       console.error('Failed to load chapter data:', error)
@@ -16,7 +16,7 @@ export default function UserSelector() {
 
   const loadUsers = async () => {
     try {
-      const allUsers = await api.getUsers()
+      const { items: allUsers } = await api.getUsers({ limit: 200 })
       setUsers(allUsers)
       
       // If no user selected and users exist, select first one
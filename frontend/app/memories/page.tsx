@@ -8,6 +8,7 @@ export default function MemoriesPage() {
   const [loading, setLoading] = useState(true)
   const [selectedMemory, setSelectedMemory] = useState<Memory | null>(null)
   const [selectedUserId, setSelectedUserId] = useState<number | null>(null)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
 
   useEffect(() => {
     loadSelectedUser()
@@ -33,12 +34,13 @@ export default function MemoriesPage() {
     }
   }
 
-  const loadMemories = async () => {
+  const loadMemories = async (cursor?: string) => {
     if (!selectedUserId) return
     
     try {
-      const data = await api.getMemories({ user_id: selectedUserId })
-      setMemories(data)
+      const page = await api.getMemories({ user_id: selectedUserId, cursor })
+      setMemories(prev => cursor ? [...prev, ...page.items] : page.items)
+      setNextCursor(page.next_cursor)
     } catch (error) {
       console.error('Failed to load memories:', error)
     } finally {
@@ -91,6 +93,11 @@ export default function MemoriesPage() {
               ))}
             </tbody>
           </table>
+          {nextCursor && (
+            <button onClick={() => loadMemories(nextCursor)} style={{ marginTop: '10px' }}>
+              Load more
+            </button>
+          )}
         </div>
         
         {selectedMemory && (
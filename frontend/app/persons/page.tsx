@@ -56,7 +56,7 @@ export default function PersonsPage() {
   const loadPersonMemories = async (personId: number) => {
     try {
       const data = await api.getPersonMemories(personId)
-      setPersonMemories(data)
+      setPersonMemories(data.items)
     } catch (error) {
       console.error('Failed to load person memories:', error)
     }
@@ -1,13 +1,14 @@
 'use client'
 
 import { useEffect, useState } from 'react'
-import { api, PromptRun } from '@/lib/api'
+import { api, PromptRun, PromptRunSummary } from '@/lib/api'
 
 export default function PromptRunsPage() {
-  const [runs, setRuns] = useState<PromptRun[]>([])
+  const [runs, setRuns] = useState<PromptRunSummary[]>([])
   const [selectedRun, setSelectedRun] = useState<PromptRun | null>(null)
   const [loading, setLoading] = useState(true)
   const [selectedUserId, setSelectedUserId] = useState<number | null>(null)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [filters, setFilters] = useState({
     prompt_name: '',
     parse_ok: null as boolean | null,
@@ -38,17 +39,18 @@ export default function PromptRunsPage() {
     }
   }
 
-  const loadRuns = async () => {
+  const loadRuns = async (cursor?: string) => {
     if (!selectedUserId) return
     
     try {
-      const params: any = { user_id: selectedUserId }
+      const params: any = { user_id: selectedUserId, cursor }
       if (filters.prompt_name) params.prompt_name = filters.prompt_name
       if (filters.parse_ok !== null) params.parse_ok = filters.parse_ok
       if (filters.model) params.model = filters.model
       
-      const data = await api.getPromptRuns(params)
-      setRuns(data)
+      const page = await api.getPromptRuns(params)
+      setRuns(prev => cursor ? [...prev, ...page.items] : page.items)
+      setNextCursor(page.next_cursor)
     } catch (error) {
       console.error('Failed to load prompt runs:', error)
     } finally {
@@ -56,6 +58,15 @@ export default function PromptRunsPage() {
     }
   }
 
+  const loadRunDetail = async (runId: number) => {
+    try {
+      // Список отдает только summary, полный payload берем отдельно
+      setSelectedRun(await api.getPromptRun(runId))
+    } catch (error) {
+      console.error('Failed to load prompt run:', error)
+    }
+  }
+
   if (loading) return <div>Loading...</div>
 
   if (!selectedUserId) {
@@ -138,12 +149,17 @@ export default function PromptRunsPage() {
                   <td>{run.latency_ms}ms</td>
                   <td>{new Date(run.created_at).toLocaleString()}</td>
                   <td>
-                    <button onClick={() => setSelectedRun(run)}>View</button>
+                    <button onClick={() => loadRunDetail(run.id)}>View</button>
                   </td>
                 </tr>
               ))}
             </tbody>
           </table>
+          {nextCursor && (
+            <button onClick={() => loadRuns(nextCursor)} style={{ marginTop: '10px' }}>
+              Load more
+            </button>
+          )}
         </div>
         
         {selectedRun && (
@@ -181,7 +197,27 @@ export default function PromptRunsPage() {
             
             <div style={{ fontSize: '12px', color: '#666' }}>
               Tokens: {selectedRun.token_in} in / {selectedRun.token_out} out<br />
+              {selectedRun.context_tokens && (
+                <>
+                  Context: {Object.entries(selectedRun.context_tokens)
+                    .filter(([section]) => section !== 'total' && section !== 'budget')
+                    .map(([section, tokens]) => `${section} ${tokens}`)
+                    .join(', ')} ({selectedRun.context_tokens.total} / {selectedRun.context_tokens.budget} est. tokens)<br />
+                </>
+              )}
               Latency: {selectedRun.latency_ms}ms
+              {selectedRun.call_meta?.queue_wait_ms !== undefined && (
+                <> (queued {selectedRun.call_meta.queue_wait_ms}ms)</>
+              )}
+              {selectedRun.call_meta?.policy && (
+                <>
+                  <br />
+                  Model: {selectedRun.model} ({selectedRun.call_meta.policy.tier}: {selectedRun.call_meta.policy.reason})
+                  {selectedRun.call_meta.policy.escalated_from_run_id && (
+                    <> — escalated from run #{selectedRun.call_meta.policy.escalated_from_run_id}</>
+                  )}
+                </>
+              )}
             </div>
             
             <button onClick={() => setSelectedRun(null)} style={{ marginTop: '10px' }}>Close</button>
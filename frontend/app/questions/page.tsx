@@ -8,6 +8,7 @@ export default function QuestionsPage() {
   const [loading, setLoading] = useState(true)
   const [statusFilter, setStatusFilter] = useState<string>('')
   const [selectedUserId, setSelectedUserId] = useState<number | null>(null)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
 
   useEffect(() => {
     loadSelectedUser()
@@ -33,14 +34,15 @@ export default function QuestionsPage() {
     }
   }
 
-  const loadQuestions = async () => {
+  const loadQuestions = async (cursor?: string) => {
     if (!selectedUserId) return
     
     try {
-      const params: any = { user_id: selectedUserId }
+      const params: any = { user_id: selectedUserId, cursor }
       if (statusFilter) params.status = statusFilter
-      const data = await api.getQuestions(params)
-      setQuestions(data)
+      const page = await api.getQuestions(params)
+      setQuestions(prev => cursor ? [...prev, ...page.items] : page.items)
+      setNextCursor(page.next_cursor)
     } catch (error) {
       console.error('Failed to load questions:', error)
     } finally {
@@ -129,6 +131,11 @@ export default function QuestionsPage() {
           ))}
         </tbody>
       </table>
+      {nextCursor && (
+        <button onClick={() => loadQuestions(nextCursor)} style={{ marginTop: '10px' }}>
+          Load more
+        </button>
+      )}
     </div>
   )
 }
@@ -1,35 +1,84 @@
 'use client'
 
-import { useEffect, useState } from 'react'
+import { useEffect, useRef, useState } from 'react'
 import { useParams } from 'next/navigation'
-import { api, Message, PromptRun } from '@/lib/api'
+import { api, Message, PromptRunSummary, StreamedMemory } from '@/lib/api'
+
+// The NDJSON stream and the SSE feed both deliver every memory: keep the first copy
+const addMemory = (prev: StreamedMemory[], memory: StreamedMemory) =>
+  prev.some(m => m.id === memory.id) ? prev : [...prev, memory]
 
 export default function SessionDetailPage() {
   const params = useParams()
   const sessionId = parseInt(params.id as string)
   
   const [messages, setMessages] = useState<Message[]>([])
-  const [promptRuns, setPromptRuns] = useState<PromptRun[]>([])
+  const [promptRuns, setPromptRuns] = useState<PromptRunSummary[]>([])
   const [newMessage, setNewMessage] = useState('')
   const [extractorVersion, setExtractorVersion] = useState('v3')
   const [plannerVersion, setPlannerVersion] = useState('v1')
+  // Run the planner concurrently with the extractor (questions come back with the message)
+  const [speculative, setSpeculative] = useState(false)
   const [loading, setLoading] = useState(true)
   const [processing, setProcessing] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const [expandedPrompts, setExpandedPrompts] = useState<Set<number>>(new Set())
+  // Memories of the message being processed, shown as they are extracted
+  const [streamedMemories, setStreamedMemories] = useState<StreamedMemory[]>([])
+  const [stage, setStage] = useState<string | null>(null)
+  // True while the live feed is connected: new rows arrive as events, no re-fetch needed
+  const liveRef = useRef(false)
 
   useEffect(() => {
     loadData()
   }, [sessionId])
 
+  useEffect(() => {
+    const source = new EventSource(api.sessionEventsUrl(sessionId))
+    let opened = false
+    source.onopen = () => {
+      // Reconnected: events missed while disconnected are not replayed, reload once
+      if (opened && !liveRef.current) loadData()
+      opened = true
+      liveRef.current = true
+    }
+    source.onerror = () => {
+      liveRef.current = false
+    }
+    source.addEventListener('message', (e) => {
+      const message = JSON.parse((e as MessageEvent).data)
+      setMessages(prev => prev.some(m => m.id === message.id)
+        ? prev
+        : [...prev, { ...message, created_at: message.created_at ?? new Date().toISOString() }])
+    })
+    source.addEventListener('memory', (e) => {
+      const memory: StreamedMemory = JSON.parse((e as MessageEvent).data)
+      setStreamedMemories(prev => addMemory(prev, memory))
+    })
+    source.addEventListener('prompt_run', async (e) => {
+      const summary = JSON.parse((e as MessageEvent).data)
+      // The timeline shows input / output JSON: load this one run instead of the whole list
+      const run = await api.getPromptRun(summary.id)
+      setPromptRuns(prev => [...prev.filter(r => r.id !== run.id), run])
+    })
+    source.addEventListener('stage', (e) => {
+      const data = JSON.parse((e as MessageEvent).data)
+      setStage(data.stage === 'done' || data.stage === 'failed' ? null : data.stage)
+    })
+    return () => {
+      liveRef.current = false
+      source.close()
+    }
+  }, [sessionId])
+
   const loadData = async () => {
     try {
       const [msgs, runs] = await Promise.all([
         api.getSessionMessages(sessionId),
-        api.getPromptRuns({ session_id: sessionId })
+        api.getPromptRuns({ session_id: sessionId, limit: 200, fields: ['input_json', 'output_json'] })
       ])
       setMessages(msgs)
-      setPromptRuns(runs)
+      setPromptRuns(runs.items)
     } catch (error) {
       console.error('Failed to load data:', error)
     } finally {
@@ -41,10 +90,20 @@ export default function SessionDetailPage() {
     e.preventDefault()
     setProcessing(true)
     setError(null)
+    setStreamedMemories([])
     try {
-      await api.createMessage(sessionId, newMessage, extractorVersion, plannerVersion)
+      let streamError: string | null = null
+      await api.createMessageStream(sessionId, newMessage, (event) => {
+        if (event.type === 'memory') {
+          setStreamedMemories(prev => addMemory(prev, event.memory))
+        } else if (event.type === 'error') {
+          streamError = event.detail
+        }
+      }, extractorVersion, plannerVersion, speculative)
+      if (streamError) throw new Error(streamError)
       setNewMessage('')
-      await loadData()
+      setStreamedMemories([])
+      if (!liveRef.current) await loadData()
     } catch (error: any) {
       console.error('Failed to create message:', error)
       const errorMsg = error?.message || 'Failed to process message. Check backend logs.'
@@ -107,11 +166,28 @@ export default function SessionDetailPage() {
                 <option value="v2">v2</option>
               </select>
             </label>
+            <label style={{ marginLeft: '20px' }}>
+              <input type="checkbox" checked={speculative} onChange={(e) => setSpeculative(e.target.checked)} disabled={processing} />
+              Speculative planner
+            </label>
           </div>
           <button type="submit" style={{ marginTop: '10px' }} disabled={processing}>
-            {processing ? 'Processing...' : 'Process Message'}
+            {processing ? (stage ? `Processing (${stage})...` : 'Processing...') : 'Process Message'}
           </button>
         </form>
+        {processing && streamedMemories.length > 0 && (
+          <div style={{ marginTop: '10px', fontSize: '13px' }}>
+            <strong>Extracted so far:</strong>
+            <ul>
+              {streamedMemories.map(memory => (
+                <li key={memory.id}>
+                  {memory.summary}
+                  {memory.persons.length > 0 && <span style={{ color: '#666' }}> ({memory.persons.join(', ')})</span>}
+                </li>
+              ))}
+            </ul>
+          </div>
+        )}
       </div>
 
       <h2>Message Timeline</h2>
@@ -9,6 +9,7 @@ export default function SessionsPage() {
   const [loading, setLoading] = useState(true)
   const [creating, setCreating] = useState(false)
   const [selectedUserId, setSelectedUserId] = useState<number | null>(null)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
 
   useEffect(() => {
     loadSelectedUser()
@@ -35,14 +36,12 @@ export default function SessionsPage() {
     }
   }
 
-  const loadSessions = async () => {
+  const loadSessions = async (cursor?: string) => {
     try {
-      const data = await api.getSessions()
-      // Filter by selected user if available
-      const filtered = selectedUserId 
-        ? data.filter(s => s.user_id === selectedUserId)
-        : data
-      setSessions(filtered)
+      // Filter by selected user on the server
+      const page = await api.getSessions({ user_id: selectedUserId ?? undefined, cursor })
+      setSessions(prev => cursor ? [...prev, ...page.items] : page.items)
+      setNextCursor(page.next_cursor)
     } catch (error) {
       console.error('Failed to load sessions:', error)
     } finally {
@@ -129,6 +128,11 @@ export default function SessionsPage() {
           ))}
         </tbody>
       </table>
+      {nextCursor && (
+        <button onClick={() => loadSessions(nextCursor)} style={{ marginTop: '10px' }}>
+          Load more
+        </button>
+      )}
     </div>
   )
 }
@@ -55,9 +55,17 @@ export interface PromptRun {
   token_in: number | null
   token_out: number | null
   latency_ms: number | null
+  cache_hits: number | null
+  cache_misses: number | null
+  context_tokens: Record<string, number> | null
+  call_meta: Record<string, any> | null
   created_at: string
 }
 
+// List projection: payload fields are present only when requested via `fields`
+export type PromptRunSummary = Omit<PromptRun, 'input_json' | 'output_text' | 'output_json'> &
+  Partial<Pick<PromptRun, 'input_json' | 'output_text' | 'output_json'>>
+
 export interface Question {
   id: number
   user_id: number
@@ -77,6 +85,42 @@ export interface Session {
   created_at: string
 }
 
+export interface ProcessingJob {
+  id: number
+  kind: 'message' | 'planner'
+  session_id: number
+  message_id: number
+  status: string
+  stage: string | null
+  extractor_version: string | null
+  planner_version: string
+  import_id: number | null
+  attempts: number
+  result_json: any
+  error_text: string | null
+  created_at: string
+  finished_at: string | null
+}
+
+export type ImportFormat = 'text' | 'markdown' | 'ndjson'
+
+export interface ImportStatus {
+  id: number
+  session_id: number
+  format: ImportFormat
+  status: 'uploading' | 'processing' | 'done' | 'failed'
+  bytes_received: number
+  messages_total: number
+  jobs_total: number
+  jobs_queued: number
+  jobs_running: number
+  jobs_done: number
+  jobs_failed: number
+  error_text: string | null
+  created_at: string
+  uploaded_at: string | null
+}
+
 export interface User {
   id: number
   name: string
@@ -84,6 +128,82 @@ export interface User {
   created_at: string
 }
 
+export interface Page<T> {
+  items: T[]
+  next_cursor: string | null
+}
+
+export interface PageParams {
+  limit?: number
+  cursor?: string | null
+}
+
+function appendPageParams(query: URLSearchParams, params?: PageParams) {
+  if (params?.limit) query.append('limit', params.limit.toString())
+  if (params?.cursor) query.append('cursor', params.cursor)
+}
+
+export interface StreamedMemory {
+  id: number
+  summary: string
+  narrative: string
+  time_text: string | null
+  location_text: string | null
+  topics: string[]
+  importance_score: number
+  persons: string[]
+  chapters: string[]
+}
+
+export type MessageStreamEvent =
+  | { type: 'message'; message_id: number }
+  | { type: 'memory'; memory: StreamedMemory }
+  | { type: 'extractor'; run_id: number; parse_ok: boolean; memories_created: number }
+  | {
+      type: 'done'
+      message_id: number
+      extractor_run_id: number
+      // The planner runs as a debounced background job, its run arrives as a prompt_run event;
+      // with speculative=true a kept concurrent planner run is returned here
+      planner_run_id: number | null
+      planner_scheduled: boolean
+      planner_job_id: number | null
+      speculation?: 'kept' | 'rerun' | 'discarded'
+      // Long messages: one extractor run per chunk
+      extractor_run_ids?: number[]
+      duplicates_merged?: number
+      memories_created: number
+      persons_created: number
+      chapters_created: number
+    }
+  | { type: 'error'; status: number; detail: string }
+
+// POST that reads an NDJSON response line by line, calling onEvent for every object
+async function streamNDJSON<T>(endpoint: string, body: unknown, onEvent: (event: T) => void): Promise<void> {
+  const response = await fetch(`${API_URL}${endpoint}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body),
+  })
+  if (!response.ok || !response.body) {
+    throw new Error(`API error: ${response.statusText}`)
+  }
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    const lines = buffer.split('\n')
+    buffer = lines.pop() || ''
+    for (const line of lines) {
+      if (line.trim()) onEvent(JSON.parse(line))
+    }
+  }
+  if (buffer.trim()) onEvent(JSON.parse(buffer))
+}
+
 async function fetchAPI<T>(endpoint: string, options?: RequestInit): Promise<T> {
   // Create AbortController for timeout (5 minutes for long requests)
   const controller = new AbortController()
@@ -117,7 +237,11 @@ async function fetchAPI<T>(endpoint: string, options?: RequestInit): Promise<T>
 
 export const api = {
   // Users
-  getUsers: () => fetchAPI<User[]>('/api/users'),
+  getUsers: (params?: PageParams) => {
+    const query = new URLSearchParams()
+    appendPageParams(query, params)
+    return fetchAPI<Page<User>>(`/api/users?${query}`)
+  },
   getUser: (id: number) => fetchAPI<User>(`/api/users/${id}`),
   createUser: (name?: string) => {
     const body = name ? JSON.stringify({ name }) : JSON.stringify({});
@@ -132,7 +256,12 @@ export const api = {
     }),
 
   // Sessions
-  getSessions: () => fetchAPI<Session[]>('/api/sessions'),
+  getSessions: (params?: { user_id?: number } & PageParams) => {
+    const query = new URLSearchParams()
+    if (params?.user_id) query.append('user_id', params.user_id.toString())
+    appendPageParams(query, params)
+    return fetchAPI<Page<Session>>(`/api/sessions?${query}`)
+  },
   getSession: (id: number) => fetchAPI<Session>(`/api/sessions/${id}`),
   createSession: (user_id?: number) => {
     const body = user_id ? JSON.stringify({ user_id }) : JSON.stringify({});
@@ -147,20 +276,69 @@ export const api = {
       method: 'POST',
       body: JSON.stringify({ text }),
     }),
+  createMessageStream: (
+    sessionId: number,
+    text: string,
+    onEvent: (event: MessageStreamEvent) => void,
+    extractorVersion = 'v3',
+    plannerVersion = 'v1',
+    speculative = false
+  ) =>
+    streamNDJSON<MessageStreamEvent>(
+      `/api/sessions/${sessionId}/messages/stream?extractor_version=${extractorVersion}&planner_version=${plannerVersion}&speculative=${speculative}`,
+      { text },
+      onEvent
+    ),
+  // Server-Sent Events feed of a session (use with EventSource)
+  sessionEventsUrl: (sessionId: number) => `${API_URL}/api/sessions/${sessionId}/events`,
+  createMessageAsync: (sessionId: number, text: string, extractorVersion = 'v3', plannerVersion = 'v1') =>
+    fetchAPI<{ job_id: number; message_id: number; status: string; status_url: string }>(
+      `/api/sessions/${sessionId}/messages?extractor_version=${extractorVersion}&planner_version=${plannerVersion}&mode=async`,
+      {
+        method: 'POST',
+        body: JSON.stringify({ text }),
+      }
+    ),
+
+  // Bulk import of a transcript / diary file, sent as the raw body (streamed by the browser)
+  importMessages: (
+    sessionId: number,
+    file: Blob,
+    format: ImportFormat = 'text',
+    extractorVersion = 'v3',
+    plannerVersion = 'v1'
+  ) =>
+    fetchAPI<{ import_id: number; messages: number; jobs: number; status: string; status_url: string }>(
+      `/api/sessions/${sessionId}/import?format=${format}&extractor_version=${extractorVersion}&planner_version=${plannerVersion}`,
+      {
+        method: 'POST',
+        body: file,
+        headers: { 'Content-Type': format === 'ndjson' ? 'application/x-ndjson' : 'text/plain' },
+      }
+    ),
+  getImport: (id: number) => fetchAPI<ImportStatus>(`/api/imports/${id}`),
+
+  // Jobs
+  getJob: (id: number) => fetchAPI<ProcessingJob>(`/api/jobs/${id}`),
 
   // Memories
-  getMemories: (params?: { user_id?: number; session_id?: number }) => {
+  getMemories: (params?: { user_id?: number; session_id?: number } & PageParams) => {
     const query = new URLSearchParams()
     if (params?.user_id) query.append('user_id', params.user_id.toString())
     if (params?.session_id) query.append('session_id', params.session_id.toString())
-    return fetchAPI<Memory[]>(`/api/memories?${query}`)
+    appendPageParams(query, params)
+    return fetchAPI<Page<Memory>>(`/api/memories?${query}`)
   },
   getMemory: (id: number) => fetchAPI<Memory>(`/api/memories/${id}`),
 
   // Persons
   getPersons: (user_id: number) => fetchAPI<Person[]>(`/api/persons?user_id=${user_id}`),
   getPerson: (id: number) => fetchAPI<Person>(`/api/persons/${id}`),
-  getPersonMemories: (id: number) => fetchAPI<Memory[]>(`/api/persons/${id}/memories`),
+  getPersonMemories: (id: number, params?: PageParams) => {
+    const query = new URLSearchParams()
+    appendPageParams(query, params)
+    return fetchAPI<Page<Memory>>(`/api/persons/${id}/memories?${query}`)
+  },
   mergePersons: (personId: number, targetPersonId: number) =>
     fetchAPI(`/api/persons/${personId}/merge`, {
       method: 'POST',
@@ -173,28 +351,35 @@ export const api = {
   // Chapters
   getChapters: (user_id: number) => fetchAPI<Chapter[]>(`/api/chapters?user_id=${user_id}`),
   getChapter: (id: number) => fetchAPI<Chapter>(`/api/chapters/${id}`),
-  getChapterMemories: (id: number) => fetchAPI<Memory[]>(`/api/chapters/${id}/memories`),
+  getChapterMemories: (id: number, params?: PageParams) => {
+    const query = new URLSearchParams()
+    appendPageParams(query, params)
+    return fetchAPI<Page<Memory>>(`/api/chapters/${id}/memories?${query}`)
+  },
   getChapterCoverage: (id: number) => fetchAPI(`/api/chapters/${id}/coverage`),
 
   // Prompt Runs
-  getPromptRuns: (params?: { session_id?: number; user_id?: number; prompt_name?: string; parse_ok?: boolean; model?: string }) => {
+  getPromptRuns: (params?: { session_id?: number; user_id?: number; prompt_name?: string; parse_ok?: boolean; model?: string; fields?: string[] } & PageParams) => {
     const query = new URLSearchParams()
     if (params?.session_id) query.append('session_id', params.session_id.toString())
     if (params?.user_id) query.append('user_id', params.user_id.toString())
     if (params?.prompt_name) query.append('prompt_name', params.prompt_name)
     if (params?.parse_ok !== undefined) query.append('parse_ok', params.parse_ok.toString())
     if (params?.model) query.append('model', params.model)
-    return fetchAPI<PromptRun[]>(`/api/prompt-runs?${query}`)
+    if (params?.fields?.length) query.append('fields', params.fields.join(','))
+    appendPageParams(query, params)
+    return fetchAPI<Page<PromptRunSummary>>(`/api/prompt-runs?${query}`)
   },
   getPromptRun: (id: number) => fetchAPI<PromptRun>(`/api/prompt-runs/${id}`),
 
   // Questions
-  getQuestions: (params?: { user_id?: number; session_id?: number; status?: string }) => {
+  getQuestions: (params?: { user_id?: number; session_id?: number; status?: string } & PageParams) => {
     const query = new URLSearchParams()
     if (params?.user_id) query.append('user_id', params.user_id.toString())
     if (params?.session_id) query.append('session_id', params.session_id.toString())
     if (params?.status) query.append('status', params.status)
-    return fetchAPI<Question[]>(`/api/questions?${query}`)
+    appendPageParams(query, params)
+    return fetchAPI<Page<Question>>(`/api/questions?${query}`)
   },
   getQuestion: (id: number) => fetchAPI<Question>(`/api/questions/${id}`),
   updateQuestionStatus: (id: number, status: string) =>